@@ -3,6 +3,9 @@ from seguimiento_habitos import registrar_habito, consultar_habitos
 import interaccion_red as red
 from gestion_turnos import registrar_turno, evaluar_riesgo
 import db
+import sesiones
+import agenda
+import fechas
 
 def crear_usuario_console():
     print("Creación de usuario")
@@ -38,44 +41,40 @@ def crear_usuario_console():
     # Guardar usuario solo en MongoDB
     guardar_paciente(data)
 
-def iniciar_sesion():
-    dni = input("Ingrese su DNI: ")
-    password = input("Ingrese su contraseña: ")
-
-    usuario = db.find_one(db.pacientes, {"dni": dni})
+def verificar_credenciales(dni, password):
+    """Valida la contraseña sin abrir sesión; devuelve el usuario o None."""
+    usuario = db.find_usuario(dni)
     if not usuario:
         print("Usuario no encontrado")
         return None
 
     # Validar contraseña (la contraseña almacenada está hasheada)
-    if db.check_password(password, usuario.get("password")):
-        # Establecer token en Redis con TTL (1 hora)
-        if db.set_access_token(dni):
-            ttl = db.get_access_ttl(dni)
-            if ttl is not None:
-                mins, secs = divmod(ttl, 60)
-                print(f"Sesión iniciada correctamente. Tiempo de sesión: {mins}m {secs}s")
-                # Iniciar watcher en background para mostrar decremento de TTL
-                import threading, time
-
-                def _watch_ttl(dni_watch: str):
-                    while True:
-                        t = db.get_access_ttl(dni_watch)
-                        if t is None or t <= 0:
-                            print(f"\n Sesión para DNI {dni_watch} expirada.")
-                            break
-                        m, s = divmod(t, 60)
-
-                th = threading.Thread(target=_watch_ttl, args=(dni,), daemon=True)
-                th.start()
-            else:
-                print("Sesión iniciada correctamente (TTL no disponible)")
-        else:
-            print("Sesión iniciada pero no se pudo establecer token en Redis")
-        return usuario
-    else:
+    if not db.check_password(password, usuario.get("password")):
         print("Contraseña incorrecta")
         return None
+    return usuario
+
+def autenticar(dni, password):
+    """Valida la contraseña y abre la sesión de consola (token en Redis); devuelve el usuario o None."""
+    usuario = verificar_credenciales(dni, password)
+    if not usuario:
+        return None
+
+    # Establecer token en Redis con TTL (1 hora) y leer el TTL en la misma ida y vuelta
+    ttl = db.set_access_token_with_ttl(dni)
+    if ttl is not None:
+        mins, secs = divmod(ttl, 60)
+        print(f"Sesión iniciada correctamente. Tiempo de sesión: {mins}m {secs}s")
+        # Avisar cuando venza la sesión (un único hilo para todas las sesiones)
+        sesiones.programador.registrar(dni, ttl)
+    else:
+        print("Sesión iniciada pero no se pudo establecer token en Redis")
+    return usuario
+
+def iniciar_sesion():
+    dni = input("Ingrese su DNI: ")
+    password = input("Ingrese su contraseña: ")
+    return autenticar(dni, password)
 
 def consultar_usuario(dni):
     # Usar la función de gestion_pacientes que ya hace pretty-print del documento
@@ -117,7 +116,7 @@ def registrar_turno_console(usuario):
         "nombre": {"$regex": f"^{medico_nombre}$", "$options": "i"},
         "apellido": {"$regex": f"^{medico_apellido}$", "$options": "i"},
         "rol": "medico"
-    }))
+    }, {"_id": 0, "dni": 1, "nombre": 1, "apellido": 1}))
 
     if not posibles:
         print(f"No se encontró médico con nombre {medico_nombre} {medico_apellido}")
@@ -156,17 +155,24 @@ def registrar_turno_console(usuario):
     if turno_id:
         # Mensaje local (simulado) de notificación
         print(f"Turno registrado (id={turno_id}).")
-        print(f"Se envió una notificación al mail del paciente.")
+        print(f"Se enviará una notificación al mail del paciente.")
     else:
         print("No se pudo registrar el turno. Revise los datos e intente nuevamente.")
+        libres = agenda.proximos_turnos_libres(especialidad, 5, dni=paciente_dni)
+        if libres:
+            print(f"Próximos turnos libres de {especialidad}:")
+            for t in libres:
+                print(f"  {fechas.formatear(t['fecha'])} - médico DNI {t['medico_dni']}")
 
 def mostrar_red_console():
     print("\n Red médico-paciente")
     try:
-            if db.driver:
+            if db.get_grafo():
                 dni = input("Ingrese su DNI de médico para ver su red: ").strip()
-                with db.driver.session() as session:
-                    session.read_transaction(red.mostrar_red, dni)
+                prefijo = input("Filtrar por nombre o apellido (Enter para todos): ").strip() or None
+                pagina = red.mostrar_red(dni, prefijo=prefijo)
+                while len(pagina) == red.TAMANIO_PAGINA and input("Ver más? (s/n): ").strip().lower() == "s":
+                    pagina = red.mostrar_red(dni, pagina[-1]["dni"], prefijo=prefijo)
             else:
                 print("Neo4j no disponible: no se puede mostrar la red")
     except Exception as e:
@@ -182,22 +188,27 @@ def seguir_paciente_console(usuario):
         print("DNI de paciente inválido (debe contener dígitos)")
         return
 
+    seguir_paciente(usuario.get("dni"), dni_paciente)
+
+def seguir_paciente(dni_medico, dni_paciente):
+    """Crea la relación médico -> paciente si ambos existen; devuelve True si quedó creada."""
     try:
-        if not db.driver:
+        grafo = db.get_grafo()
+        if not grafo:
             print("Neo4j no disponible: no se puede crear la relación")
-            return
+            return False
 
         # Verificar existencia en MongoDB antes de crear la relación en Neo4j
-        medico_doc = db.find_one(db.pacientes, {"dni": usuario.get("dni")})
-        paciente_doc = db.find_one(db.pacientes, {"dni": dni_paciente})
+        medico_doc = db.find_usuario(dni_medico)
+        paciente_doc = db.find_usuario(dni_paciente)
 
         if not medico_doc:
-            print(f"Médico con DNI {usuario.get('dni')} no encontrado en la base de datos. No se crea la relación.")
-            return
+            print(f"Médico con DNI {dni_medico} no encontrado en la base de datos. No se crea la relación.")
+            return False
 
         if not paciente_doc:
             print(f"Paciente con DNI {dni_paciente} no encontrado. No se puede seguir a un paciente inexistente.")
-            return
+            return False
 
         # Obtener nombres para almacenar en Neo4j al crear nodos (si aplica)
         m_nombre = medico_doc.get("nombre")
@@ -205,19 +216,21 @@ def seguir_paciente_console(usuario):
         p_nombre = paciente_doc.get("nombre")
         p_apellido = paciente_doc.get("apellido")
 
-        with db.driver.session() as session:
-            session.write_transaction(
-                red.seguir,
-                usuario.get("dni"),
-                dni_paciente,
-                m_nombre,
-                m_apellido,
-                p_nombre,
-                p_apellido,
-            )
+        nueva = grafo.seguir(
+            dni_medico,
+            dni_paciente,
+            m_nombre,
+            m_apellido,
+            p_nombre,
+            p_apellido,
+        )
+        if nueva:
+            red.marcar_cambio_red()
         print(f"Ahora sigue al paciente {dni_paciente}")
+        return True
     except Exception as e:
         print(f"Error al seguir paciente: {e}")
+        return False
 
 def consultar_habitos_console(usuario):
     consultar_habitos(usuario["dni"])
@@ -0,0 +1,265 @@
+"""Agenda de los médicos: horarios libres y reserva de turnos sin superposición.
+
+La configuración de cada médico se guarda en `agendas`:
+
+    {"medico_dni", "especialidad", "dias": [0..6], "inicio": "09:00",
+     "fin": "17:00", "duracion": 30}
+
+Los turnos ocupan [fecha, fin). Un médico sin agenda atiende a cualquier
+hora (como antes de las agendas), con turnos de DURACION_DEFECTO minutos.
+
+La reserva es atómica con una versión por DNI en `reservas` ({_id: dni,
+version}): se lee la versión del médico y del paciente, se controla la
+superposición, se inserta y se avanza cada versión solo si nadie la cambió
+(update condicional). Si otra reserva de alguno de los dos llegó antes, se
+vuelve a controlar; de dos turnos superpuestos, el que confirma segundo leyó
+la versión después de que el otro se insertara, así que lo ve. Los índices
+únicos parciales (medico_dni, fecha) y (dni, fecha) sobre los turnos
+programados (ver indices.INDICES) rechazan además el caso común de dos
+reservas del mismo horario sin otra consulta.
+"""
+import heapq
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import db
+import fechas
+
+DURACION_DEFECTO = 30
+# Turno más largo admitido: acota la búsqueda de turnos que empiezan antes
+DURACION_MAXIMA = 240
+# Veces que reservar vuelve a controlar si otras reservas le ganan la versión
+REINTENTOS = 10
+
+def _coleccion():
+    return db.get_collection("agendas")
+
+def _minutos(hora: str) -> int:
+    horas, minutos = hora.split(":")
+    return int(horas) * 60 + int(minutos)
+
+
+class Agenda:
+    """Días y horarios de atención de un médico (`libre`: sin agenda configurada)."""
+
+    def __init__(self, medico_dni: str, especialidad: Optional[str] = None,
+                 dias: Iterable[int] = range(7), inicio: str = "00:00",
+                 fin: str = "24:00", duracion: int = DURACION_DEFECTO, libre: bool = False):
+        self.medico_dni = medico_dni
+        self.libre = libre
+        self.especialidad = especialidad
+        self.dias = frozenset(dias)
+        self.inicio = timedelta(minutes=_minutos(inicio))
+        self.fin = timedelta(minutes=_minutos(fin))
+        self.duracion = timedelta(minutes=duracion)
+
+    @classmethod
+    def desde_documento(cls, doc: Dict) -> "Agenda":
+        return cls(doc["medico_dni"], doc.get("especialidad"), doc.get("dias", range(7)),
+                   doc.get("inicio", "00:00"), doc.get("fin", "24:00"),
+                   doc.get("duracion", DURACION_DEFECTO))
+
+    def es_horario(self, fecha: datetime) -> bool:
+        """True si `fecha` es el comienzo de un turno de la grilla."""
+        if self.libre:
+            return True
+        desde_inicio = fecha - fechas.inicio_del_dia(fecha) - self.inicio
+        return (fecha.weekday() in self.dias
+                and desde_inicio >= timedelta(0)
+                and desde_inicio % self.duracion == timedelta(0)
+                and desde_inicio + self.inicio + self.duracion <= self.fin)
+
+    def horarios(self, desde: datetime, hasta: datetime) -> Iterator[datetime]:
+        """Comienzos de turno en [desde, hasta), en orden."""
+        dia = fechas.inicio_del_dia(desde)
+        while dia < hasta:
+            if dia.weekday() in self.dias:
+                hora = dia + self.inicio
+                while hora + self.duracion <= dia + self.fin and hora < hasta:
+                    if hora >= desde:
+                        yield hora
+                    hora += self.duracion
+            dia += timedelta(days=1)
+
+
+class IndiceIntervalos:
+    """Intervalos ocupados [inicio, fin) ordenados, con consultas en O(log n).
+
+    Los intervalos que se tocan o superponen se fusionan al agregarlos, así
+    alcanza con mirar el anterior y el siguiente al buscar un conflicto.
+    """
+
+    def __init__(self, intervalos: Iterable[Tuple[datetime, datetime]] = ()):
+        self._inicios: List[datetime] = []
+        self._fines: List[datetime] = []
+        for inicio, fin in sorted(intervalos):
+            if self._fines and inicio <= self._fines[-1]:
+                self._fines[-1] = max(self._fines[-1], fin)
+            else:
+                self._inicios.append(inicio)
+                self._fines.append(fin)
+
+    def __len__(self) -> int:
+        return len(self._inicios)
+
+    def superpone(self, inicio: datetime, fin: datetime) -> bool:
+        i = bisect_right(self._inicios, inicio)
+        if i and self._fines[i - 1] > inicio:
+            return True
+        return i < len(self._inicios) and self._inicios[i] < fin
+
+    def agregar(self, inicio: datetime, fin: datetime) -> None:
+        i = bisect_right(self._inicios, inicio)
+        # Absorber el anterior y los siguientes que se toquen con el nuevo
+        if i and self._fines[i - 1] >= inicio:
+            i -= 1
+            inicio = self._inicios[i]
+            fin = max(fin, self._fines[i])
+        j = i
+        while j < len(self._inicios) and self._inicios[j] <= fin:
+            fin = max(fin, self._fines[j])
+            j += 1
+        self._inicios[i:j] = [inicio]
+        self._fines[i:j] = [fin]
+
+
+def configurar_agenda(medico_dni: str, especialidad: str, dias: List[int], inicio: str,
+                      fin: str, duracion: int = DURACION_DEFECTO) -> bool:
+    """Crea o reemplaza la agenda de un médico. Los turnos ya dados no se tocan."""
+    if not dias or not all(0 <= d <= 6 for d in dias):
+        print("Días inválidos (0=lunes ... 6=domingo)")
+        return False
+    try:
+        if not 0 < duracion <= DURACION_MAXIMA or _minutos(inicio) + duracion > _minutos(fin):
+            print("Horario o duración inválidos")
+            return False
+    except ValueError:
+        print("Horario inválido (HH:MM)")
+        return False
+    _coleccion().update_one(
+        {"medico_dni": medico_dni},
+        {"$set": {"especialidad": especialidad, "dias": sorted(set(dias)), "inicio": inicio,
+                  "fin": fin, "duracion": duracion}},
+        upsert=True,
+    )
+    return True
+
+def obtener_agenda(medico_dni: str) -> Agenda:
+    doc = db.find_one(_coleccion(), {"medico_dni": medico_dni}, {"_id": 0})
+    return Agenda.desde_documento(doc) if doc else Agenda(medico_dni, libre=True)
+
+def _fin(turno: Dict) -> datetime:
+    # Los turnos anteriores a la agenda no guardan `fin`
+    return turno.get("fin") or turno["fecha"] + timedelta(minutes=DURACION_DEFECTO)
+
+def ocupados(campo: str, valores: List[str], desde: datetime, hasta: datetime,
+             excluir: Any = None) -> Dict[str, IndiceIntervalos]:
+    """Intervalos de turnos programados por médico (campo="medico_dni") o paciente ("dni").
+
+    `excluir` es el _id de un turno que no cuenta (el que se está reservando).
+    """
+    intervalos: Dict[str, List[Tuple[datetime, datetime]]] = {v: [] for v in valores}
+    filtro = {campo: {"$in": valores}, "estado": "programado",
+              "fecha": {"$gt": desde - timedelta(minutes=DURACION_MAXIMA), "$lt": hasta}}
+    if excluir is not None:
+        filtro["_id"] = {"$ne": excluir}
+    cursor = db.turnos.find(filtro, {"_id": 0, campo: 1, "fecha": 1, "fin": 1})
+    for t in cursor:
+        intervalos[t[campo]].append((t["fecha"], _fin(t)))
+    return {v: IndiceIntervalos(i) for v, i in intervalos.items()}
+
+def conflicto(turno: Dict, excluir: Any = None) -> Optional[str]:
+    """Motivo por el que `turno` no se puede dar, o None si está libre (y completa `fin`)."""
+    agenda = obtener_agenda(turno["medico_dni"])
+    if not agenda.es_horario(turno["fecha"]):
+        return "El horario no corresponde a la agenda del médico"
+    inicio, fin = turno["fecha"], turno["fecha"] + agenda.duracion
+    medico = ocupados("medico_dni", [turno["medico_dni"]], inicio, fin, excluir)[turno["medico_dni"]]
+    if medico.superpone(inicio, fin):
+        return "El médico ya tiene un turno en ese horario"
+    if ocupados("dni", [turno["dni"]], inicio, fin, excluir)[turno["dni"]].superpone(inicio, fin):
+        return "El paciente ya tiene un turno en ese horario"
+    turno["fin"] = fin
+    return None
+
+def _reservas():
+    return db.get_collection("reservas")
+
+def _versiones(dnis: List[str]) -> Dict[str, int]:
+    versiones = {dni: 0 for dni in dnis}
+    for doc in _reservas().find({"_id": {"$in": dnis}}):
+        versiones[doc["_id"]] = doc["version"]
+    return versiones
+
+def _avanzar(versiones: Dict[str, int]) -> bool:
+    """Avanza la versión de cada DNI si sigue siendo la leída (False si alguna cambió)."""
+    for dni, version in versiones.items():
+        try:
+            # Con otra versión guardada el upsert choca con el _id existente
+            _reservas().update_one({"_id": dni, "version": version}, {"$inc": {"version": 1}}, upsert=True)
+        except Exception as e:
+            if db.es_clave_duplicada(e):
+                return False
+            raise
+    return True
+
+def reservar(turno: Dict) -> Optional[str]:
+    """Inserta el turno si el médico y el paciente están libres; devuelve su id.
+
+    Si otra reserva del médico o del paciente confirma entre el control y la
+    inserción, se vuelve a controlar con el turno ya insertado y se lo borra
+    si quedó superpuesto (ver el docstring del módulo).
+    """
+    _id = None
+    for _ in range(REINTENTOS):
+        versiones = _versiones([turno["medico_dni"], turno["dni"]])
+        motivo = conflicto(turno, turno.get("_id"))
+        if motivo:
+            if _id is not None:
+                db.turnos.delete_one({"_id": turno["_id"]})
+            print(motivo)
+            return None
+        if _id is None:
+            try:
+                # insert_one completa turno["_id"]
+                _id = db.insert_one(db.turnos, turno)
+            except Exception as e:
+                if db.es_clave_duplicada(e):
+                    print("El horario ya fue tomado")
+                    return None
+                raise
+        if _avanzar(versiones):
+            return _id
+    db.turnos.delete_one({"_id": turno["_id"]})
+    print("No se pudo confirmar el turno, intente nuevamente")
+    return None
+
+def proximos_turnos_libres(especialidad: str, n: int = 5, desde: Optional[datetime] = None,
+                           dias: int = 30, dni: Optional[str] = None) -> List[Dict]:
+    """Los próximos `n` turnos libres de la especialidad entre todos sus médicos.
+
+    Recorre la grilla de cada médico como un generador y los mezcla por fecha,
+    así solo se generan los horarios necesarios. Si se indica `dni`, también
+    se saltean los horarios en que ese paciente ya tiene turno.
+    """
+    desde = desde or datetime.now()
+    hasta = desde + timedelta(days=dias)
+    agendas = [Agenda.desde_documento(doc)
+               for doc in _coleccion().find({"especialidad": especialidad}, {"_id": 0})]
+    if not agendas:
+        return []
+    medicos = ocupados("medico_dni", [a.medico_dni for a in agendas], desde, hasta)
+    paciente = ocupados("dni", [dni], desde, hasta)[dni] if dni else IndiceIntervalos()
+
+    def libres(agenda: Agenda) -> Iterator[Tuple[datetime, str, datetime]]:
+        ocupado = medicos[agenda.medico_dni]
+        for inicio in agenda.horarios(desde, hasta):
+            fin = inicio + agenda.duracion
+            if not ocupado.superpone(inicio, fin) and not paciente.superpone(inicio, fin):
+                yield inicio, agenda.medico_dni, fin
+
+    return [
+        {"medico_dni": medico_dni, "fecha": inicio, "fin": fin}
+        for inicio, medico_dni, fin in islice(heapq.merge(*(libres(a) for a in agendas)), n)
+    ]
@@ -0,0 +1,247 @@
+"""Estadísticas de hábitos calculadas en MongoDB con pipelines de agregación.
+
+Solo viajan los resúmenes: promedios por día/semana/mes, tendencias con
+ventanas móviles y percentiles. Los registros crudos se leen paginados con
+listar_habitos.
+
+Además mantiene la colección `habitos_resumen`: un documento por paciente y
+semana/mes con contadores que registrar_habito actualiza de forma atómica, de
+modo que leer_resumen no depende del largo de la historia. Para reconstruirla:
+
+    python analitica_habitos.py --reconstruir [dni]
+"""
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import db
+import fechas
+import coincidencias
+
+PERIODOS = {"dia": "day", "semana": "week", "mes": "month"}
+PERIODOS_RESUMEN = ["semana", "mes"]
+
+# Horas de sueño: campo numérico si existe, si no se parsea "8 horas" en el servidor
+_HORAS_SUENO = {"$ifNull": ["$sueno_horas", {"$convert": {
+    "input": {"$arrayElemAt": [{"$split": ["$sueno", " "]}, 0]},
+    "to": "double", "onError": None, "onNull": None,
+}}]}
+
+_CON_EJERCICIO = {"$cond": [{"$in": ["$ejercicio", ["", "No realizado", None]]}, 0, 1]}
+
+def horas_sueno(sueno: str) -> Optional[float]:
+    """Horas de sueño a partir del texto ingresado ("8 horas" -> 8.0)."""
+    try:
+        return float(str(sueno).split()[0])
+    except (ValueError, IndexError):
+        return None
+
+def inicio_periodo(fecha: datetime, periodo: str) -> datetime:
+    """Inicio de la semana (lunes) o del mes de una fecha, igual que $dateTrunc."""
+    dia = fechas.inicio_del_dia(fecha)
+    if periodo == "semana":
+        return dia - timedelta(days=dia.weekday())
+    if periodo == "mes":
+        return dia.replace(day=1)
+    return dia
+
+def _truncar(periodo: str) -> Dict:
+    expresion = {"date": "$fecha", "unit": PERIODOS[periodo]}
+    if periodo == "semana":
+        expresion["startOfWeek"] = "monday"
+    return {"$dateTrunc": expresion}
+
+def _filtro(dni: str, desde=None, hasta=None) -> Dict:
+    filtro: Dict = {"dni": dni}
+    if desde:
+        filtro["fecha"] = {"$gte": fechas.inicio_del_dia(desde)}
+    if hasta:
+        filtro.setdefault("fecha", {})["$lte"] = fechas.inicio_del_dia(hasta)
+    return filtro
+
+def _acumuladores() -> Dict:
+    return {
+        "registros": {"$sum": 1},
+        "sueno": {"$avg": _HORAS_SUENO},
+        "estres": {"$avg": "$estres"},
+        "frecuencia_ejercicio": {"$avg": "$frecuencia_ejercicio"},
+        "dias_con_ejercicio": {"$sum": _CON_EJERCICIO},
+    }
+
+def promedios(dni: str, periodo: str = "semana", desde=None, hasta=None) -> List[Dict]:
+    """Promedios de sueño, estrés y ejercicio por día, semana o mes."""
+    pipeline = [
+        {"$match": _filtro(dni, desde, hasta)},
+        {"$group": dict(
+            {"_id": _truncar(periodo)},
+            **_acumuladores()
+        )},
+        {"$sort": {"_id": 1}},
+        {"$project": {"_id": 0, "periodo": "$_id", "registros": 1, "sueno": 1, "estres": 1,
+                      "frecuencia_ejercicio": 1, "dias_con_ejercicio": 1}},
+    ]
+    return list(db.habitos.aggregate(pipeline))
+
+def tendencias(dni: str, periodo: str = "semana", ventana: int = 4, desde=None, hasta=None) -> List[Dict]:
+    """Promedios por período con media móvil y variación respecto del período anterior."""
+    pipeline = [
+        {"$match": _filtro(dni, desde, hasta)},
+        {"$group": {
+            "_id": _truncar(periodo),
+            "sueno": {"$avg": _HORAS_SUENO},
+            "estres": {"$avg": "$estres"},
+        }},
+        {"$setWindowFields": {
+            "sortBy": {"_id": 1},
+            "output": {
+                "sueno_movil": {"$avg": "$sueno", "window": {"documents": [-(ventana - 1), 0]}},
+                "estres_movil": {"$avg": "$estres", "window": {"documents": [-(ventana - 1), 0]}},
+                "sueno_anterior": {"$shift": {"output": "$sueno", "by": -1}},
+                "estres_anterior": {"$shift": {"output": "$estres", "by": -1}},
+            },
+        }},
+        {"$project": {
+            "_id": 0, "periodo": "$_id", "sueno": 1, "estres": 1, "sueno_movil": 1, "estres_movil": 1,
+            "variacion_sueno": {"$subtract": ["$sueno", "$sueno_anterior"]},
+            "variacion_estres": {"$subtract": ["$estres", "$estres_anterior"]},
+        }},
+    ]
+    return list(db.habitos.aggregate(pipeline))
+
+def percentiles(dni: str, p: List[float] = None, desde=None, hasta=None) -> Optional[Dict]:
+    """Percentiles de sueño y estrés (requiere MongoDB 7.0 o superior)."""
+    p = p or [0.5, 0.9]
+    pipeline = [
+        {"$match": _filtro(dni, desde, hasta)},
+        {"$group": dict(
+            {"_id": None,
+             "sueno_percentiles": {"$percentile": {"input": _HORAS_SUENO, "p": p, "method": "approximate"}},
+             "estres_percentiles": {"$percentile": {"input": "$estres", "p": p, "method": "approximate"}}},
+            **_acumuladores()
+        )},
+        {"$project": {"_id": 0}},
+    ]
+    return next(db.habitos.aggregate(pipeline), None)
+
+def resumen_ultimos(dni: str, n: int = 7, desde=None, hasta=None) -> Optional[Dict]:
+    """Promedios de los últimos n registros del paciente (dentro del rango, si se indica)."""
+    pipeline = [
+        {"$match": _filtro(dni, desde, hasta)},
+        {"$sort": {"fecha": -1}},
+        {"$limit": n},
+        {"$group": dict({"_id": None}, **_acumuladores())},
+        {"$project": {"_id": 0}},
+    ]
+    return next(db.habitos.aggregate(pipeline), None)
+
+def listar_habitos(
+    dni: str,
+    desde=None,
+    hasta=None,
+    limite: int = 20,
+    antes_de: Optional[datetime] = None
+) -> List[Dict]:
+    """Página de registros crudos, de más nuevo a más viejo.
+
+    Para la página siguiente pasar en `antes_de` la fecha del último registro.
+    """
+    filtro = _filtro(dni, desde, hasta)
+    if antes_de is not None:
+        filtro.setdefault("fecha", {})["$lt"] = fechas.a_datetime(antes_de)
+    return list(db.habitos.find(filtro, sort=[("fecha", -1)], limit=limite))
+
+# Resúmenes materializados -------------------------------------------------
+
+def actualizar_resumenes(registros: List[Dict]) -> None:
+    """Suma registros de hábitos a los resúmenes semanal y mensual (una ida y vuelta)."""
+    from pymongo import UpdateOne
+    operaciones = []
+    for registro, periodo in ((r, p) for r in registros for p in PERIODOS_RESUMEN):
+        sueno = registro.get("sueno_horas")
+        alerta = registro.get("alerta_sintomas", False)
+        inc = {
+            "registros": 1,
+            "estres_suma": registro["estres"],
+            "frecuencia_ejercicio_suma": registro["frecuencia_ejercicio"],
+            "dias_con_ejercicio": 0 if registro.get("ejercicio") in ("", "No realizado", None) else 1,
+            "alertas_sintomas": 1 if alerta else 0,
+        }
+        minimos = {"estres_min": registro["estres"]}
+        maximos = {"estres_max": registro["estres"]}
+        # $min/$max con null dejarían null guardado: solo se agregan si hay dato
+        if sueno is not None:
+            inc.update({"sueno_suma": sueno, "sueno_registros": 1})
+            minimos["sueno_min"] = sueno
+            maximos["sueno_max"] = sueno
+        operaciones.append(UpdateOne(
+            {"dni": registro["dni"], "periodo": periodo,
+             "inicio": inicio_periodo(registro["fecha"], periodo)},
+            # `actualizado` le indica a reconstruir_resumen que el resumen está vigente
+            {"$inc": inc, "$min": minimos, "$max": maximos, "$set": {"actualizado": datetime.now()}},
+            upsert=True,
+        ))
+    if operaciones:
+        db.get_collection("habitos_resumen").bulk_write(operaciones, ordered=False)
+
+def leer_resumen(dni: str, periodo: str = "semana", desde=None, hasta=None) -> List[Dict]:
+    """Resúmenes materializados del paciente con los promedios ya calculados."""
+    filtro: Dict = {"dni": dni, "periodo": periodo}
+    if desde:
+        filtro["inicio"] = {"$gte": inicio_periodo(fechas.a_datetime(desde), periodo)}
+    if hasta:
+        filtro.setdefault("inicio", {})["$lte"] = fechas.a_datetime(hasta)
+    resumenes = list(db.get_collection("habitos_resumen").find(filtro, {"_id": 0}, sort=[("inicio", 1)]))
+    for r in resumenes:
+        r["sueno"] = r["sueno_suma"] / r["sueno_registros"] if r.get("sueno_registros") else None
+        r["estres"] = r["estres_suma"] / r["registros"]
+        r["frecuencia_ejercicio"] = r["frecuencia_ejercicio_suma"] / r["registros"]
+    return resumenes
+
+def reconstruir_resumen(dni: Optional[str] = None) -> None:
+    """Recalcula los resúmenes desde `habitos` (backfill); sin dni, para todos.
+
+    Primero el $merge reemplaza cada resumen y después se borran solo los que
+    no produjo ni actualizó actualizar_resumenes: nunca quedan sin resumen.
+    """
+    resumen = db.get_collection("habitos_resumen")
+    filtro = {"dni": dni} if dni else {}
+    marca = datetime.now()
+    # Los registros viejos no traen alerta_sintomas: se detecta con la misma lista
+    patron = coincidencias.patron_servidor(coincidencias.reglas()["sintomas_alerta"])
+    alerta = {"$ifNull": ["$alerta_sintomas", {"$regexMatch": {
+        "input": {"$ifNull": ["$sintomas", ""]}, "regex": patron, "options": "i"}}]}
+    for periodo in PERIODOS_RESUMEN:
+        db.habitos.aggregate([
+            {"$match": filtro},
+            {"$set": {"_sueno": _HORAS_SUENO}},
+            {"$group": {
+                "_id": {"dni": "$dni", "inicio": _truncar(periodo)},
+                "registros": {"$sum": 1},
+                "sueno_suma": {"$sum": "$_sueno"},
+                "sueno_registros": {"$sum": {"$cond": [{"$eq": ["$_sueno", None]}, 0, 1]}},
+                "sueno_min": {"$min": "$_sueno"},
+                "sueno_max": {"$max": "$_sueno"},
+                "estres_suma": {"$sum": "$estres"},
+                "estres_min": {"$min": "$estres"},
+                "estres_max": {"$max": "$estres"},
+                "frecuencia_ejercicio_suma": {"$sum": "$frecuencia_ejercicio"},
+                "dias_con_ejercicio": {"$sum": _CON_EJERCICIO},
+                "alertas_sintomas": {"$sum": {"$cond": [alerta, 1, 0]}},
+            }},
+            {"$project": dict(
+                {"_id": 0, "dni": "$_id.dni", "inicio": "$_id.inicio", "periodo": {"$literal": periodo},
+                 "actualizado": {"$literal": marca}},
+                **{c: 1 for c in ["registros", "sueno_suma", "sueno_registros", "sueno_min", "sueno_max",
+                                  "estres_suma", "estres_min", "estres_max", "frecuencia_ejercicio_suma",
+                                  "dias_con_ejercicio", "alertas_sintomas"]}
+            )},
+            {"$merge": {"into": "habitos_resumen", "on": ["dni", "periodo", "inicio"],
+                        "whenMatched": "replace", "whenNotMatched": "insert"}},
+        ], allowDiskUse=True)
+    # Los que quedaron de antes: sus registros ya no están en `habitos`
+    resumen.delete_many(dict(filtro, **{"$or": [{"actualizado": {"$lt": marca}},
+                                                 {"actualizado": {"$exists": False}}]}))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--reconstruir":
+        reconstruir_resumen(sys.argv[2] if len(sys.argv) > 2 else None)
+        print("Resúmenes de hábitos reconstruidos")
@@ -0,0 +1,63 @@
+"""Consultas de análisis sobre la red médico-paciente.
+
+Todas parten de un nodo buscado por dni (índice de la restricción única) y
+tienen un límite, así el costo depende del vecindario y no del tamaño del
+grafo; la única que recorre todo es distribucion_grados, que por eso se
+cachea. Los resultados se guardan en Redis bajo la versión de la red
+(interaccion_red.VERSION_RED), que sube con cada relación SIGUE nueva.
+
+Las consultas se le piden al grafo de db.get_grafo(): interaccion_red.GrafoNeo4j
+o, con VIDASANA_BACKEND=memoria, memoria.GrafoMemoria.
+"""
+import os
+from typing import Any, Dict, List
+import db
+from interaccion_red import VERSION_RED
+
+CACHE_RED_TTL = int(os.getenv("CACHE_RED_TTL", 3600))
+MAX_SALTOS = 3
+LIMITE_VECINDARIO = 1000
+
+
+def _grafo():
+    grafo = db.get_grafo()
+    if grafo is None:
+        raise RuntimeError("Neo4j no disponible")
+    return grafo
+
+def _cacheado(consulta: str, *args: Any) -> Any:
+    """Resultado de grafo.<consulta>(*args), cacheado en Redis por versión de la red."""
+    from bson import json_util
+    try:
+        redis_ = db.get_redis()
+        version = int(redis_.get(VERSION_RED) or 0)
+        llave = f"red:analitica:{version}:{consulta}:{':'.join(map(str, args))}"
+        guardado = redis_.get(llave)
+        if guardado:
+            return json_util.loads(guardado)
+    except Exception:
+        redis_ = None
+    resultado = getattr(_grafo(), consulta)(*args)
+    if redis_ is not None:
+        try:
+            redis_.setex(llave, CACHE_RED_TTL, json_util.dumps(resultado))
+        except Exception:
+            pass
+    return resultado
+
+def medicos_compartidos(dni_medico: str, limite: int = 10) -> List[Dict]:
+    """Médicos que comparten más pacientes con `dni_medico`, con la cantidad."""
+    return _cacheado("medicos_compartidos", dni_medico, limite)
+
+def equipo_atencion(dni_paciente: str) -> List[Dict]:
+    """Médicos que siguen al paciente, del turno más reciente al más viejo."""
+    return _cacheado("equipo_atencion", dni_paciente)
+
+def vecindario(dni: str, saltos: int = 2, limite: int = LIMITE_VECINDARIO) -> List[str]:
+    """Usuarios a `saltos` relaciones o menos, en cualquier dirección (máximo MAX_SALTOS)."""
+    return _cacheado("vecindario", dni, max(1, min(saltos, MAX_SALTOS)), limite)
+
+def distribucion_grados(entrantes: bool = False) -> List[Dict]:
+    """Cuántos médicos siguen a cada cantidad de pacientes (o pacientes por cantidad
+    de médicos con `entrantes`)."""
+    return _cacheado("distribucion_grados", entrantes)
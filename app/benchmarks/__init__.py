@@ -0,0 +1,22 @@
+"""Benchmarks de VidaSana (correr desde app/ con `python -m benchmarks.<nombre>`).
+
+Los que cargan datos vacían la base antes de empezar: con el backend de
+servicios solo lo hacen si MONGO_DB termina en `_bench` y REDIS_DB es la
+base de benchmarks (15).
+"""
+import sys
+
+SUFIJO_MONGO_BENCH = "_bench"
+REDIS_DB_BENCH = 15
+
+def exigir_bases_bench(redis: bool = False) -> None:
+    """Sale del proceso si las bases que se van a vaciar no son las de benchmarks."""
+    # Import local: cada benchmark fija MONGO_DB/REDIS_DB antes de importar db
+    import db
+    if db.usar_memoria():
+        return
+    if not db.MONGO_DB.endswith(SUFIJO_MONGO_BENCH):
+        sys.exit(f"MONGO_DB={db.MONGO_DB}: el benchmark vacía la base, "
+                 f"usar una que termine en {SUFIJO_MONGO_BENCH}")
+    if redis and db.REDIS_DB != REDIS_DB_BENCH:
+        sys.exit(f"REDIS_DB={db.REDIS_DB}: el benchmark vacía la base de Redis, usar REDIS_DB={REDIS_DB_BENCH}")
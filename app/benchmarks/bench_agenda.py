@@ -0,0 +1,101 @@
+"""Carga concurrente de reservas: muchos pacientes pidiendo los mismos horarios.
+
+Uso (desde app/, necesita MongoDB salvo con --memoria):
+
+    python -m benchmarks.bench_agenda [--hilos 32] [--intentos 200] [--medicos 5] [--horarios 40] [--memoria]
+
+Trabaja en la base MONGO_DB (por defecto `vidasana_bench`; tiene que terminar
+en `_bench`): vacía `turnos`,
+`agendas` y `reservas`, crea los índices únicos parciales y lanza hilos que reservan
+horarios al azar entre los primeros de cada médico. Al final verifica que
+ningún médico ni paciente quedó con dos turnos superpuestos.
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import statistics
+import threading
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("MONGO_DB", "vidasana_bench")
+import db
+import agenda
+import indices
+from benchmarks import exigir_bases_bench
+
+def _preparar(medicos: int) -> None:
+    exigir_bases_bench()
+    for nombre in ("turnos", "agendas", "reservas"):
+        db.get_collection(nombre).drop()
+        for claves, opciones in indices.INDICES.get(nombre, []):
+            db.get_collection(nombre).create_index(claves, **opciones)
+    for m in range(medicos):
+        agenda.configurar_agenda(f"m{m}", "Clínica", [0, 1, 2, 3, 4], "09:00", "13:00", 20)
+
+def _superpuestos() -> int:
+    total = 0
+    for campo in ("medico_dni", "dni"):
+        total += len(list(db.turnos.aggregate([
+            {"$match": {"estado": "programado"}},
+            {"$group": {"_id": {"clave": f"${campo}", "fecha": "$fecha"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+        ])))
+    return total
+
+def correr(hilos: int, intentos: int, medicos: int, n_horarios: int) -> None:
+    _preparar(medicos)
+    desde = datetime.now() + timedelta(days=1)
+    grilla = agenda.obtener_agenda("m0")
+    horarios = list(grilla.horarios(desde, desde + timedelta(days=30)))[:n_horarios]
+    pacientes = hilos * 4
+    latencias, reservados = [], []
+    lock = threading.Lock()
+
+    def trabajar() -> None:
+        propias, exitos = [], 0
+        for _ in range(intentos):
+            turno = {"dni": f"p{random.randrange(pacientes)}", "fecha": random.choice(horarios),
+                     "especialidad": "Clínica", "medico_dni": f"m{random.randrange(medicos)}",
+                     "estado": "programado", "creado": datetime.now()}
+            inicio = time.perf_counter()
+            if agenda.reservar(turno):
+                exitos += 1
+            propias.append((time.perf_counter() - inicio) * 1000)
+        with lock:
+            latencias.extend(propias)
+            reservados.append(exitos)
+
+    trabajadores = [threading.Thread(target=trabajar) for _ in range(hilos)]
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for t in trabajadores:
+            t.start()
+        for t in trabajadores:
+            t.join()
+    segundos = time.perf_counter() - inicio
+
+    latencias.sort()
+    total = hilos * intentos
+    print(f"Intentos: {total:,} en {segundos:.1f}s ({total / segundos:,.0f}/s) con {hilos} hilos")
+    print(f"Reservados: {sum(reservados):,} de {medicos * len(horarios):,} horarios")
+    print(f"Latencia p50 {statistics.median(latencias):.2f} ms, "
+          f"p95 {latencias[int(len(latencias) * 0.95) - 1]:.2f} ms")
+    superpuestos = _superpuestos()
+    print(f"Horarios con turnos superpuestos: {superpuestos}")
+    if superpuestos:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hilos", type=int, default=32)
+    parser.add_argument("--intentos", type=int, default=200)
+    parser.add_argument("--medicos", type=int, default=5)
+    parser.add_argument("--horarios", type=int, default=40)
+    parser.add_argument("--memoria", action="store_true", help="usar el backend en memoria")
+    args = parser.parse_args()
+    if args.memoria:
+        db.usar_backend("memoria")
+    correr(args.hilos, args.intentos, args.medicos, args.horarios)
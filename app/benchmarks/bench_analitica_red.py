@@ -0,0 +1,70 @@
+"""Consultas de analitica_red sobre un grafo sintético, sin y con caché.
+
+Uso (desde app/):
+
+    python -m benchmarks.bench_analitica_red [--relaciones 1000000] [--medicos 2000] [--pacientes 200000]
+
+Usa el backend en memoria: arma el memoria.GrafoMemoria de db.get_grafo()
+donde cada médico sigue pacientes al azar, con 0.2 ms por ida y vuelta en la
+caché de Redis. Para cada consulta
+mide la primera llamada (calcula sobre el grafo) y las siguientes (leen de la
+caché), y comprueba que una relación nueva invalida la caché.
+"""
+import argparse
+import random
+import statistics
+import time
+
+import db
+import analitica_red
+import interaccion_red
+import memoria
+
+def _armar(relaciones: int, medicos: int, pacientes: int) -> memoria.GrafoMemoria:
+    grafo = db.get_grafo()
+    por_medico = relaciones // medicos
+    for m in range(medicos):
+        for p in random.sample(range(pacientes), por_medico):
+            grafo.agregar(f"m{m}", f"p{p}")
+    return grafo
+
+def _ms(funcion) -> float:
+    inicio = time.perf_counter()
+    funcion()
+    return (time.perf_counter() - inicio) * 1000
+
+def correr(relaciones: int, medicos: int, pacientes: int) -> None:
+    db.usar_backend("memoria")
+    inicio = time.perf_counter()
+    grafo = _armar(relaciones, medicos, pacientes)
+    print(f"Grafo de {relaciones:,} relaciones armado en {time.perf_counter() - inicio:.1f}s")
+    db.get_redis().latencia = 0.0002
+
+    casos = {
+        "medicos_compartidos": lambda i: analitica_red.medicos_compartidos(f"m{i % medicos}"),
+        "equipo_atencion": lambda i: analitica_red.equipo_atencion(f"p{i % pacientes}"),
+        "vecindario 2 saltos": lambda i: analitica_red.vecindario(f"m{i % medicos}", 2),
+        "distribucion_grados": lambda i: analitica_red.distribucion_grados(),
+    }
+    print(f"{'consulta':<22}{'sin caché ms':>14}{'con caché ms':>14}")
+    for nombre, consulta in casos.items():
+        frias, calientes = [], []
+        for i in range(20):
+            interaccion_red.marcar_cambio_red()  # Versión nueva: la primera llamada calcula
+            frias.append(_ms(lambda: consulta(i)))
+            calientes.extend(_ms(lambda: consulta(i)) for _ in range(5))
+        print(f"{nombre:<22}{statistics.median(frias):>14.2f}{statistics.median(calientes):>14.3f}")
+
+    antes = analitica_red.equipo_atencion("p0")
+    grafo.agregar("m_nuevo", "p0")
+    interaccion_red.marcar_cambio_red()
+    despues = analitica_red.equipo_atencion("p0")
+    print(f"Invalidación por relación nueva: {len(antes)} -> {len(despues)} médicos en el equipo de p0")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--relaciones", type=int, default=1_000_000)
+    parser.add_argument("--medicos", type=int, default=2000)
+    parser.add_argument("--pacientes", type=int, default=200_000)
+    args = parser.parse_args()
+    correr(args.relaciones, args.medicos, args.pacientes)
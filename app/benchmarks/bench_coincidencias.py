@@ -0,0 +1,47 @@
+"""Compara el buscador compilado con el recorrido término por término.
+
+Uso (desde app/):
+
+    python -m benchmarks.bench_coincidencias [--entradas 5000] [--terminos 8 500]
+"""
+import argparse
+import random
+import string
+import time
+
+from coincidencias import BuscadorTerminos
+
+_PALABRAS = ["paciente", "refiere", "dolor", "control", "presión", "arterial", "tratamiento",
+             "diabetes", "hipertensión", "evolución", "favorable", "estudio", "cardiopatía"]
+
+def _texto(largo: int) -> str:
+    return " ".join(random.choice(_PALABRAS) for _ in range(largo))
+
+def _termino() -> str:
+    return "".join(random.choice(string.ascii_lowercase) for _ in range(random.randint(5, 12)))
+
+def _ingenuo(terminos, textos):
+    # Lo que hacían evaluar_riesgo y registrar_habito: un `in` por término y texto
+    return [{t for t in terminos if t in texto.lower()} for texto in textos]
+
+def correr(entradas: int, tamanios) -> None:
+    textos = [_texto(random.randint(5, 60)) for _ in range(entradas)]
+    print(f"{'terminos':>9}{'entradas':>10}{'ingenuo ms':>12}{'compilado ms':>14}")
+    for n in tamanios:
+        terminos = ["hipertension", "diabetes", "cardio"] + [_termino() for _ in range(n - 3)]
+        inicio = time.perf_counter()
+        _ingenuo(terminos, textos)
+        ingenuo = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        buscador = BuscadorTerminos(terminos)
+        [buscador.buscar(t) for t in textos]
+        compilado = time.perf_counter() - inicio
+        print(f"{n:>9}{entradas:>10}{ingenuo * 1000:>12.1f}{compilado * 1000:>14.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entradas", type=int, default=5000)
+    parser.add_argument("--terminos", type=int, nargs="+", default=[8, 100, 500])
+    args = parser.parse_args()
+    correr(args.entradas, args.terminos)
@@ -0,0 +1,311 @@
+"""Flujos de punta a punta sobre un conjunto de datos sintético.
+
+Uso (desde app/):
+
+    python -m benchmarks.bench_flujos [--pacientes 10000] [--medicos 200] [--operaciones 200]
+                                      [--backend memoria|servicios] [--latencia SEG]
+                                      [--json resultado.json] [--comparar anterior.json]
+                                      [--prometheus metricas.txt]
+
+Carga `pacientes` pacientes con historia clínica, hábitos de los últimos
+días y un turno pasado cada uno (de 10 mil a 10 millones; las cargas
+grandes son para --backend servicios), arma la red desde los turnos y corre
+`operaciones` veces cada flujo con las funciones de negocio reales:
+
+    guardar_paciente, iniciar_sesion (acciones.autenticar), registrar_turno,
+    registrar_habito, consultar_habitos, evaluar_riesgo,
+    seguir (acciones.seguir_paciente) y mostrar_red
+
+Por flujo informa latencia p50/p95/p99, operaciones por segundo, fallidas
+e idas y vueltas por operación a MongoDB, Redis y la red, contadas con
+metricas.py (los histogramas por backend van en el JSON y, con
+--prometheus, en formato de Prometheus). Con --json guarda el
+resultado (con el commit) y con --comparar lo contrasta con otra corrida:
+sale con 1 si el p95 de algún flujo empeoró más que --tolerancia.
+
+Con --backend servicios usa MONGO_DB `vidasana_bench` (se vacía) y
+REDIS_DB 15, y no corre contra otras bases (ver benchmarks.exigir_bases_bench).
+La red se escribe en el Neo4j configurado: los DNI sintéticos tienen 9
+dígitos y empiezan con 9, así que no chocan con DNI reales, y antes de
+cargar se borran los nodos que quedaron de otra corrida. guardar_paciente e
+iniciar_sesion incluyen el costo de bcrypt.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+os.environ.setdefault("MONGO_DB", "vidasana_bench")
+os.environ.setdefault("REDIS_DB", "15")
+import db
+import acciones
+from benchmarks import exigir_bases_bench
+import gestion_pacientes
+import gestion_turnos
+import historia_clinica
+import indices
+import interaccion_red
+import metricas
+import seguimiento_habitos
+
+PASSWORD = "bench-password"
+LOTE_CARGA = 10_000
+DIAS_HABITOS = 14
+# Solo los primeros pacientes tienen hábitos cargados (los flujos de hábitos los usan)
+PACIENTES_CON_HABITOS = 2_000
+
+_DIAGNOSTICOS = ["Hipertensión arterial", "Diabetes tipo 2", "Control anual sin hallazgos",
+                 "Obesidad grado I", "Angina estable", "Cefalea tensional", "Lumbalgia"]
+
+
+# DNI de 9 dígitos (los reales tienen hasta 8): pacientes desde 900.000.000
+# y médicos desde 990.000.000
+PREFIJO_DNI = "9"
+LARGO_DNI = 9
+# Nodos de la red borrados por transacción al limpiar
+LOTE_BORRADO = 10_000
+
+def _dni_paciente(i: int) -> str:
+    return str(900_000_000 + i)
+
+def _dni_medico(i: int) -> str:
+    return str(990_000_000 + i)
+
+def _usuario(dni: str, rol: str, password: bytes) -> Dict:
+    return {"nombre": f"N{dni}", "apellido": f"A{dni}", "dni": dni, "fechaNacimiento": "1980-01-01",
+            "mail": f"{dni}@bench.test", "telefono": "0", "rol": rol, "sexo": "X", "password": password}
+
+
+# Carga --------------------------------------------------------------------------
+
+def _vaciar_red() -> None:
+    """Borra de Neo4j los nodos con DNI sintético (el grafo en memoria ya arranca vacío)."""
+    driver = db.get_driver()
+    if driver is None:
+        return
+    query = ("MATCH (u:Usuario) WHERE u.dni STARTS WITH $prefijo AND size(u.dni) = $largo "
+             "WITH u LIMIT $lote DETACH DELETE u RETURN count(*) AS borrados")
+    with driver.session() as session:
+        while session.run(query, prefijo=PREFIJO_DNI, largo=LARGO_DNI,
+                          lote=LOTE_BORRADO).single()["borrados"]:
+            pass
+
+def _vaciar() -> None:
+    exigir_bases_bench(redis=True)
+    for nombre in indices.INDICES:
+        db.get_collection(nombre).drop()
+    db.get_collection("habitos_resumen").drop()
+    db.get_redis().flushdb()
+    db.usuarios_cache.limpiar()
+    _vaciar_red()
+
+def cargar(pacientes: int, medicos: int) -> Dict:
+    """Carga el conjunto de datos en lotes; devuelve cantidades y segundos."""
+    inicio = time.perf_counter()
+    _vaciar()
+    indices.asegurar_indices()
+    # bcrypt tarda ~0.2 s por hash: todos los usuarios sintéticos comparten uno
+    password = db.hash_password(PASSWORD)
+    rnd = random.Random(42)
+    hace_un_mes = datetime.now().replace(hour=10, minute=0, second=0, microsecond=0) - timedelta(days=30)
+    db.insert_many(db.pacientes, [_usuario(_dni_medico(m), "medico", password) for m in range(medicos)])
+
+    for desde in range(0, pacientes, LOTE_CARGA):
+        rango = range(desde, min(desde + LOTE_CARGA, pacientes))
+        historias = {_dni_paciente(i): [historia_clinica.nueva_entrada(rnd.choice(_DIAGNOSTICOS), "Control",
+                                                                       hace_un_mes - timedelta(days=j))
+                                        for j in range(rnd.randint(0, 4))] for i in rango}
+        documentos = []
+        for i in rango:
+            documento = _usuario(_dni_paciente(i), "paciente", password)
+            diagnosticos = [e["diagnostico"] for e in historias[documento["dni"]]]
+            documento["riesgo"] = gestion_turnos.riesgo_inicial(diagnosticos)
+            documentos.append(documento)
+        db.insert_many(db.pacientes, documentos)
+        historia_clinica.agregar_historias({dni: h for dni, h in historias.items() if h})
+        db.insert_many(db.turnos, [
+            {"dni": _dni_paciente(i), "fecha": hace_un_mes + timedelta(minutes=30 * (i // medicos)),
+             "especialidad": "Clínica", "medico_dni": _dni_medico(i % medicos), "estado": "completado",
+             "creado": hace_un_mes}
+            for i in rango
+        ])
+        con_habitos = [i for i in rango if i < PACIENTES_CON_HABITOS]
+        if con_habitos:
+            seguimiento_habitos.registrar_habitos_lote([
+                {"dni": _dni_paciente(i), "fecha": datetime.now() - timedelta(days=d),
+                 "sueno": f"{rnd.randint(5, 9)} horas", "alimentacion": "Variada", "sintomas": "",
+                 "ejercicio": "Caminata", "estres": rnd.randint(1, 10), "frecuencia_ejercicio": rnd.randint(0, 7)}
+                for i in con_habitos for d in range(1, DIAS_HABITOS + 1)
+            ])
+
+    red = interaccion_red.sincronizar_desde_turnos() if db.get_grafo() else {"relaciones": 0}
+    return {"pacientes": pacientes, "medicos": medicos, "relaciones": red["relaciones"],
+            "segundos": time.perf_counter() - inicio}
+
+
+# Flujos -------------------------------------------------------------------------
+
+def flujos(pacientes: int, medicos: int) -> Dict[str, Callable[[int], object]]:
+    """Cada flujo recibe el número de operación y devuelve None o False si falló."""
+    rnd = random.Random(7)
+    con_habitos = min(pacientes, PACIENTES_CON_HABITOS)
+    manana = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+    def paciente() -> str:
+        return _dni_paciente(rnd.randrange(pacientes))
+
+    def medico() -> str:
+        return _dni_medico(rnd.randrange(medicos))
+
+    def turno(i: int):
+        # Horarios distintos por operación dentro de la grilla de 30 minutos
+        fecha = manana + timedelta(minutes=30 * (i // medicos))
+        return gestion_turnos.registrar_turno(paciente(), fecha.strftime("%Y-%m-%d %H:%M"), "Clínica",
+                                              _dni_medico(i % medicos))
+
+    return {
+        "guardar_paciente": lambda i: gestion_pacientes.guardar_paciente(
+            dict(_usuario(str(30_000_000 + i), "paciente", PASSWORD), historiaClinica=[])),
+        "iniciar_sesion": lambda i: acciones.autenticar(paciente(), PASSWORD),
+        "registrar_turno": turno,
+        "registrar_habito": lambda i: seguimiento_habitos.registrar_habito(
+            _dni_paciente(i % con_habitos), "7 horas", "Variada", "", "Caminata", 5, 3),
+        "consultar_habitos": lambda i: seguimiento_habitos.consultar_habitos(
+            _dni_paciente(rnd.randrange(con_habitos))),
+        "evaluar_riesgo": lambda i: gestion_turnos.evaluar_riesgo(paciente()),
+        "seguir": lambda i: acciones.seguir_paciente(medico(), paciente()),
+        "mostrar_red": lambda i: interaccion_red.mostrar_red(medico()),
+    }
+
+def _percentil(ordenados: List[float], p: float) -> float:
+    return ordenados[max(0, min(len(ordenados) - 1, int(-(-p * len(ordenados) // 1)) - 1))]
+
+BACKENDS = ("mongo", "redis", "neo4j")
+
+def _llamadas() -> Dict[str, int]:
+    return {backend: metricas.llamadas(backend) for backend in BACKENDS}
+
+def medir(flujo: Callable[[int], object], operaciones: int) -> Dict:
+    latencias, fallidas = [], 0
+    antes = _llamadas()
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(operaciones):
+            t0 = time.perf_counter()
+            try:
+                ok = flujo(i)
+            except Exception:
+                ok = None
+            latencias.append((time.perf_counter() - t0) * 1000)
+            fallidas += ok is None or ok is False
+    segundos = time.perf_counter() - inicio
+    latencias.sort()
+    idas = {b: (n - antes[b]) / operaciones for b, n in _llamadas().items()}
+    return {
+        "operaciones": operaciones,
+        "fallidas": fallidas,
+        "p50_ms": _percentil(latencias, 0.50),
+        "p95_ms": _percentil(latencias, 0.95),
+        "p99_ms": _percentil(latencias, 0.99),
+        "ops_por_segundo": operaciones / segundos,
+        "idas_y_vueltas_por_op": sum(idas.values()),
+        "idas_por_backend": idas,
+    }
+
+
+# Resultados ---------------------------------------------------------------------
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def imprimir(resultados: Dict[str, Dict]) -> None:
+    print(f"{'flujo':<20}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'ops/s':>10}{'fallidas':>10}"
+          f"{'idas/op':>9}  {'mongo/redis/neo4j':>17}")
+    for nombre, r in resultados.items():
+        por_backend = "/".join(f"{r['idas_por_backend'][b]:.1f}" for b in BACKENDS)
+        print(f"{nombre:<20}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+              f"{r['ops_por_segundo']:>10,.0f}{r['fallidas']:>10}{r['idas_y_vueltas_por_op']:>9.1f}"
+              f"  {por_backend:>17}")
+
+def comparar(actual: Dict, ruta: str, tolerancia: float) -> bool:
+    """Imprime la variación contra otra corrida; False si algún p95 empeoró más que `tolerancia`."""
+    with open(ruta, encoding="utf-8") as f:
+        anterior = json.load(f)
+    print(f"\nContra {ruta} (commit {anterior.get('commit')}):")
+    print(f"{'flujo':<20}{'p95 antes':>11}{'p95 ahora':>11}{'variación':>11}{'ops/s':>9}")
+    sin_regresiones = True
+    for nombre, r in actual["flujos"].items():
+        previo = anterior["flujos"].get(nombre)
+        if not previo:
+            continue
+        variacion = r["p95_ms"] / previo["p95_ms"] - 1 if previo["p95_ms"] else 0.0
+        ops = r["ops_por_segundo"] / previo["ops_por_segundo"] - 1 if previo["ops_por_segundo"] else 0.0
+        marca = "  <- regresión" if variacion > tolerancia else ""
+        sin_regresiones &= not marca
+        print(f"{nombre:<20}{previo['p95_ms']:>11.2f}{r['p95_ms']:>11.2f}{variacion:>+11.0%}{ops:>+9.0%}{marca}")
+    return sin_regresiones
+
+def correr(args: argparse.Namespace) -> Dict:
+    # Las métricas cuentan las idas y vueltas: se prenden antes de crear los clientes
+    metricas.activar()
+    db.usar_backend(args.backend)
+    with contextlib.redirect_stdout(io.StringIO()):
+        carga = cargar(args.pacientes, args.medicos)
+    print(f"Carga: {carga['pacientes']:,} pacientes, {carga['medicos']:,} médicos, "
+          f"{carga['relaciones']:,} relaciones en {carga['segundos']:.1f}s ({args.backend})")
+    if args.backend == "memoria" and args.latencia:
+        for coleccion in db.get_database()._colecciones.values():
+            coleccion.latencia = args.latencia
+        db.get_redis().latencia = args.latencia
+
+    resultados = {}
+    for nombre, flujo in flujos(args.pacientes, args.medicos).items():
+        if args.flujos and nombre not in args.flujos:
+            continue
+        resultados[nombre] = medir(flujo, args.operaciones)
+    imprimir(resultados)
+    if args.prometheus:
+        with open(args.prometheus, "w", encoding="utf-8") as f:
+            f.write(metricas.prometheus())
+    return {
+        "commit": _commit(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "backend": args.backend,
+        "parametros": {"pacientes": args.pacientes, "medicos": args.medicos,
+                       "operaciones": args.operaciones, "latencia": args.latencia},
+        "carga": carga,
+        "flujos": resultados,
+        "backends": metricas.como_json(),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pacientes", type=int, default=10_000)
+    parser.add_argument("--medicos", type=int, default=200)
+    parser.add_argument("--operaciones", type=int, default=200, help="operaciones por flujo")
+    parser.add_argument("--backend", choices=["memoria", "servicios"], default="memoria")
+    parser.add_argument("--latencia", type=float, default=0.0,
+                        help="pausa por ida y vuelta en el backend en memoria (segundos)")
+    parser.add_argument("--flujos", nargs="+", help="solo estos flujos")
+    parser.add_argument("--json", help="guardar el resultado en este archivo")
+    parser.add_argument("--prometheus", help="guardar los histogramas por backend (carga incluida) en este archivo")
+    parser.add_argument("--comparar", help="resultado JSON de otra corrida")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="empeoramiento de p95 aceptado")
+    args = parser.parse_args()
+
+    resultado = correr(args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, default=str)
+    if args.comparar and not comparar(resultado, args.comparar, args.tolerancia):
+        raise SystemExit(1)
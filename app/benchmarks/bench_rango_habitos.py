@@ -0,0 +1,85 @@
+"""Latencia de consultas por rango sobre hábitos: fechas en texto vs datetime.
+
+Uso (desde app/, necesita MongoDB):
+
+    python -m benchmarks.bench_rango_habitos [--registros 1000000] [--pacientes 2000]
+
+Carga los mismos registros en dos colecciones de la base MONGO_DB (por
+defecto `vidasana_bench`; tiene que terminar en `_bench`), una con `fecha` como texto y otra como datetime,
+ambas con el índice (dni, fecha), y mide rangos de 30 días por paciente y
+una agregación semanal.
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("MONGO_DB", "vidasana_bench")
+import db
+from benchmarks import exigir_bases_bench
+
+def _cargar(n: int, pacientes: int) -> None:
+    exigir_bases_bench()
+    inicio = datetime(2020, 1, 1)
+    for nombre in ("habitos_texto", "habitos_fecha"):
+        db.get_collection(nombre).drop()
+        db.get_collection(nombre).create_index([("dni", 1), ("fecha", -1)])
+    lote_texto, lote_fecha = [], []
+    for i in range(n):
+        fecha = inicio + timedelta(days=i // pacientes)
+        base = {"dni": str(i % pacientes), "estres": random.randint(1, 10),
+                "sueno_horas": round(random.uniform(4, 10), 1)}
+        lote_texto.append(dict(base, fecha=fecha.strftime("%Y-%m-%d")))
+        lote_fecha.append(dict(base, fecha=fecha))
+        if len(lote_fecha) == 10_000:
+            db.get_collection("habitos_texto").insert_many(lote_texto, ordered=False)
+            db.get_collection("habitos_fecha").insert_many(lote_fecha, ordered=False)
+            lote_texto, lote_fecha = [], []
+    if lote_fecha:
+        db.get_collection("habitos_texto").insert_many(lote_texto, ordered=False)
+        db.get_collection("habitos_fecha").insert_many(lote_fecha, ordered=False)
+
+def _medir(funcion, repeticiones: int = 200):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return statistics.median(tiempos), tiempos[int(len(tiempos) * 0.95) - 1]
+
+def correr(n: int, pacientes: int, cargar: bool) -> None:
+    if cargar:
+        inicio = time.perf_counter()
+        _cargar(n, pacientes)
+        print(f"Carga de {n:,} registros x2: {time.perf_counter() - inicio:.1f}s")
+    dias = n // pacientes
+    desde = datetime(2020, 1, 1) + timedelta(days=max(0, dias - 30))
+    hasta = desde + timedelta(days=30)
+
+    casos = {
+        "rango texto": lambda: list(db.get_collection("habitos_texto").find(
+            {"dni": str(random.randrange(pacientes)),
+             "fecha": {"$gte": desde.strftime("%Y-%m-%d"), "$lte": hasta.strftime("%Y-%m-%d")}})),
+        "rango datetime": lambda: list(db.get_collection("habitos_fecha").find(
+            {"dni": str(random.randrange(pacientes)), "fecha": {"$gte": desde, "$lte": hasta}})),
+        "semanal datetime": lambda: list(db.get_collection("habitos_fecha").aggregate([
+            {"$match": {"dni": str(random.randrange(pacientes))}},
+            {"$group": {"_id": {"$dateTrunc": {"date": "$fecha", "unit": "week"}},
+                        "sueno": {"$avg": "$sueno_horas"}, "estres": {"$avg": "$estres"}}},
+        ])),
+    }
+    print(f"{'consulta':<20}{'p50 ms':>10}{'p95 ms':>10}")
+    for nombre, funcion in casos.items():
+        p50, p95 = _medir(funcion)
+        print(f"{nombre:<20}{p50:>10.2f}{p95:>10.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--registros", type=int, default=1_000_000)
+    parser.add_argument("--pacientes", type=int, default=2000)
+    parser.add_argument("--sin-carga", action="store_true", help="reusar los datos ya cargados")
+    args = parser.parse_args()
+    correr(args.registros, args.pacientes, not args.sin_carga)
@@ -0,0 +1,67 @@
+"""Programación y despacho de recordatorios con muchos pendientes a futuro.
+
+Uso (desde app/):
+
+    python -m benchmarks.bench_recordatorios [--futuros 1000000] [--vencidos 20000] [--real]
+
+Programa `futuros` recordatorios para el mes que viene y `vencidos` para
+ahora, mide cuánto tarda programar un recordatorio más con la cola llena y
+despacha los vencidos en lotes. Vuelve a programar los mismos ids para
+comprobar que no se duplican. Por defecto usa memoria.RedisMemoria; con --real usa
+el Redis configurado (en la cola `bench_recordatorios`).
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import db
+import colas
+import recordatorios
+from memoria import RedisMemoria
+
+def _programar(inicio: int, n: int, fecha: datetime) -> float:
+    segundos = time.perf_counter()
+    for i in range(inicio, inicio + n, 10_000):
+        recordatorios.programar_muchos(
+            (str(j), f"p{j % 5000}", fecha, "Recordatorio") for j in range(i, min(i + 10_000, inicio + n))
+        )
+    return time.perf_counter() - segundos
+
+def correr(futuros: int, vencidos: int) -> None:
+    recordatorios.cola = colas.ColaProgramada("bench_recordatorios")
+    mes = datetime.now() + timedelta(days=30)
+
+    segundos = _programar(0, futuros, mes)
+    print(f"Programados {futuros:,} a futuro: {futuros / segundos:,.0f}/s")
+    segundos = _programar(futuros, vencidos, datetime.now())
+    print(f"Programados {vencidos:,} vencidos: {vencidos / segundos:,.0f}/s")
+
+    latencias = []
+    for i in range(200):
+        inicio = time.perf_counter()
+        recordatorios.programar(f"extra{i}", "p0", mes, "Recordatorio")
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    print(f"Programar uno con la cola llena: p50 {statistics.median(latencias):.3f} ms")
+
+    entregados = []
+    inicio = time.perf_counter()
+    while recordatorios.despachar(entregar=entregados.extend):
+        pass
+    segundos = time.perf_counter() - inicio
+    print(f"Despachados {len(entregados):,} en {segundos:.2f}s ({len(entregados) / segundos:,.0f}/s)")
+
+    # Reprogramar los mismos turnos no debe generar envíos nuevos
+    _programar(futuros, vencidos, datetime.now())
+    repetidos = recordatorios.despachar(entregar=entregados.extend)
+    print(f"Reenviados al reprogramar: {repetidos}; pendientes: {recordatorios.cola.estadisticas()}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--futuros", type=int, default=1_000_000)
+    parser.add_argument("--vencidos", type=int, default=20_000)
+    parser.add_argument("--real", action="store_true", help="usar el Redis configurado")
+    args = parser.parse_args()
+    if not args.real:
+        db._redis_client = RedisMemoria()
+    correr(args.futuros, args.vencidos)
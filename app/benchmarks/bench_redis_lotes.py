@@ -0,0 +1,54 @@
+"""Compara los helpers de Redis de a una llave contra las variantes en lote.
+
+Uso (desde app/):
+
+    python -m benchmarks.bench_redis_lotes [--real] [--latencia SEG]
+
+Por defecto usa memoria.RedisMemoria con 0.2 ms por ida y vuelta; con --real usa el
+Redis configurado en REDIS_HOST/REDIS_PORT.
+"""
+import argparse
+import time
+
+import db
+from memoria import RedisMemoria
+
+TAMANIOS = [1, 100, 10_000]
+
+def _ops_por_segundo(n: int, funcion) -> float:
+    inicio = time.perf_counter()
+    funcion()
+    return n / (time.perf_counter() - inicio)
+
+def correr(tamanios=TAMANIOS) -> None:
+    print(f"{'llaves':>8} {'operacion':<16}{'de a una ops/s':>16}{'lote ops/s':>14}")
+    for n in tamanios:
+        dnis = [f"bench{i}" for i in range(n)]
+        recordatorios = [(d, "2030-01-01 10:00", "Recordatorio") for d in dnis]
+        casos = [
+            ("set_access",
+             lambda: [db.set_access_token(d) for d in dnis],
+             lambda: db.set_access_tokens(dnis)),
+            ("check_access",
+             lambda: [db.check_access(d) for d in dnis],
+             lambda: db.check_access_many(dnis)),
+            ("get_access_ttl",
+             lambda: [db.get_access_ttl(d) for d in dnis],
+             lambda: db.get_access_ttls(dnis)),
+            ("set_reminder",
+             lambda: [db.set_reminder(*r) for r in recordatorios],
+             lambda: db.set_reminders(recordatorios)),
+        ]
+        for nombre, de_a_una, en_lote in casos:
+            print(f"{n:>8} {nombre:<16}"
+                  f"{_ops_por_segundo(n, de_a_una):>16,.0f}"
+                  f"{_ops_por_segundo(n, en_lote):>14,.0f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--real", action="store_true", help="usar el Redis configurado")
+    parser.add_argument("--latencia", type=float, default=0.0002)
+    args = parser.parse_args()
+    if not args.real:
+        db._redis_client = RedisMemoria(latencia=args.latencia)
+    correr()
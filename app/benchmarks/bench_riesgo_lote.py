@@ -0,0 +1,41 @@
+"""Throughput del cálculo de riesgo en lote (solo CPU, sin base de datos).
+
+Uso (desde app/):
+
+    python -m benchmarks.bench_riesgo_lote [--pacientes 1000000] [--procesos 1 4 8]
+
+Genera historias clínicas sintéticas y las puntúa con riesgo_lote.puntuar,
+igual que la corrida nocturna pero sin las lecturas y escrituras a MongoDB.
+Para medir la corrida completa usar `python riesgo_lote.py` sobre una base
+cargada.
+"""
+import argparse
+import os
+import random
+import time
+
+import riesgo_lote
+
+_DIAGNOSTICOS = ["Hipertensión arterial", "Diabetes tipo 2", "Control anual sin hallazgos",
+                 "Obesidad grado I", "Angina estable", "Cefalea tensional", "Cardiopatía isquémica",
+                 "Fiebre alta de origen viral", "Lumbalgia", "Faringitis"]
+
+def _filas(n: int, entradas: int):
+    rnd = random.Random(42)
+    for i in range(n):
+        yield str(i), [rnd.choice(_DIAGNOSTICOS) for _ in range(rnd.randint(0, entradas))]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pacientes", type=int, default=1_000_000)
+    parser.add_argument("--entradas", type=int, default=10, help="máximo de entradas por historia")
+    parser.add_argument("--procesos", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--lote", type=int, default=riesgo_lote.LOTE)
+    args = parser.parse_args()
+
+    print(f"{'procesos':>9}{'pacientes':>12}{'segundos':>10}{'pacientes/s':>14}")
+    for procesos in args.procesos:
+        inicio = time.perf_counter()
+        total = sum(len(p) for p in riesgo_lote.puntuar(_filas(args.pacientes, args.entradas), procesos, args.lote))
+        segundos = time.perf_counter() - inicio
+        print(f"{procesos:>9}{total:>12,}{segundos:>10.1f}{total / segundos:>14,.0f}")
@@ -0,0 +1,190 @@
+"""Prueba de carga del servicio HTTP con muchos clientes concurrentes.
+
+Uso (desde app/):
+
+    python -m benchmarks.bench_servicio [--clientes 50] [--segundos 10]
+                                        [--pacientes 2000] [--medicos 20]
+                                        [--backend memoria|servicios] [--url http://host:puerto]
+
+Carga el conjunto de datos de bench_flujos, levanta servicio.py en un
+puerto libre del mismo proceso (o usa --url, con los datos ya cargados) y
+abre `clientes` conexiones persistentes: uno de cada cuatro es médico. Cada
+cliente inicia sesión y repite durante `segundos` una mezcla de pedidos:
+
+    pacientes  hábitos, turnos, riesgo y datos propios; reserva de turnos
+    médicos    página de la red, historia clínica y riesgo de pacientes, seguir
+
+Informa por pedido p50/p95/p99, rechazados (400/409: turno ocupado, ya
+seguido...) y errores (cualquier otro estado o falla de conexión), y los
+pedidos por segundo del total. Los logins se hacen antes de medir: cada
+uno cuesta un bcrypt (~0.3 s de CPU).
+"""
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import db
+import servicio
+from benchmarks.bench_flujos import PACIENTES_CON_HABITOS, PASSWORD, _dni_medico, _dni_paciente, _percentil, cargar
+
+ESPECIALIDAD = "Clínica"
+
+# (peso, nombre) de cada pedido según el rol del cliente
+MEZCLA = {
+    "paciente": [(30, "habitos"), (20, "turnos"), (20, "riesgo"), (20, "usuario"), (10, "reservar")],
+    "medico": [(40, "red"), (30, "historia"), (20, "riesgo_paciente"), (10, "seguir")],
+}
+
+
+class Cliente:
+    def __init__(self, host: str, puerto: int, dni: str, rol: str, semilla: int):
+        self.conexion = http.client.HTTPConnection(host, puerto, timeout=300)
+        self.dni = dni
+        self.rol = rol
+        self.rnd = random.Random(semilla)
+        self.token: Optional[str] = None
+
+    def pedir(self, metodo: str, camino: str, cuerpo: Optional[Dict] = None) -> Tuple[int, bytes]:
+        encabezados = {"Content-Type": "application/json"}
+        if self.token:
+            encabezados["Authorization"] = f"Bearer {self.token}"
+        try:
+            self.conexion.request(metodo, camino, json.dumps(cuerpo) if cuerpo is not None else None, encabezados)
+            respuesta = self.conexion.getresponse()
+            return respuesta.status, respuesta.read()
+        except (OSError, http.client.HTTPException):
+            self.conexion.close()
+            return 0, b""
+
+    def iniciar_sesion(self) -> int:
+        estado, datos = self.pedir("POST", "/sesiones", {"dni": self.dni, "password": PASSWORD})
+        if estado == 201:
+            self.token = json.loads(datos)["token"]
+        return estado
+
+
+def _pedido(cliente: Cliente, nombre: str, pacientes: int, medicos: int, turno: int) -> Tuple[str, str, Optional[Dict]]:
+    paciente = _dni_paciente(cliente.rnd.randrange(pacientes))
+    if nombre == "habitos":
+        return "GET", f"/habitos/{cliente.dni}", None
+    if nombre == "turnos":
+        return "GET", f"/turnos/{cliente.dni}", None
+    if nombre == "riesgo":
+        return "GET", f"/riesgo/{cliente.dni}", None
+    if nombre == "usuario":
+        return "GET", f"/usuarios/{cliente.dni}", None
+    if nombre == "reservar":
+        # Horarios de la grilla de 30 minutos a partir de mañana, distintos por cliente y reserva
+        fecha = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1, minutes=30 * turno)
+        return "POST", "/turnos", {"fecha": fecha.strftime("%Y-%m-%d %H:%M"), "especialidad": ESPECIALIDAD,
+                                   "medico_dni": _dni_medico(cliente.rnd.randrange(medicos))}
+    if nombre == "red":
+        return "GET", "/red", None
+    if nombre == "historia":
+        return "GET", f"/historia/{paciente}", None
+    if nombre == "riesgo_paciente":
+        return "GET", f"/riesgo/{paciente}", None
+    return "POST", "/red/seguir", {"dni_paciente": paciente}
+
+def correr(args: argparse.Namespace) -> None:
+    servidor = None
+    # Un login nuevo reemplaza la sesión anterior del mismo DNI: un médico por cliente médico
+    args.medicos = max(args.medicos, -(-args.clientes // 4))
+    if args.url:
+        partes = urlsplit(args.url)
+        host, puerto = partes.hostname, partes.port or 80
+    else:
+        db.usar_backend(args.backend)
+        with contextlib.redirect_stdout(io.StringIO()):
+            carga = cargar(args.pacientes, args.medicos)
+        print(f"Carga: {carga['pacientes']:,} pacientes, {carga['medicos']:,} médicos en {carga['segundos']:.1f}s "
+              f"({args.backend})")
+        servidor = servicio.crear_servidor("127.0.0.1", 0)
+        threading.Thread(target=servidor.serve_forever, name="servicio", daemon=True).start()
+        host, puerto = servidor.server_address[:2]
+
+    con_habitos = min(args.pacientes, PACIENTES_CON_HABITOS)
+    clientes = [
+        Cliente(host, puerto, _dni_medico(i // 4), "medico", i) if i % 4 == 0
+        else Cliente(host, puerto, _dni_paciente(i % con_habitos), "paciente", i)
+        for i in range(args.clientes)
+    ]
+    latencias: Dict[str, List[float]] = defaultdict(list)
+    estados: Dict[str, Dict[str, int]] = defaultdict(lambda: {"rechazados": 0, "errores": 0})
+    lock = threading.Lock()
+    fin = [0.0]
+
+    def largar() -> None:
+        # Lo ejecuta el último hilo en llegar a la barrera, antes de soltar a todos
+        fin[0] = time.perf_counter() + args.segundos
+
+    listos = threading.Barrier(args.clientes + 1, action=largar)
+
+    def registrar(nombre: str, ms: float, estado: int) -> None:
+        with lock:
+            latencias[nombre].append(ms)
+            if estado in (400, 409):
+                estados[nombre]["rechazados"] += 1
+            elif not 200 <= estado < 300:
+                estados[nombre]["errores"] += 1
+
+    def trabajar(numero: int, cliente: Cliente) -> None:
+        t0 = time.perf_counter()
+        estado = cliente.iniciar_sesion()
+        registrar("login", (time.perf_counter() - t0) * 1000, estado)
+        listos.wait()
+        nombres = [n for _, n in MEZCLA[cliente.rol]]
+        pesos = [p for p, _ in MEZCLA[cliente.rol]]
+        reservas = 0
+        while time.perf_counter() < fin[0]:
+            nombre = cliente.rnd.choices(nombres, pesos)[0]
+            turno = numero + args.clientes * reservas
+            reservas += nombre == "reservar"
+            metodo, camino, cuerpo = _pedido(cliente, nombre, args.pacientes, args.medicos, turno)
+            t0 = time.perf_counter()
+            estado, _ = cliente.pedir(metodo, camino, cuerpo)
+            registrar(nombre, (time.perf_counter() - t0) * 1000, estado)
+
+    hilos = [threading.Thread(target=trabajar, args=(i, c), daemon=True) for i, c in enumerate(clientes)]
+    inicio_login = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    listos.wait()
+    print(f"{args.clientes} sesiones iniciadas en {time.perf_counter() - inicio_login:.1f}s")
+    inicio = fin[0] - args.segundos
+    for hilo in hilos:
+        hilo.join()
+    segundos = time.perf_counter() - inicio
+    for cliente in clientes:
+        cliente.conexion.close()
+    if servidor:
+        servidor.shutdown()
+        servidor.server_close()
+
+    print(f"{'pedido':<18}{'n':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'rechazados':>12}{'errores':>9}")
+    total = 0
+    for nombre, valores in sorted(latencias.items()):
+        valores.sort()
+        total += len(valores) if nombre != "login" else 0
+        print(f"{nombre:<18}{len(valores):>8}{_percentil(valores, 0.50):>9.2f}{_percentil(valores, 0.95):>9.2f}"
+              f"{_percentil(valores, 0.99):>9.2f}{estados[nombre]['rechazados']:>12}{estados[nombre]['errores']:>9}")
+    print(f"\n{total:,} pedidos en {segundos:.1f}s con {args.clientes} clientes: {total / segundos:,.0f} pedidos/s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clientes", type=int, default=50)
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--pacientes", type=int, default=2_000)
+    parser.add_argument("--medicos", type=int, default=20)
+    parser.add_argument("--backend", choices=["memoria", "servicios"], default="memoria")
+    parser.add_argument("--url", help="servicio ya levantado (con los datos de bench_flujos cargados)")
+    correr(parser.parse_args())
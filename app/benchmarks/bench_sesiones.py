@@ -0,0 +1,66 @@
+"""Tasa de comandos Redis y CPU con muchas sesiones concurrentes.
+
+Uso (desde app/):
+
+    python -m benchmarks.bench_sesiones [--sesiones 10000] [--duracion 5]
+                                       [--watchers 20]
+
+Compara el programador compartido de `sesiones` (todas las sesiones) contra
+el watcher anterior de un hilo por login (solo --watchers sesiones, porque
+cada uno ocupa un núcleo). Usa memoria.RedisMemoria sin latencia.
+"""
+import argparse
+import random
+import threading
+import time
+
+import db
+from memoria import RedisMemoria
+from sesiones import ProgramadorSesiones
+
+def _watcher_anterior(dni: str) -> None:
+    # Copia del bucle que usaba acciones.iniciar_sesion antes del programador
+    while True:
+        t = db.get_access_ttl(dni)
+        if t is None or t <= 0:
+            break
+
+def _medir(nombre: str, n: int, duracion: float, arrancar) -> None:
+    redis_sim = RedisMemoria()
+    db._redis_client = redis_sim
+    dnis = [f"s{i}" for i in range(n)]
+    for dni in dnis:
+        redis_sim._setex(f"acceso:{dni}", random.uniform(1, duracion), "activo")
+
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    expiradas = arrancar(dnis)
+    time.sleep(duracion + 0.5)
+    cpu, pared = time.process_time() - cpu0, time.perf_counter() - t0
+    print(f"{nombre:<22}{n:>9}{redis_sim.comandos / pared:>14,.0f}"
+          f"{cpu / pared * 100:>9.0f}%{len(expiradas):>10}")
+
+def _con_programador(dnis):
+    expiradas = []
+    programador = ProgramadorSesiones(al_expirar=expiradas.append)
+    for dni in dnis:
+        programador.registrar(dni, db.get_redis()._ttl(f"acceso:{dni}"))
+    return expiradas
+
+def _con_watchers(dnis):
+    expiradas = []
+    def vigilar(dni):
+        _watcher_anterior(dni)
+        expiradas.append(dni)
+    for dni in dnis:
+        threading.Thread(target=vigilar, args=(dni,), daemon=True).start()
+    return expiradas
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sesiones", type=int, default=10_000)
+    parser.add_argument("--watchers", type=int, default=20)
+    parser.add_argument("--duracion", type=float, default=5.0)
+    args = parser.parse_args()
+    print(f"{'modo':<22}{'sesiones':>9}{'comandos/s':>14}{'CPU':>10}{'expiradas':>10}")
+    _medir("programador", args.sesiones, args.duracion, _con_programador)
+    _medir("watcher por login", args.watchers, args.duracion, _con_watchers)
@@ -0,0 +1,43 @@
+"""Mide el costo de importar `db` y los módulos de negocio.
+
+Uso (desde app/):
+
+    python -m benchmarks.bench_startup [repeticiones]
+
+Cada medición se hace en un intérprete nuevo para que el caché de módulos no
+influya. Además se verifica que el import no haya abierto ninguna conexión.
+"""
+import subprocess
+import sys
+import statistics
+
+_SCRIPT = """
+import time
+t0 = time.perf_counter()
+import {modulo}
+t1 = time.perf_counter()
+import db
+conectado = any(x is not None for x in (db._mongo_client, db._redis_client, db._driver))
+print(t1 - t0, int(conectado))
+"""
+
+MODULOS = ["db", "gestion_pacientes", "gestion_turnos", "seguimiento_habitos", "acciones"]
+
+def medir(modulo: str, repeticiones: int):
+    tiempos = []
+    for _ in range(repeticiones):
+        salida = subprocess.run(
+            [sys.executable, "-c", _SCRIPT.format(modulo=modulo)],
+            capture_output=True, text=True, check=True,
+        ).stdout.split()
+        tiempos.append(float(salida[0]))
+        if salida[1] == "1":
+            raise AssertionError(f"import {modulo} abrió una conexión")
+    return tiempos
+
+if __name__ == "__main__":
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    print(f"{'modulo':<22}{'mediana ms':>12}{'max ms':>10}")
+    for modulo in MODULOS:
+        tiempos = medir(modulo, repeticiones)
+        print(f"{modulo:<22}{statistics.median(tiempos) * 1000:>12.1f}{max(tiempos) * 1000:>10.1f}")
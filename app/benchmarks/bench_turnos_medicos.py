@@ -0,0 +1,49 @@
+"""Idas y vueltas a Mongo al listar turnos con su médico, antes y después.
+
+Uso (desde app/):
+
+    python -m benchmarks.bench_turnos_medicos [--turnos 200] [--medicos 20]
+"""
+import argparse
+import contextlib
+import io
+import time
+
+import db
+import gestion_turnos
+from memoria import ColeccionMemoria
+
+def _listar_antes(dni: str) -> None:
+    # Versión anterior de consultar_turnos_paciente: un find_one por turno
+    for t in db.turnos.find({"dni": dni}, sort=[("fecha", 1)]):
+        db.pacientes.find_one({"dni": t["medico_dni"]})
+
+def correr(n_turnos: int, n_medicos: int, latencia: float) -> None:
+    medicos = [{"dni": f"m{i}", "nombre": f"Medico {i}", "rol": "medico"} for i in range(n_medicos)]
+    turnos = [
+        {"dni": "p1", "fecha": f"2030-01-01 {i % 24:02d}:00", "especialidad": "Clínica",
+         "medico_dni": f"m{i % n_medicos}"}
+        for i in range(n_turnos)
+    ]
+    pacientes = ColeccionMemoria("pacientes", medicos + [{"dni": "p1", "nombre": "Paciente", "rol": "paciente"}],
+                                 latencia)
+    db._colecciones["pacientes"] = db.pacientes = pacientes
+    db._colecciones["turnos"] = db.turnos = ColeccionMemoria("turnos", turnos, latencia)
+
+    print(f"{'variante':<12}{'turnos':>8}{'idas y vueltas':>16}{'ms':>10}")
+    for nombre, listar in [("antes", _listar_antes), ("despues", gestion_turnos.consultar_turnos_paciente)]:
+        db.usuarios_cache.limpiar()
+        pacientes.idas_y_vueltas = db.turnos.idas_y_vueltas = 0
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            listar("p1")
+        ms = (time.perf_counter() - inicio) * 1000
+        print(f"{nombre:<12}{n_turnos:>8}{pacientes.idas_y_vueltas + db.turnos.idas_y_vueltas:>16}{ms:>10.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turnos", type=int, default=200)
+    parser.add_argument("--medicos", type=int, default=20)
+    parser.add_argument("--latencia", type=float, default=0.0005)
+    args = parser.parse_args()
+    correr(args.turnos, args.medicos, args.latencia)
@@ -0,0 +1,57 @@
+"""Caché LRU en memoria con vencimiento por TTL y contadores de aciertos."""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+_AUSENTE = object()
+
+class CacheLRU:
+    def __init__(self, capacidad: int = 10000, ttl: float = 300):
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self._datos: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+
+    def obtener(self, clave: Hashable, defecto: Any = None) -> Any:
+        with self._lock:
+            item = self._datos.get(clave, _AUSENTE)
+            if item is _AUSENTE or item[0] <= time.monotonic():
+                if item is not _AUSENTE:
+                    del self._datos[clave]
+                self.fallos += 1
+                return defecto
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return item[1]
+
+    def guardar(self, clave: Hashable, valor: Any) -> None:
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.capacidad:
+                self._datos.popitem(last=False)
+                self.desalojos += 1
+
+    def invalidar(self, clave: Hashable) -> None:
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._datos.clear()
+
+    def estadisticas(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": (self.aciertos / consultas) if consultas else None,
+                "desalojos": self.desalojos,
+                "tamanio": len(self._datos),
+                "capacidad": self.capacidad,
+            }
@@ -0,0 +1,110 @@
+"""Búsqueda de términos clínicos (síntomas de alerta, diagnósticos de riesgo).
+
+Los términos se cargan una sola vez desde reglas_clinicas.json (o el archivo
+indicado en VIDASANA_REGLAS) y se compilan en una única expresión regular.
+Texto y términos se normalizan sin tildes ni mayúsculas, así "Hipertensión"
+coincide con "hipertension".
+"""
+import json
+import os
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Iterable, List, Set
+
+RUTA_REGLAS = os.getenv(
+    "VIDASANA_REGLAS",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "reglas_clinicas.json")
+)
+
+_VARIANTES = {"a": "aáàäâ", "e": "eéèëê", "i": "iíìïî", "o": "oóòöô", "u": "uúùüû", "n": "nñ", "c": "cç"}
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sin tildes y con espacios simples (descarta lo que no sea ASCII)."""
+    sin_tildes = unicodedata.normalize("NFKD", texto or "").encode("ascii", "ignore").decode()
+    return " ".join(sin_tildes.lower().split())
+
+def _caracter(c: str) -> str:
+    """Regex de un carácter normalizado que acepta sus variantes con tilde."""
+    if c == " ":
+        return r"\s+"
+    return f"[{_VARIANTES[c]}]" if c in _VARIANTES else re.escape(c)
+
+def _trie_a_regex(nodo: Dict) -> str:
+    """Alternativa factorizada por prefijos: cada posición se descarta con un carácter."""
+    ramas = [re.escape(c) + _trie_a_regex(hijo) for c, hijo in sorted(nodo.items()) if c]
+    if not ramas:
+        return ""
+    alternativa = ramas[0] if len(ramas) == 1 else f"(?:{'|'.join(ramas)})"
+    # Sufijo opcional y codicioso: siempre gana el término más largo
+    return f"(?:{alternativa})?" if "" in nodo else alternativa
+
+class BuscadorTerminos:
+    """Encuentra todos los términos contenidos en un texto con una sola pasada.
+
+    Los términos normalizados se compilan en un trie expresado como regex y se
+    buscan sobre el texto normalizado. En cada posición se prueba el término
+    más largo (dentro de un lookahead, así las coincidencias se solapan); los
+    términos más cortos que empiezan en la misma posición están contenidos en
+    él, por eso cada coincidencia suma también los términos que contiene.
+    """
+
+    def __init__(self, terminos: Iterable[str]):
+        self.terminos: List[str] = list(dict.fromkeys(terminos))
+        por_normal: Dict[str, Set[str]] = {}
+        for t in self.terminos:
+            normal = normalizar(t)
+            if normal:
+                por_normal.setdefault(normal, set()).add(t)
+        normales = list(por_normal)
+        self._contenidos = {
+            n: set().union(*(por_normal[m] for m in normales if m in n)) for n in normales
+        }
+        trie: Dict = {}
+        for n in normales:
+            nodo = trie
+            for c in n:
+                nodo = nodo.setdefault(c, {})
+            nodo[""] = {}
+        self._patron = re.compile(f"(?=({_trie_a_regex(trie)}))") if normales else None
+
+    def buscar(self, texto: str) -> Set[str]:
+        """Términos (tal como se cargaron) presentes en el texto."""
+        if self._patron is None or not texto:
+            return set()
+        encontrados: Set[str] = set()
+        vistos = set()
+        for m in self._patron.finditer(normalizar(texto)):
+            normal = m.group(1)
+            if normal not in vistos:
+                vistos.add(normal)
+                encontrados |= self._contenidos[normal]
+        return encontrados
+
+    def contiene_alguno(self, texto: str) -> bool:
+        return self._patron is not None and self._patron.search(normalizar(texto)) is not None
+
+def patron_servidor(terminos: Iterable[str]) -> str:
+    """Expresión para $regexMatch (con opción "i") que ignora tildes."""
+    return "|".join("".join(_caracter(c) for c in normalizar(t)) for t in terminos if normalizar(t))
+
+@lru_cache(maxsize=None)
+def reglas(ruta: str = RUTA_REGLAS) -> Dict:
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+@lru_cache(maxsize=None)
+def buscador_sintomas() -> BuscadorTerminos:
+    return BuscadorTerminos(reglas()["sintomas_alerta"])
+
+@lru_cache(maxsize=None)
+def buscador_diagnosticos() -> BuscadorTerminos:
+    return BuscadorTerminos(reglas()["diagnosticos_riesgo"])
+
+def hay_sintomas_alerta(sintomas: str) -> bool:
+    return buscador_sintomas().contiene_alguno(sintomas)
+
+def puntos_diagnostico(diagnostico: str) -> Dict[str, int]:
+    """Puntos de riesgo que aporta un diagnóstico, por término encontrado."""
+    puntos = reglas()["diagnosticos_riesgo"]
+    return {t: puntos[t] for t in buscador_diagnosticos().buscar(diagnostico)}
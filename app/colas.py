@@ -0,0 +1,162 @@
+"""Cola de trabajos programados sobre un sorted set de Redis.
+
+Cada cola usa estas llaves:
+
+    {nombre}:programados   ZSET id -> momento (epoch) en que vence
+    {nombre}:datos         HASH id -> JSON del trabajo
+    {nombre}:reclamo:{id}  trabajador que tiene el trabajo, con TTL visibilidad
+    {nombre}:hecho:{id}    marca de trabajo entregado, con TTL RETENCION_HECHOS
+
+Programar es O(log n) y no depende de cuántos trabajos haya en el futuro.
+Reclamar toma cada id vencido con SET NX sobre su llave de reclamo: solo un
+trabajador la crea, sin scripts Lua. En la misma transacción se lee el
+vencimiento, y el ganador mueve el id a ahora + visibilidad para que los
+demás no lo vuelvan a leer; confirmar, reprogramar y descartar borran el
+reclamo. Si el trabajador muere antes de confirmar, el reclamo expira, el
+trabajo vuelve a vencer y otro lo toma. La entrega es por lo tanto al menos
+una vez; los ids son idempotentes (el mismo id no se programa
+dos veces ni después de entregado), así que reiniciar el proceso o volver a
+programar los mismos trabajos no genera duplicados.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import db
+
+# Cuánto se recuerda que un id ya se entregó (segundos)
+RETENCION_HECHOS = 7 * 24 * 3600
+# Espera máxima entre intentos de un trabajador que no llega a Redis (segundos)
+ESPERA_ERRORES_MAXIMA = 60
+
+
+class ColaProgramada:
+    def __init__(self, nombre: str, visibilidad: int = 60):
+        self.nombre = nombre
+        self.visibilidad = visibilidad
+        self._programados = f"{nombre}:programados"
+        self._datos = f"{nombre}:datos"
+
+    def _hecho(self, id_: str) -> str:
+        return f"{self.nombre}:hecho:{id_}"
+
+    def _reclamo(self, id_: str) -> str:
+        return f"{self.nombre}:reclamo:{id_}"
+
+    def programar(self, trabajos: Iterable[Tuple[str, float, Dict]]) -> int:
+        """Agrega trabajos (id, vence, datos); devuelve cuántos eran nuevos."""
+        trabajos = list(trabajos)
+        if not trabajos:
+            return 0
+        hechos = db.get_redis().mget([self._hecho(id_) for id_, _, _ in trabajos])
+        comandos = []
+        for (id_, vence, datos), hecho in zip(trabajos, hechos):
+            if hecho:
+                continue
+            comandos.append(("hsetnx", (self._datos, id_, json.dumps(datos, default=str))))
+            # nx=True: un id ya programado o en proceso conserva su vencimiento
+            comandos.append(("zadd", (self._programados, {id_: vence}, True)))
+        return sum(db._ejecutar_en_lotes(comandos, transaction=True)[1::2])
+
+    def reclamar(self, limite: int = 500, ahora: Optional[float] = None) -> List[Tuple[str, Dict]]:
+        """Toma hasta `limite` trabajos vencidos para este trabajador (cada uno, uno solo)."""
+        ahora = time.time() if ahora is None else ahora
+        redis_ = db.get_redis()
+        ids = [i.decode("utf-8") if isinstance(i, bytes) else i
+               for i in redis_.zrangebyscore(self._programados, "-inf", ahora, 0, limite)]
+        if not ids:
+            return []
+        trabajador = uuid.uuid4().hex
+        pipe = redis_.pipeline(transaction=True)
+        for id_ in ids:
+            pipe.set(self._reclamo(id_), trabajador, ex=self.visibilidad, nx=True)
+            pipe.zscore(self._programados, id_)
+        pipe.hmget(self._datos, ids)
+        resultados = pipe.execute()
+        ganados, vencen, datos = resultados[0:-1:2], resultados[1:-1:2], resultados[-1]
+
+        reclamados, soltar, huerfanos = [], [], []
+        for id_, ganado, vence, valor in zip(ids, ganados, vencen, datos):
+            if not ganado:
+                continue  # Lo tiene otro trabajador
+            if vence is None or vence > ahora:
+                soltar.append(id_)  # Confirmado o reprogramado después de la lectura
+            elif valor is None:
+                soltar.append(id_)
+                huerfanos.append(id_)  # Sin datos: no queda nada que entregar
+            else:
+                reclamados.append((id_, json.loads(valor)))
+
+        if reclamados or soltar:
+            pipe = redis_.pipeline(transaction=True)
+            if reclamados:
+                # xx: no vuelve a agregar un id que ya no está en la cola
+                pipe.zadd(self._programados, {id_: ahora + self.visibilidad for id_, _ in reclamados}, xx=True)
+            if soltar:
+                pipe.delete(*(self._reclamo(id_) for id_ in soltar))
+            if huerfanos:
+                pipe.zrem(self._programados, *huerfanos)
+            pipe.execute()
+        return reclamados
+
+    def confirmar(self, ids: List[str]) -> None:
+        """Marca trabajos como entregados y los quita de la cola."""
+        if not ids:
+            return
+        comandos = [("zrem", (self._programados, *ids)), ("hdel", (self._datos, *ids)),
+                    ("delete", tuple(self._reclamo(id_) for id_ in ids))]
+        comandos.extend(("setex", (self._hecho(id_), RETENCION_HECHOS, 1)) for id_ in ids)
+        db._ejecutar_en_lotes(comandos, transaction=True)
+
+    def reprogramar(self, trabajos: Iterable[Tuple[str, float, Dict]]) -> None:
+        """Actualiza datos y vencimiento de trabajos reclamados (reintentos)."""
+        comandos = []
+        for id_, vence, datos in trabajos:
+            comandos.append(("hset", (self._datos, id_, json.dumps(datos, default=str))))
+            comandos.append(("zadd", (self._programados, {id_: vence})))
+            comandos.append(("delete", (self._reclamo(id_),)))
+        if comandos:
+            db._ejecutar_en_lotes(comandos, transaction=True)
+
+    def descartar(self, ids: List[str]) -> None:
+        """Quita trabajos sin marcarlos como entregados."""
+        if ids:
+            db._ejecutar_en_lotes([("zrem", (self._programados, *ids)), ("hdel", (self._datos, *ids)),
+                                   ("delete", tuple(self._reclamo(id_) for id_ in ids))],
+                                  transaction=True)
+
+    def estadisticas(self, ahora: Optional[float] = None) -> Dict[str, int]:
+        ahora = time.time() if ahora is None else ahora
+        total, vencidos = db._ejecutar_en_lotes([
+            ("zcard", (self._programados,)),
+            ("zcount", (self._programados, "-inf", ahora)),
+        ])
+        return {"programados": total, "vencidos": vencidos}
+
+
+def bucle_trabajador(despachar: Callable[[], int], lote: int, intervalo: float,
+                     detener: threading.Event, log: logging.Logger) -> None:
+    """Llama a `despachar` hasta que se active `detener`.
+
+    Sigue de inmediato mientras despache lotes llenos y espera `intervalo` si
+    no. Si falla (por ejemplo, Redis caído) duplica la espera en cada falla
+    hasta ESPERA_ERRORES_MAXIMA y lo informa por `log`, no por stdout: los
+    trabajadores pueden correr dentro de la consola.
+    """
+    fallas = 0
+    while not detener.is_set():
+        try:
+            despachados = despachar()
+        except Exception as e:
+            fallas += 1
+            espera = min(ESPERA_ERRORES_MAXIMA, intervalo * 2 ** fallas)
+            log.warning("Error al despachar (falla %d, reintento en %.0f s): %s", fallas, espera, e)
+            detener.wait(espera)
+            continue
+        if fallas:
+            log.info("Despacho restablecido tras %d fallas", fallas)
+            fallas = 0
+        if despachados < lote:
+            detener.wait(intervalo)
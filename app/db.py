@@ -1,18 +1,44 @@
 import os
 import json
+import secrets
+import threading
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Union
-from pymongo import MongoClient, DESCENDING
-from pymongo.collection import Collection
-from pymongo.cursor import Cursor
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple, Union
 import redis
-from neo4j import GraphDatabase
 
 import bcrypt
+from cache import CacheLRU
+import metricas
+
+if TYPE_CHECKING:
+    from pymongo import MongoClient
+    from pymongo.collection import Collection
+    from pymongo.cursor import Cursor
+
 # Configuración de conexiones desde variables de entorno (Docker-friendly)
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+MONGO_DB = os.getenv("MONGO_DB", "vidasana")
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+REDIS_DB = int(os.getenv("REDIS_DB", 0))
+NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
+NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
+NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "password")
+
+# Backend de almacenamiento: "servicios" (MongoDB, Redis y Neo4j) o "memoria"
+# (memoria.py: todo dentro del proceso, para pruebas, benchmarks y perfiles)
+VIDASANA_BACKEND = os.getenv("VIDASANA_BACKEND", "servicios")
+
+# TTL configurations
+ACCESO_TTL = 3600  # 1 hora
+RECORDATORIO_TTL = 600  # 10 minutos (llaves de set_reminder; los envíos programados están en recordatorios.py)
+
+# Caché de documentos de usuarios (pacientes y médicos) por DNI
+CACHE_USUARIOS_CAPACIDAD = int(os.getenv("CACHE_USUARIOS_CAPACIDAD", 10000))
+CACHE_USUARIOS_TTL = int(os.getenv("CACHE_USUARIOS_TTL", 300))
+# Segundo nivel opcional en Redis, compartido entre procesos
+CACHE_USUARIOS_REDIS = os.getenv("CACHE_USUARIOS_REDIS", "0") == "1"
+
 def hash_password(password: str) -> bytes:
     salt = bcrypt.gensalt()
     return bcrypt.hashpw(password.encode('utf-8'), salt)
@@ -20,156 +46,431 @@ def hash_password(password: str) -> bytes:
 def check_password(password: str, hashed: bytes) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed)
 
-def set_access_token(dni: str, minutes: int = 60) -> None:
-    if redis_client:
-        redis_client.setex(f"acceso:{dni}", timedelta(minutes=minutes), "1")
+# Conexiones perezosas: nada se conecta al importar el módulo. Cada cliente se
+# crea la primera vez que se usa y se reutiliza en el resto del proceso.
+# Los índices se crean aparte con `python migraciones.py`.
+_lock = threading.RLock()
+_mongo_client: Optional["MongoClient"] = None
+_redis_client: Optional[redis.Redis] = None
+_driver = None
+_driver_inicializado = False
+_grafo = None
+_colecciones: Dict[str, "Collection"] = {}
 
-def check_access_token(dni: str) -> bool:
-    if redis_client:
-        return bool(redis_client.get(f"acceso:{dni}"))
-    return False
-REDIS_DB = int(os.getenv("REDIS_DB", 0))
-NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
-NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
-NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "password")
+def usar_memoria() -> bool:
+    return VIDASANA_BACKEND == "memoria"
 
-# TTL configurations
-ACCESO_TTL = 3600  # 1 hora
-RECORDATORIO_TTL = 600  # 10 minutos
-
-def get_mongo_client(uri: str = None) -> MongoClient:
-    return MongoClient(uri or MONGO_URI)
-
-# MongoDB: Conexión y colecciones
-mongo_client = get_mongo_client()
-db = mongo_client["vidasana"]
-pacientes: Collection = db["pacientes"]
-turnos: Collection = db["turnos"]
-habitos: Collection = db["habitos"]
-
-# Función para limpiar DNIs duplicados antes de crear el índice
-def _limpiar_duplicados():
-    pipeline = [
-        {"$group": {
-            "_id": "$dni",
-            "doc_id": {"$last": "$_id"},
-            "count": {"$sum": 1}
-        }},
-        {"$match": {
-            "count": {"$gt": 1}
-        }}
-    ]
-    
-    duplicados = list(pacientes.aggregate(pipeline))
-    for dup in duplicados:
-        # Mantener solo el documento más reciente para cada DNI
-        pacientes.delete_many({
-            "dni": dup["_id"],
-            "_id": {"$ne": dup["doc_id"]}
-        })
-
-# Crear índices de forma segura
-def _setup_indices():
-    try:
-        # Primero limpiar duplicados
-        _limpiar_duplicados()
-        
-        # Verificar si ya existe el índice
-        indices_actuales = pacientes.list_indexes()
-        tiene_indice_dni = any(
-            idx.get("key", {}).get("dni") == 1 
-            for idx in indices_actuales
-        )
-        
-        if not tiene_indice_dni:
-            pacientes.create_index("dni", unique=True)
-            
-        # Otros índices (no únicos)
-        turnos.create_index([("fecha", DESCENDING)])
-        habitos.create_index([("dni", 1), ("fecha", -1)])
-        
+def usar_backend(nombre: str) -> None:
+    """Cambia de backend ("servicios" o "memoria") cerrando los clientes abiertos."""
+    global VIDASANA_BACKEND
+    if nombre not in ("servicios", "memoria"):
+        raise ValueError(f"Backend desconocido: {nombre}")
+    cerrar_conexiones()
+    VIDASANA_BACKEND = nombre
+
+def get_mongo_client(uri: str = None) -> "MongoClient":
+    global _mongo_client
+    if uri and not usar_memoria():
+        from pymongo import MongoClient
+        return MongoClient(uri, event_listeners=metricas.escuchas_mongo())
+    if _mongo_client is None:
+        with _lock:
+            if _mongo_client is None:
+                if usar_memoria():
+                    import memoria
+                    _mongo_client = memoria.ClienteMongoMemoria()
+                else:
+                    from pymongo import MongoClient
+                    _mongo_client = MongoClient(MONGO_URI, event_listeners=metricas.escuchas_mongo())
+    return _mongo_client
+
+def get_database():
+    return get_mongo_client()[MONGO_DB]
+
+def get_collection(nombre: str) -> "Collection":
+    coleccion = _colecciones.get(nombre)
+    if coleccion is None:
+        coleccion = _colecciones.setdefault(nombre, get_database()[nombre])
+    return coleccion
+
+def get_redis() -> redis.Redis:
+    global _redis_client
+    if _redis_client is None:
+        with _lock:
+            if _redis_client is None:
+                if usar_memoria():
+                    import memoria
+                    cliente = memoria.RedisMemoria()
+                else:
+                    cliente = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB)
+                _redis_client = metricas.instrumentar_redis(cliente)
+    return _redis_client
+
+def get_driver():
+    """Devuelve el driver de Neo4j o None si no está disponible (opcional).
+
+    Con el backend en memoria no hay driver: usar get_grafo().
+    """
+    global _driver, _driver_inicializado
+    if not _driver_inicializado:
+        with _lock:
+            if not _driver_inicializado:
+                _driver = None if usar_memoria() else _conectar_neo4j()
+                _driver_inicializado = True
+    return _driver
+
+def get_grafo():
+    """Repositorio de la red médico-paciente, o None si Neo4j no está disponible."""
+    global _grafo
+    if _grafo is None:
+        with _lock:
+            if _grafo is None:
+                if usar_memoria():
+                    import memoria
+                    _grafo = metricas.instrumentar(memoria.GrafoMemoria(), "neo4j", "red")
+                elif get_driver() is not None:
+                    from interaccion_red import GrafoNeo4j
+                    _grafo = metricas.instrumentar(GrafoNeo4j(get_driver()), "neo4j", "red")
+    return _grafo
+
+def _conectar_neo4j():
+    try:
+        from neo4j import GraphDatabase
+        # Conectar con las credenciales proporcionadas
+        driver = GraphDatabase.driver(NEO4J_URI, auth=("neo4j", "test12345"))
+        # Verificar conexión
+        with driver.session() as session:
+            session.run("RETURN 1")
+        return driver
     except Exception as e:
-        print(f"Advertencia al configurar índices: {str(e)}")
-
-# Ejecutar setup de índices
-_setup_indices()
-
-# Redis: Control de acceso y recordatorios
-redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB)
-
-# Neo4j: Red social médico-paciente (opcional)
-driver = None
-try:
-    # Conectar con las credenciales proporcionadas
-    driver = GraphDatabase.driver(NEO4J_URI, auth=("neo4j", "test12345"))
-    # Verificar conexión
-    with driver.session() as session:
-        session.run("RETURN 1")
-    print("Conexión exitosa a Neo4j")
-            
-    if driver is None:
+        print(f"Error al configurar Neo4j: {str(e)}")
         print("No se pudo conectar a Neo4j - la funcionalidad de red social estará deshabilitada")
-        
-except Exception as e:
-    print(f"Error al configurar Neo4j: {str(e)}")
-    driver = None
+        return None
+
+def cerrar_conexiones() -> None:
+    """Cierra los clientes abiertos; la próxima llamada vuelve a conectar."""
+    global _mongo_client, _redis_client, _driver, _driver_inicializado, _grafo
+    with _lock:
+        if _mongo_client is not None:
+            _mongo_client.close()
+        if _redis_client is not None:
+            _redis_client.close()
+        if _driver is not None:
+            _driver.close()
+        _mongo_client = _redis_client = _driver = _grafo = None
+        _driver_inicializado = False
+        _colecciones.clear()
+        for nombre in _ATRIBUTOS_PEREZOSOS:
+            globals().pop(nombre, None)
+
+# Atributos del módulo que se resuelven al primer acceso (db.pacientes,
+# db.redis_client, db.driver, ...) para no romper a los módulos que los usan.
+_ATRIBUTOS_PEREZOSOS: Dict[str, Callable[[], Any]] = {
+    "mongo_client": get_mongo_client,
+    "db": get_database,
+    "pacientes": lambda: get_collection("pacientes"),
+    "turnos": lambda: get_collection("turnos"),
+    "habitos": lambda: get_collection("habitos"),
+    "redis_client": get_redis,
+    "driver": get_driver,
+    "grafo": get_grafo,
+}
+
+def __getattr__(nombre: str) -> Any:
+    fabrica = _ATRIBUTOS_PEREZOSOS.get(nombre)
+    if fabrica is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+    valor = fabrica()
+    globals()[nombre] = valor
+    return valor
 
 # Helpers de MongoDB
-def insert_one(collection: Collection, document: Dict) -> str:
+def insert_one(collection: "Collection", document: Dict) -> str:
     result = collection.insert_one(document)
     return str(result.inserted_id)
 
-def update_one(collection: Collection, query: Dict, update: Dict) -> bool:
+def update_one(collection: "Collection", query: Dict, update: Dict) -> bool:
     result = collection.update_one(query, update)
     return result.modified_count > 0
 
-def find_one(collection: Collection, query: Dict) -> Optional[Dict]:
-    return collection.find_one(query)
+def insert_many(collection: "Collection", documents: List[Dict]) -> Tuple[int, List[Dict]]:
+    """Inserción desordenada: devuelve (insertados, errores por documento).
 
-def find(collection: Collection, query: Dict) -> Cursor:
+    Cada error trae `index` (posición en `documents`), `code` y `errmsg`.
+    """
+    from pymongo.errors import BulkWriteError
+    if not documents:
+        return 0, []
+    try:
+        result = collection.insert_many(documents, ordered=False)
+        return len(result.inserted_ids), []
+    except BulkWriteError as e:
+        return e.details.get("nInserted", 0), e.details.get("writeErrors", [])
+
+def es_clave_duplicada(error: Exception) -> bool:
+    """True si el error de MongoDB es por un índice único (E11000)."""
+    return getattr(error, "code", None) == 11000
+
+def find_one(collection: "Collection", query: Dict, projection: Optional[Dict] = None) -> Optional[Dict]:
+    return collection.find_one(query, projection)
+
+def find(collection: "Collection", query: Dict) -> "Cursor":
     return collection.find(query)
 
+# Caché de lectura de usuarios: todos los flujos que buscan un paciente o
+# médico por DNI pasan por acá. Las escrituras sobre pacientes deben llamar a
+# invalidar_usuario. Los documentos devueltos se comparten: no modificarlos.
+usuarios_cache = CacheLRU(CACHE_USUARIOS_CAPACIDAD, CACHE_USUARIOS_TTL)
+# La historia clínica no se usa en estos flujos (ver historia_clinica)
+PROYECCION_USUARIO = {"historiaClinica": 0}
+# Lo que se puede mostrar de un usuario referenciado (por ejemplo el médico de un turno)
+CAMPOS_PUBLICOS_USUARIO = ("dni", "nombre", "apellido", "mail", "telefono", "rol")
+
+def usuario_publico(usuario: Dict) -> Dict:
+    return {c: usuario[c] for c in CAMPOS_PUBLICOS_USUARIO if c in usuario}
+
+def _usuario_desde_redis(dni: str) -> Optional[Dict]:
+    try:
+        valor = get_redis().get(f"cache:usuario:{dni}")
+    except redis.RedisError:
+        return None
+    if not valor:
+        return None
+    from bson import json_util
+    return json_util.loads(valor)
+
+def _usuario_a_redis(dni: str, usuario: Dict) -> None:
+    from bson import json_util
+    try:
+        get_redis().setex(f"cache:usuario:{dni}", CACHE_USUARIOS_TTL, json_util.dumps(usuario))
+    except redis.RedisError:
+        pass
+
+def find_usuario(dni: str) -> Optional[Dict]:
+    """Busca un usuario por DNI pasando por la caché (no guarda ausencias)."""
+    usuario = usuarios_cache.obtener(dni)
+    if usuario is not None:
+        return usuario
+    if CACHE_USUARIOS_REDIS:
+        usuario = _usuario_desde_redis(dni)
+    if usuario is None:
+        usuario = find_one(get_collection("pacientes"), {"dni": dni}, PROYECCION_USUARIO)
+        if usuario is None:
+            return None
+        if CACHE_USUARIOS_REDIS:
+            _usuario_a_redis(dni, usuario)
+    usuarios_cache.guardar(dni, usuario)
+    return usuario
+
+def find_usuarios(dnis: List[str]) -> Dict[str, Dict]:
+    """Busca muchos usuarios por DNI: caché primero y un único $in para el resto."""
+    encontrados: Dict[str, Dict] = {}
+    faltantes = []
+    for dni in dict.fromkeys(dnis):
+        usuario = usuarios_cache.obtener(dni)
+        if usuario is None:
+            faltantes.append(dni)
+        else:
+            encontrados[dni] = usuario
+    if faltantes:
+        for usuario in get_collection("pacientes").find({"dni": {"$in": faltantes}}, PROYECCION_USUARIO):
+            usuarios_cache.guardar(usuario["dni"], usuario)
+            encontrados[usuario["dni"]] = usuario
+    return encontrados
+
+def hidratar_referencias(
+    documentos: List[Dict],
+    campo: str,
+    destino: str,
+    collection: Optional["Collection"] = None,
+    clave: str = "dni",
+    proyeccion: Optional[Dict] = None
+) -> List[Dict]:
+    """Resuelve la referencia `campo` de cada documento con una sola consulta.
+
+    Guarda el documento referenciado (o None) en `destino`. Sin `collection`
+    se resuelven usuarios de pacientes, por DNI a través de la caché, y solo
+    con sus campos públicos (CAMPOS_PUBLICOS_USUARIO: nunca la contraseña).
+    """
+    valores = list({d[campo] for d in documentos if d.get(campo) is not None})
+    if collection is None:
+        if clave == "dni":
+            referencias = {dni: usuario_publico(u) for dni, u in find_usuarios(valores).items()}
+        else:
+            referencias = {r[clave]: r for r in get_collection("pacientes").find(
+                {clave: {"$in": valores}}, proyeccion or {c: 1 for c in CAMPOS_PUBLICOS_USUARIO + (clave,)})}
+    elif valores:
+        referencias = {r[clave]: r for r in collection.find({clave: {"$in": valores}}, proyeccion)}
+    else:
+        referencias = {}
+    for d in documentos:
+        d[destino] = referencias.get(d.get(campo))
+    return documentos
+
+def invalidar_usuario(dni: str) -> None:
+    usuarios_cache.invalidar(dni)
+    if CACHE_USUARIOS_REDIS:
+        try:
+            get_redis().delete(f"cache:usuario:{dni}")
+        except redis.RedisError:
+            pass
+
+def estadisticas_cache() -> Dict:
+    return usuarios_cache.estadisticas()
+
 # Helpers de Redis
+# `acceso:{dni}` es la marca de sesión de la consola (y del alta); guarda un
+# secreto al azar que nadie presenta. Las sesiones HTTP van aparte, en
+# `sesion:{dni}:{secreto}`: el token solo lo conoce quien hizo el login.
+def _secreto() -> str:
+    return secrets.token_urlsafe(24)
+
 def set_access_token(dni: str) -> bool:
     try:
-        redis_client.setex(f"acceso:{dni}", ACCESO_TTL, "activo")
+        get_redis().setex(f"acceso:{dni}", ACCESO_TTL, _secreto())
         return True
     except redis.RedisError:
         return False
 
 def set_reminder(dni: str, fecha: str, mensaje: str) -> bool:
     try:
-        redis_client.setex(f"recordatorio:{dni}:{fecha}", RECORDATORIO_TTL, mensaje)
+        get_redis().setex(f"recordatorio:{dni}:{fecha}", RECORDATORIO_TTL, mensaje)
         return True
     except redis.RedisError:
         return False
 
 def check_access(dni: str) -> bool:
     try:
-        return bool(redis_client.get(f"acceso:{dni}"))
+        return bool(get_redis().get(f"acceso:{dni}"))
+    except redis.RedisError:
+        return False
+
+def set_session_token(dni: str) -> Optional[str]:
+    """Abre una sesión HTTP y devuelve su secreto (None si Redis no responde)."""
+    secreto = _secreto()
+    try:
+        get_redis().setex(f"sesion:{dni}:{secreto}", ACCESO_TTL, 1)
+        return secreto
+    except redis.RedisError:
+        return None
+
+def check_session_token(dni: str, secreto: str) -> bool:
+    """Verifica que la sesión HTTP exista y no haya vencido."""
+    try:
+        return bool(get_redis().exists(f"sesion:{dni}:{secreto}"))
+    except redis.RedisError:
+        return False
+
+def revoke_session_token(dni: str, secreto: str) -> bool:
+    try:
+        return bool(get_redis().delete(f"sesion:{dni}:{secreto}"))
+    except redis.RedisError:
+        return False
+
+def revoke_access(dni: str) -> bool:
+    try:
+        return bool(get_redis().delete(f"acceso:{dni}"))
     except redis.RedisError:
         return False
 
 def get_access_ttl(dni: str) -> Optional[int]:
     try:
-        ttl = redis_client.ttl(f"acceso:{dni}")
-        # Redis devuelve -2 si la llave no existe, -1 si existe sin TTL
-        if ttl is None or ttl < 0:
-            return None
-        return int(ttl)
+        return _normalizar_ttl(get_redis().ttl(f"acceso:{dni}"))
     except redis.RedisError:
         return None
 
 def get_reminder(dni: str, fecha: str) -> Optional[str]:
     try:
-        value = redis_client.get(f"recordatorio:{dni}:{fecha}")
+        value = get_redis().get(f"recordatorio:{dni}:{fecha}")
         return value.decode('utf-8') if value else None
     except redis.RedisError:
         return None
 
+# Operaciones de Redis en lote: una sola ida y vuelta por pipeline en lugar de
+# una por llave. Los lotes grandes se parten para no armar buffers enormes.
+PIPELINE_LOTE = 1000
+
+def _ejecutar_en_lotes(comandos: List[Tuple[str, tuple]], transaction: bool = False) -> List[Any]:
+    """Ejecuta comandos (nombre, argumentos) en pipelines de PIPELINE_LOTE."""
+    resultados: List[Any] = []
+    for i in range(0, len(comandos), PIPELINE_LOTE):
+        pipe = get_redis().pipeline(transaction=transaction)
+        for nombre, args in comandos[i:i + PIPELINE_LOTE]:
+            getattr(pipe, nombre)(*args)
+        resultados.extend(pipe.execute())
+    return resultados
+
+def _normalizar_ttl(ttl: Optional[int]) -> Optional[int]:
+    # Redis devuelve -2 si la llave no existe, -1 si existe sin TTL
+    if ttl is None or ttl < 0:
+        return None
+    return int(ttl)
+
+def set_access_token_with_ttl(dni: str) -> Optional[int]:
+    """Crea el token de acceso y devuelve su TTL en una sola ida y vuelta (MULTI)."""
+    try:
+        pipe = get_redis().pipeline(transaction=True)
+        pipe.setex(f"acceso:{dni}", ACCESO_TTL, _secreto())
+        pipe.ttl(f"acceso:{dni}")
+        _, ttl = pipe.execute()
+        return _normalizar_ttl(ttl)
+    except redis.RedisError:
+        return None
+
+def set_access_tokens(dnis: List[str]) -> bool:
+    try:
+        _ejecutar_en_lotes([("setex", (f"acceso:{dni}", ACCESO_TTL, _secreto())) for dni in dnis])
+        return True
+    except redis.RedisError:
+        return False
+
+def check_access_many(dnis: List[str]) -> Dict[str, bool]:
+    try:
+        valores: List[Any] = []
+        for i in range(0, len(dnis), PIPELINE_LOTE):
+            valores.extend(get_redis().mget([f"acceso:{d}" for d in dnis[i:i + PIPELINE_LOTE]]))
+        return {dni: bool(v) for dni, v in zip(dnis, valores)}
+    except redis.RedisError:
+        return {dni: False for dni in dnis}
+
+def get_access_ttls(dnis: List[str]) -> Dict[str, Optional[int]]:
+    try:
+        ttls = _ejecutar_en_lotes([("ttl", (f"acceso:{dni}",)) for dni in dnis])
+        return {dni: _normalizar_ttl(t) for dni, t in zip(dnis, ttls)}
+    except redis.RedisError:
+        return {dni: None for dni in dnis}
+
+def set_reminders(recordatorios: List[Tuple[str, str, str]]) -> bool:
+    """Guarda muchos recordatorios (dni, fecha, mensaje) en pipelines."""
+    try:
+        _ejecutar_en_lotes([
+            ("setex", (f"recordatorio:{dni}:{fecha}", RECORDATORIO_TTL, mensaje))
+            for dni, fecha, mensaje in recordatorios
+        ])
+        return True
+    except redis.RedisError:
+        return False
+
+def get_reminders(claves: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Optional[str]]:
+    """Lee muchos recordatorios a partir de pares (dni, fecha)."""
+    try:
+        valores: List[Any] = []
+        for i in range(0, len(claves), PIPELINE_LOTE):
+            valores.extend(get_redis().mget(
+                [f"recordatorio:{d}:{f}" for d, f in claves[i:i + PIPELINE_LOTE]]
+            ))
+        return {c: v.decode('utf-8') if v else None for c, v in zip(claves, valores)}
+    except redis.RedisError:
+        return {c: None for c in claves}
+
 # Simulación de envío de emails
 def simular_email(to_email: str, subject: str, body: str) -> None:
     print(f"\n Simulación de Email:")
     print(f"Para: {to_email}")
     print(f"Asunto: {subject}")
     print(f"Mensaje: {body}\n")
+
+def simular_emails(emails: List[Tuple[str, str, str]]) -> None:
+    """Envía en una sola tanda una cola de emails (destinatario, asunto, cuerpo)."""
+    for to_email, subject, body in emails:
+        simular_email(to_email, subject, body)
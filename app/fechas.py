@@ -0,0 +1,56 @@
+"""Conversión de fechas entre el formato de texto histórico y datetime.
+
+Los turnos y hábitos guardan `fecha`/`creado`/`timestamp` como datetime (BSON
+date). Los documentos anteriores a la migración las tienen como texto; estas
+funciones aceptan ambos formatos para que el código funcione durante la
+transición (ver migraciones.migrar_fechas).
+"""
+from datetime import date, datetime, timedelta
+from typing import Optional, Union
+
+FORMATO_FECHA = "%Y-%m-%d"
+FORMATO_FECHA_HORA = "%Y-%m-%d %H:%M"
+_FORMATOS = ["%Y-%m-%d %H:%M:%S", FORMATO_FECHA_HORA, FORMATO_FECHA]
+
+def a_datetime(valor: Union[str, date, datetime, None]) -> Optional[datetime]:
+    """Convierte texto o date a datetime. Lanza ValueError si el texto no es una fecha."""
+    if valor is None or isinstance(valor, datetime):
+        return valor
+    if isinstance(valor, date):
+        return datetime(valor.year, valor.month, valor.day)
+    texto = str(valor).strip()
+    for formato in _FORMATOS:
+        try:
+            return datetime.strptime(texto, formato)
+        except ValueError:
+            continue
+    raise ValueError(f"Fecha inválida: {valor!r}")
+
+def a_fecha_hora(valor: Union[str, datetime]) -> datetime:
+    """Como a_datetime pero exige la hora (turnos): ValueError si falta o no es una fecha."""
+    if isinstance(valor, datetime):
+        return valor
+    if not isinstance(valor, str):
+        raise ValueError(f"Fecha y hora inválidas: {valor!r}")
+    texto = valor.strip()
+    for formato in _FORMATOS[:2]:
+        try:
+            return datetime.strptime(texto, formato)
+        except ValueError:
+            continue
+    raise ValueError(f"Fecha y hora inválidas (YYYY-MM-DD HH:MM): {valor!r}")
+
+def inicio_del_dia(valor: Union[str, date, datetime, None] = None) -> datetime:
+    """Medianoche del día indicado (hoy si no se indica)."""
+    fecha = a_datetime(valor) if valor is not None else datetime.now()
+    return fecha.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def rango_del_dia(valor: Union[str, date, datetime]) -> dict:
+    """Filtro de MongoDB para todo el día indicado."""
+    inicio = inicio_del_dia(valor)
+    return {"$gte": inicio, "$lt": inicio + timedelta(days=1)}
+
+def formatear(valor: Union[str, datetime, None], formato: str = FORMATO_FECHA_HORA) -> str:
+    if isinstance(valor, datetime):
+        return valor.strftime(formato)
+    return "" if valor is None else str(valor)
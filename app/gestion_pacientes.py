@@ -1,7 +1,13 @@
 import datetime
 import json
+import logging
 from typing import Dict, Optional, List
 import db
+import fechas
+import historia_clinica
+from gestion_turnos import inicializar_riesgo, riesgo_inicial, sumar_entrada_riesgo
+
+log = logging.getLogger(__name__)
 
 def validar_paciente(data: Dict) -> bool:
     """Valida que un diccionario tenga todos los campos requeridos para un paciente/médico."""
@@ -46,19 +52,32 @@ def guardar_paciente(data: Dict) -> Optional[str]:
     if not validar_paciente(data):
         print("Datos inválidos")
         return None
+    # Se guarda el rol normalizado: los controles de acceso comparan "medico" exacto
+    data["rol"] = str(data["rol"]).strip().lower()
 
     try:
         # Verificar si ya existe
-        if db.find_one(db.pacientes, {"dni": data["dni"]}):
+        if db.find_usuario(data["dni"]):
             print(f"Ya existe un usuario con DNI {data['dni']}")
             return None
             
         # Hash de la contraseña antes de guardar
         password = data["password"]
         data["password"] = db.hash_password(password)
+        # La historia clínica se guarda en buckets aparte, no en el documento del paciente.
+        # Las entradas se arman (y sus fechas se validan) antes de insertar al paciente
+        historia = [
+            historia_clinica.nueva_entrada(hc.get("diagnostico", ""), hc.get("tratamiento", ""),
+                                           fechas.a_datetime(hc.get("fecha")))
+            for hc in data.pop("historiaClinica")
+        ]
+        data["riesgo"] = riesgo_inicial([hc["diagnostico"] for hc in historia], [hc["id"] for hc in historia])
         
         # Insertar en MongoDB
         _id = db.insert_one(db.pacientes, data)
+        db.invalidar_usuario(data["dni"])
+        if historia:
+            historia_clinica.agregar_entradas(data["dni"], historia)
         
         # Establecer acceso en Redis
         db.set_access_token(data["dni"])
@@ -71,28 +90,29 @@ def guardar_paciente(data: Dict) -> Optional[str]:
         return None
 
 def actualizar_historia_clinica(dni: str, diagnostico: str, tratamiento: str) -> bool:
-    entrada = {
-        "fecha": datetime.datetime.now().strftime("%Y-%m-%d"),
-        "diagnostico": diagnostico,
-        "tratamiento": tratamiento
-    }
-    
-    result = db.update_one(
-        db.pacientes,
-        {"dni": dni},
-        {"$push": {"historiaClinica": entrada}}
-    )
-    
-    if result:
-        print(f"Historia clínica actualizada para DNI {dni}")
-        return True
-    else:
+    # Pacientes sin `riesgo` (anteriores al puntaje incremental): se inicializa
+    # antes de agregar la entrada para no contarla dos veces
+    if inicializar_riesgo(dni) is None:
         print(f"No se pudo actualizar la historia clínica para DNI {dni}")
         return False
 
+    entrada = historia_clinica.nueva_entrada(diagnostico, tratamiento)
+    historia_clinica.agregar_entrada(dni, entrada)
+
+    # Sumar al puntaje solo lo que aporta la nueva entrada. Si falla, la entrada
+    # ya está guardada: la evaluación en lote la cuenta
+    try:
+        sumar_entrada_riesgo(dni, entrada)
+    except Exception:
+        log.exception("No se actualizó el riesgo de %s (lo corrige riesgo_lote.py)", dni)
+    db.invalidar_usuario(dni)
+
+    print(f"Historia clínica actualizada para DNI {dni}")
+    return True
+
 def consultar_paciente(dni: str) -> Optional[Dict]:
     
-    paciente = db.find_one(db.pacientes, {"dni": dni})
+    paciente = db.find_usuario(dni)
     if not paciente:
         print("Paciente no encontrado")
         return None
@@ -100,6 +120,14 @@ def consultar_paciente(dni: str) -> Optional[Dict]:
     # Imprimir paciente completo
     print(json.dumps(paciente, default=str, indent=2))
 
+    # Últimas entradas de la historia clínica (el resto con historia_clinica.leer_historia)
+    historia = historia_clinica.leer_historia(dni)
+    if historia:
+        print("\nHistoria clínica (últimas entradas):")
+        for hc in historia:
+            print(f" - {fechas.formatear(hc.get('fecha'), fechas.FORMATO_FECHA)}: "
+                  f"{hc.get('diagnostico')} ({hc.get('tratamiento')})")
+
     # Consultar y mostrar turnos asociados al paciente
     try:
         turnos = list(db.turnos.find({"dni": dni}))
@@ -107,11 +135,15 @@ def consultar_paciente(dni: str) -> Optional[Dict]:
             print("\nNo hay turnos asignados a este paciente")
         else:
             print(f"\nTurnos asignados al paciente (DNI {dni}):")
+            db.hidratar_referencias(turnos, "medico_dni", "medico")
             for t in turnos:
                 # Incluir información completa del turno
                 print("------------------------------")
+                medico = t.pop("medico")
                 for k, v in t.items():
                     print(f"{k}: {v}")
+                if medico:
+                    print(f"medico: {medico.get('nombre')} {medico.get('apellido', '')}".rstrip())
             print("------------------------------")
     except Exception as e:
         print(f"Error al consultar turnos del paciente: {e}")
@@ -1,6 +1,12 @@
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 import db
+import fechas
+import coincidencias
+import historia_clinica
+import agenda
+import recordatorios
+import notificaciones
 
 def validar_turno(data: Dict) -> bool:
     campos = ["dni", "fecha", "especialidad", "medico_dni"]
@@ -8,7 +14,8 @@ def validar_turno(data: Dict) -> bool:
         return False
         
     try:
-        fecha_turno = datetime.strptime(data["fecha"], "%Y-%m-%d %H:%M")
+        # Fecha y hora: un turno sin hora no es un turno a medianoche
+        fecha_turno = fechas.a_fecha_hora(data["fecha"])
         if fecha_turno < datetime.now():
             return False
     except ValueError:
@@ -18,10 +25,10 @@ def validar_turno(data: Dict) -> bool:
 
 def registrar_turno(dni: str, fecha: str, especialidad: str, medico_dni: str) -> Optional[str]:
     # Verificar que existan paciente y médico
-    paciente = db.find_one(db.pacientes, {"dni": dni, "rol": "paciente"})
-    medico = db.find_one(db.pacientes, {"dni": medico_dni, "rol": "medico"})
+    paciente = db.find_usuario(dni)
+    medico = db.find_usuario(medico_dni)
     
-    if not paciente or not medico:
+    if not paciente or paciente.get("rol") != "paciente" or not medico or medico.get("rol") != "medico":
         print("Paciente o médico no encontrado")
         return None
         
@@ -31,68 +38,151 @@ def registrar_turno(dni: str, fecha: str, especialidad: str, medico_dni: str) ->
         "especialidad": especialidad,
         "medico_dni": medico_dni,
         "estado": "programado",
-        "creado": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        "creado": datetime.now()
     }
     
     if not validar_turno(turno):
         print("Datos del turno inválidos")
         return None
+    # Guardar la fecha como datetime para ordenar y filtrar por rango con índices
+    turno["fecha"] = fechas.a_datetime(fecha)
+    fecha = fechas.formatear(turno["fecha"])
 
     try:
-        # Guardar en MongoDB
-        _id = db.insert_one(db.turnos, turno)
+        # Guardar en MongoDB si el médico y el paciente tienen el horario libre
+        _id = agenda.reservar(turno)
+        if not _id:
+            return None
         
-        # Configurar recordatorio en Redis
+        # Programar el recordatorio para ANTICIPACION antes del turno
         mensaje = (f"Recordatorio: Turno de {especialidad}\n"
                   f"Fecha: {fecha}\n"
                   f"Dr/a. {medico['nombre']}")
         
-        db.set_reminder(dni, fecha, mensaje)
+        recordatorios.programar(_id, dni, turno["fecha"], mensaje)
         
-        # Simular email de confirmación
-        db.simular_email(
+        # Encolar el email de confirmación
+        notificaciones.encolar(
             paciente["mail"],
             "Turno Médico Confirmado",
-            mensaje
+            mensaje,
+            clave=f"turno:{_id}:confirmado"
         )
         
         print(f"Turno registrado exitosamente")
-        print(f"Recordatorio configurado para 10 minutos antes")
+        print(f"Recordatorio programado para {recordatorios.ANTICIPACION.seconds // 60} minutos antes")
         return _id
         
     except Exception as e:
         print(f"Error al registrar turno: {str(e)}")
         return None
 
+# Puntaje a partir del cual se envía la alerta médica
+RIESGO_ALTO = 7
+
+def email_alerta_riesgo(paciente: Dict, score: int) -> Tuple[str, str, str]:
+    """(destinatario, asunto, cuerpo) de la alerta por riesgo alto."""
+    return (
+        paciente["mail"],
+        "Alerta Médica - Riesgo Detectado",
+        f"Estimado/a {paciente['nombre']},\n\n"
+        f"Se ha detectado un nivel de riesgo alto en su perfil médico.\n"
+        f"Por favor, contacte a su médico de cabecera a la brevedad.\n\n"
+        f"Nivel de Riesgo: {score}/10\n"
+        f"Recomendación: Solicitar turno urgente para evaluación completa."
+    )
+
+def clave_termino(termino: str) -> str:
+    """Término usable como clave de `riesgo.contribuciones`.
+
+    MongoDB lee "." como separador de ruta y "$" como operador: se reemplazan
+    por sus variantes de ancho completo, que se ven igual.
+    """
+    return termino.replace(".", "\uff0e").replace("$", "\uff04")
+
+def contribuciones_riesgo(diagnosticos: Iterable[str]) -> Dict[str, int]:
+    """Puntos aportados por cada término de riesgo, sumados sobre los diagnósticos."""
+    contribuciones: Dict[str, int] = {}
+    for diag in diagnosticos:
+        for termino, puntos in coincidencias.puntos_diagnostico(diag).items():
+            clave = clave_termino(termino)
+            contribuciones[clave] = contribuciones.get(clave, 0) + puntos
+    return contribuciones
+
+def puntaje_riesgo(riesgo: Dict) -> int:
+    """Puntaje (0-10) a partir del campo `riesgo` guardado en el paciente."""
+    return min(10, riesgo.get("total", 0))  # Cap at 10
+
+def calcular_riesgo(diagnosticos: Iterable[str]) -> int:
+    """Puntaje de riesgo (0-10) según los diagnósticos de reglas_clinicas.json."""
+    return puntaje_riesgo({"total": sum(contribuciones_riesgo(diagnosticos).values())})
+
+# Ids de entradas ya sumadas que se guardan en `riesgo.aplicadas`
+APLICADAS_MAXIMO = 20
+
+def riesgo_inicial(diagnosticos: List[str], aplicadas: Optional[List[str]] = None) -> Dict:
+    """Campo `riesgo` completo para una historia clínica.
+
+    `aplicadas` son los ids de las entradas más nuevas que ya cuenta.
+    """
+    contribuciones = contribuciones_riesgo(diagnosticos)
+    return {
+        "total": sum(contribuciones.values()),
+        "contribuciones": contribuciones,
+        "entradas": len(diagnosticos),
+        "aplicadas": list(aplicadas or [])[-APLICADAS_MAXIMO:],
+        "calculado": datetime.now(),
+    }
+
+def _diagnosticos_paciente(paciente: Dict, dni: str) -> List[str]:
+    # Incluye historias todavía no migradas a buckets
+    return ([hc.get("diagnostico", "") for hc in paciente.get("historiaClinica", [])]
+            + historia_clinica.diagnosticos(dni))
+
+def inicializar_riesgo(dni: str) -> Optional[Dict]:
+    """Calcula y guarda `riesgo` para pacientes anteriores a ese campo.
+
+    Solo escribe si el campo todavía no existe.
+    """
+    paciente = db.find_one(db.pacientes, {"dni": dni}, {"_id": 0, "dni": 1, "riesgo": 1, "historiaClinica.diagnostico": 1})
+    if not paciente:
+        return None
+    if "riesgo" in paciente:
+        return paciente["riesgo"]
+    riesgo = riesgo_inicial(_diagnosticos_paciente(paciente, dni))
+    db.update_one(db.pacientes, {"dni": dni, "riesgo": {"$exists": False}}, {"$set": {"riesgo": riesgo}})
+    return riesgo
+
+def sumar_entrada_riesgo(dni: str, entrada: Dict) -> bool:
+    """Suma al `riesgo` guardado solo lo que aporta una entrada nueva.
+
+    El id de la entrada queda en `riesgo.aplicadas` y la condición $ne hace que
+    repetirlo no la cuente dos veces. riesgo_lote guarda ahí los ids de las
+    entradas más nuevas que leyó, así que tampoco se suma una entrada que la
+    evaluación en lote ya contó. Devuelve False si no había nada que sumar.
+    """
+    contribuciones = contribuciones_riesgo([entrada["diagnostico"]])
+    inc = {f"riesgo.contribuciones.{k}": v for k, v in contribuciones.items()}
+    inc.update({"riesgo.total": sum(contribuciones.values()), "riesgo.entradas": 1})
+    return db.update_one(
+        db.pacientes,
+        {"dni": dni, "riesgo.aplicadas": {"$ne": entrada["id"]}},
+        {"$inc": inc, "$push": {"riesgo.aplicadas": {"$each": [entrada["id"]], "$slice": -APLICADAS_MAXIMO}}},
+    )
+
 def evaluar_riesgo(dni: str) -> Optional[int]:
     
-    paciente = db.find_one(db.pacientes, {"dni": dni})
+    # El puntaje se mantiene en el documento: se lee solo ese campo
+    paciente = db.find_one(db.pacientes, {"dni": dni}, {"_id": 0, "nombre": 1, "mail": 1, "riesgo": 1})
     if not paciente:
         print("Paciente no encontrado")
         return None
 
-    score = 0
-    diagnosticos_riesgo = {
-        "hipertension": 2,
-        "diabetes": 3,
-        "obesidad": 2,
-        "cardio": 2,
-        "cancer": 3,
-        "fiebre alta": 1,
-        "dificultad respirar": 2,
-        "angina": 1
-    }
-
-    for hc in paciente.get("historiaClinica", []):
-        diag = hc.get("diagnostico", "").lower()
-        for keyword, points in diagnosticos_riesgo.items():
-            if keyword in diag:
-                score += points
-
-    score = min(10, score)  # Cap at 10
+    riesgo = paciente.get("riesgo") or inicializar_riesgo(dni)
+    score = puntaje_riesgo(riesgo)
     
     mensaje = ""
-    if score >= 7:
+    if score >= RIESGO_ALTO:
         mensaje = "RIESGO ALTO - Se requiere atención inmediata"
     elif score >= 4:
         mensaje = "RIESGO MEDIO - Se recomienda chequeo preventivo"
@@ -104,16 +194,8 @@ def evaluar_riesgo(dni: str) -> Optional[int]:
     print(mensaje)
 
     # Si el riesgo es alto, enviar alerta
-    if score >= 7:
-        db.simular_email(
-            paciente["mail"],
-            "Alerta Médica - Riesgo Detectado",
-            f"Estimado/a {paciente['nombre']},\n\n"
-            f"Se ha detectado un nivel de riesgo alto en su perfil médico.\n"
-            f"Por favor, contacte a su médico de cabecera a la brevedad.\n\n"
-            f"Nivel de Riesgo: {score}/10\n"
-            f"Recomendación: Solicitar turno urgente para evaluación completa."
-        )
+    if score >= RIESGO_ALTO:
+        notificaciones.encolar(*email_alerta_riesgo(paciente, score))
 
     return score
 
@@ -127,14 +209,43 @@ def consultar_turnos_paciente(dni: str) -> List[Dict]:
     if not turnos:
         print("No se encontraron turnos")
     else:
+        # Resolver todos los médicos en una sola consulta
+        db.hidratar_referencias(turnos, "medico_dni", "medico")
         for t in turnos:
-            medico = db.find_one(db.pacientes, {"dni": t["medico_dni"]})
+            medico = t["medico"]
             print(f"\n Turno {t['especialidad']}")
-            print(f"Fecha: {t['fecha']}")
+            print(f"Fecha: {fechas.formatear(t['fecha'])}")
             print(f"Médico: {medico['nombre'] if medico else 'No disponible'}")
             
     return turnos
 
+def programar_recordatorios_dia(dia: str) -> int:
+    """Programa en un solo lote los recordatorios de todos los turnos de un día (YYYY-MM-DD).
+
+    Los que ya estaban programados o enviados no se repiten; devuelve los nuevos.
+    """
+    turnos = list(db.turnos.find(
+        {"fecha": fechas.rango_del_dia(dia), "estado": "programado"},
+        {"dni": 1, "fecha": 1, "especialidad": 1, "medico_dni": 1}
+    ))
+    if not turnos:
+        return 0
+
+    db.hidratar_referencias(turnos, "medico_dni", "medico")
+    pendientes = []
+    for t in turnos:
+        medico = t["medico"] or {}
+        mensaje = (f"Recordatorio: Turno de {t['especialidad']}\n"
+                  f"Fecha: {fechas.formatear(t['fecha'])}\n"
+                  f"Dr/a. {medico.get('nombre', 'No disponible')}")
+        pendientes.append((str(t["_id"]), t["dni"], t["fecha"], mensaje))
+
+    nuevos = recordatorios.programar_muchos(pendientes)
+    if nuevos < 0:
+        print("No se pudieron programar los recordatorios en Redis")
+        return 0
+    return nuevos
+
 if __name__ == "__main__":
     # Ejemplo: registrar turno
     turno_id = registrar_turno(
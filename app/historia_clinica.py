@@ -0,0 +1,168 @@
+"""Historia clínica guardada en buckets fuera del documento del paciente.
+
+Cada documento de `historia_clinica` agrupa hasta TAMANIO_BUCKET entradas de
+un paciente:
+
+    {"dni", "cantidad", "desde", "hasta", "entradas": [{id, fecha, diagnostico, tratamiento}]}
+
+Así el documento del paciente no crece con la historia y las búsquedas por
+DNI (login, turnos, hábitos) no la traen. Las historias anteriores, guardadas
+en `pacientes.historiaClinica`, se mueven con migrar_historias.
+"""
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import db
+import fechas
+
+TAMANIO_BUCKET = 50
+
+def _coleccion():
+    return db.get_collection("historia_clinica")
+
+def nueva_entrada(diagnostico: str, tratamiento: str, fecha: Optional[datetime] = None) -> Dict:
+    return {
+        # Identifica la entrada en riesgo.aplicadas (gestion_turnos.sumar_entrada_riesgo)
+        "id": uuid.uuid4().hex,
+        "fecha": fecha or datetime.now(),
+        "diagnostico": diagnostico,
+        "tratamiento": tratamiento
+    }
+
+def agregar_entrada(dni: str, entrada: Dict) -> None:
+    """Agrega la entrada al bucket abierto del paciente o abre uno nuevo (upsert)."""
+    _coleccion().update_one(
+        {"dni": dni, "cantidad": {"$lt": TAMANIO_BUCKET}},
+        {
+            "$push": {"entradas": entrada},
+            "$inc": {"cantidad": 1},
+            "$min": {"desde": entrada["fecha"]},
+            "$max": {"hasta": entrada["fecha"]},
+        },
+        upsert=True,
+    )
+
+def _buckets(dni: str, entradas: List[Dict], clave: Optional[str] = None) -> List[Dict]:
+    buckets = []
+    for n, i in enumerate(range(0, len(entradas), TAMANIO_BUCKET)):
+        parte = entradas[i:i + TAMANIO_BUCKET]
+        fechas_parte = [e["fecha"] for e in parte if e.get("fecha") is not None]
+        bucket = {
+            "dni": dni,
+            "cantidad": len(parte),
+            "desde": min(fechas_parte, default=None),
+            "hasta": max(fechas_parte, default=None),
+            "entradas": parte,
+        }
+        if clave:
+            # _id determinista para que repetir una migración no duplique buckets
+            bucket["_id"] = f"{clave}:{n}"
+        buckets.append(bucket)
+    return buckets
+
+def agregar_entradas(dni: str, entradas: List[Dict], clave: Optional[str] = None) -> int:
+    """Guarda muchas entradas de un paciente en buckets completos (alta o migración)."""
+    insertados, _ = db.insert_many(_coleccion(), _buckets(dni, entradas, clave))
+    return insertados
+
+def agregar_historias(historias: Dict[str, List[Dict]]) -> int:
+    """Guarda las historias de muchos pacientes con un solo insert_many."""
+    buckets = [b for dni, entradas in historias.items() for b in _buckets(dni, entradas)]
+    insertados, _ = db.insert_many(_coleccion(), buckets)
+    return insertados
+
+def leer_historia(dni: str, pagina: int = 1, tamanio: int = 20) -> List[Dict]:
+    """Página de la historia clínica, de la entrada más nueva a la más vieja.
+
+    Primero se leen solo los contadores de los buckets para traer únicamente
+    los que contienen la página pedida.
+    """
+    inicio = (pagina - 1) * tamanio
+    fin = inicio + tamanio
+    orden = [("hasta", -1), ("_id", -1)]
+    necesarios = []
+    omitidas = 0  # entradas de los buckets más nuevos que la página
+    acumulado = 0
+    for b in _coleccion().find({"dni": dni}, {"cantidad": 1}, sort=orden):
+        if acumulado + b["cantidad"] <= inicio:
+            omitidas += b["cantidad"]
+        else:
+            necesarios.append(b["_id"])
+        acumulado += b["cantidad"]
+        if acumulado >= fin:
+            break
+    if not necesarios:
+        return []
+
+    entradas: List[Dict] = []
+    for b in _coleccion().find({"_id": {"$in": necesarios}}, {"entradas": 1}, sort=orden):
+        entradas.extend(reversed(b["entradas"]))
+    return entradas[inicio - omitidas:fin - omitidas]
+
+def diagnosticos(dni: str) -> List[str]:
+    """Todos los diagnósticos del paciente (solo ese campo de cada entrada)."""
+    return [
+        e.get("diagnostico", "")
+        for b in _coleccion().find({"dni": dni}, {"_id": 0, "entradas.diagnostico": 1})
+        for e in b.get("entradas", [])
+    ]
+
+def diagnosticos_por_paciente(dnis: List[str], recientes: int = 0) -> Dict[str, Tuple[List[str], List[str]]]:
+    """Diagnósticos de muchos pacientes con una sola consulta $in.
+
+    Junto con los diagnósticos devuelve los ids de las `recientes` entradas
+    más nuevas de cada paciente (las anteriores a los ids no tienen).
+    """
+    por_paciente: Dict[str, List[str]] = {dni: [] for dni in dnis}
+    con_id: Dict[str, List[Tuple[datetime, str]]] = {dni: [] for dni in dnis}
+    proyeccion = {"_id": 0, "dni": 1, "entradas.diagnostico": 1, "entradas.id": 1, "entradas.fecha": 1}
+    for b in _coleccion().find({"dni": {"$in": dnis}}, proyeccion):
+        for e in b.get("entradas", []):
+            por_paciente[b["dni"]].append(e.get("diagnostico", ""))
+            if e.get("id") and e.get("fecha"):
+                con_id[b["dni"]].append((e["fecha"], e["id"]))
+    resultado = {}
+    for dni in dnis:
+        ids = [i for _, i in sorted(con_id[dni])]
+        resultado[dni] = (por_paciente[dni], ids[-recientes:] if recientes else [])
+    return resultado
+
+def migrar_historias(lote: int = 500) -> Dict:
+    """Mueve `pacientes.historiaClinica` a buckets y quita el arreglo del paciente.
+
+    Los buckets migrados usan _id determinista, así que se puede repetir si se
+    interrumpe a mitad de camino: un bucket ya escrito vuelve como clave
+    duplicada. Con cualquier otro error, o con una fecha que no se entiende,
+    el paciente conserva su historia y se informa en `fallidos`.
+    """
+    pacientes = db.get_collection("pacientes")
+    migrados = 0
+    fallidos: List[Dict] = []
+    ultimo = None
+    while True:
+        # Por _id: los que fallan conservan historiaClinica y no se vuelven a leer
+        filtro: Dict = {"historiaClinica": {"$exists": True}}
+        if ultimo is not None:
+            filtro["_id"] = {"$gt": ultimo}
+        docs = list(pacientes.find(filtro, {"dni": 1, "historiaClinica": 1}, sort=[("_id", 1)], limit=lote))
+        if not docs:
+            break
+        ultimo = docs[-1]["_id"]
+        for doc in docs:
+            try:
+                entradas = [
+                    dict(e, fecha=fechas.a_datetime(e.get("fecha")) if e.get("fecha") else None)
+                    for e in doc.get("historiaClinica") or []
+                ]
+            except ValueError as e:
+                fallidos.append({"dni": doc["dni"], "error": str(e)})
+                continue
+            _, errores = db.insert_many(_coleccion(), _buckets(doc["dni"], entradas, f"migrado:{doc['dni']}"))
+            otros = [e for e in errores if e.get("code") != 11000]
+            if otros:
+                fallidos.append({"dni": doc["dni"], "error": otros[0].get("errmsg")})
+                continue
+            pacientes.update_one({"_id": doc["_id"]}, {"$unset": {"historiaClinica": ""}})
+            db.invalidar_usuario(doc["dni"])
+            migrados += 1
+    return {"migrados": migrados, "fallidos": fallidos}
@@ -0,0 +1,163 @@
+"""Importación masiva de pacientes y médicos desde CSV o JSONL.
+
+    python importacion.py pacientes.csv [--lote 1000] [--procesos N]
+
+Cada fila se valida con validar_paciente, y las entradas de historiaClinica
+(una lista de objetos con fechas válidas) se arman en el mismo paso: una fila
+mal formada se informa como error y no frena el resto. Los DNIs repetidos se descartan
+dentro del archivo y contra MongoDB (un $in por lote). Las contraseñas se
+hashean en un pool de procesos y los documentos se insertan con insert_many
+desordenado. Al final se informa el throughput y los errores por fila.
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+import db
+import fechas
+import historia_clinica
+from gestion_pacientes import validar_paciente
+from gestion_turnos import riesgo_inicial
+
+LOTE = 1000
+
+def leer_registros(ruta: str) -> Iterator[Tuple[int, Union[Dict, str]]]:
+    """Devuelve (número de línea, registro) sin cargar el archivo entero.
+
+    Una línea JSONL que no es un objeto JSON válido llega como el texto del
+    error en lugar del registro, para informarla como las demás filas.
+    """
+    with open(ruta, encoding="utf-8", newline="") as f:
+        if ruta.lower().endswith(".csv"):
+            for linea, fila in enumerate(csv.DictReader(f), start=2):
+                yield linea, {k: v for k, v in fila.items() if v not in (None, "")}
+        else:
+            for linea, texto in enumerate(f, start=1):
+                if not texto.strip():
+                    continue
+                try:
+                    registro = json.loads(texto)
+                except ValueError as e:
+                    yield linea, f"JSON inválido: {e}"
+                    continue
+                yield linea, registro if isinstance(registro, dict) else "Se esperaba un objeto JSON"
+
+def _validar(registro: Dict) -> Optional[str]:
+    """Motivo del rechazo (el mensaje que imprime validar_paciente) o None."""
+    salida = io.StringIO()
+    with contextlib.redirect_stdout(salida):
+        valido = validar_paciente(registro)
+    return None if valido else (salida.getvalue().strip() or "Datos inválidos")
+
+def _historia(historia) -> Tuple[List[Dict], Optional[str]]:
+    """Entradas de historia clínica de la fila, o el motivo del rechazo."""
+    if not isinstance(historia, list) or not all(isinstance(hc, dict) for hc in historia):
+        return [], "historiaClinica debe ser una lista de objetos"
+    try:
+        return [
+            historia_clinica.nueva_entrada(hc.get("diagnostico", ""), hc.get("tratamiento", ""),
+                                           fechas.a_datetime(hc.get("fecha")))
+            for hc in historia
+        ], None
+    except ValueError as e:
+        return [], f"historiaClinica: {e}"
+
+def _lotes(registros: Iterator[Tuple[int, Dict]], tamanio: int) -> Iterator[List[Tuple[int, Dict]]]:
+    lote = []
+    for item in registros:
+        lote.append(item)
+        if len(lote) == tamanio:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+def importar(ruta: str, lote: int = LOTE, procesos: Optional[int] = None) -> Dict:
+    errores: List[Dict] = []
+    vistos = set()
+    insertados = 0
+    leidos = 0
+    inicio = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=procesos or os.cpu_count()) as pool:
+        for filas in _lotes(leer_registros(ruta), lote):
+            leidos += len(filas)
+            candidatos = []
+            for linea, registro in filas:
+                if isinstance(registro, str):
+                    errores.append({"linea": linea, "dni": "", "error": registro})
+                    continue
+                registro["dni"] = str(registro.get("dni", "")).strip()
+                registro.setdefault("historiaClinica", [])
+                motivo = _validar(registro)
+                if motivo is None:
+                    registro["historiaClinica"], motivo = _historia(registro["historiaClinica"])
+                if motivo is None and registro["dni"] in vistos:
+                    motivo = "DNI repetido en el archivo"
+                if motivo:
+                    errores.append({"linea": linea, "dni": registro["dni"], "error": motivo})
+                    continue
+                # Mismo rol normalizado que guarda guardar_paciente
+                registro["rol"] = str(registro["rol"]).strip().lower()
+                vistos.add(registro["dni"])
+                candidatos.append((linea, registro))
+
+            # Un solo $in por lote para descartar los DNIs que ya existen
+            existentes = {
+                d["dni"] for d in db.pacientes.find(
+                    {"dni": {"$in": [r["dni"] for _, r in candidatos]}}, {"dni": 1, "_id": 0}
+                )
+            } if candidatos else set()
+            nuevos = []
+            for linea, registro in candidatos:
+                if registro["dni"] in existentes:
+                    errores.append({"linea": linea, "dni": registro["dni"],
+                                    "error": f"Ya existe un usuario con DNI {registro['dni']}"})
+                else:
+                    nuevos.append((linea, registro))
+
+            hashes = pool.map(db.hash_password, [str(r["password"]) for _, r in nuevos],
+                              chunksize=max(1, len(nuevos) // (4 * (procesos or os.cpu_count() or 1))))
+            for (_, registro), hashed in zip(nuevos, hashes):
+                registro["password"] = hashed
+                historia = registro.pop("historiaClinica")
+                registro["riesgo"] = riesgo_inicial([hc["diagnostico"] for hc in historia], [hc["id"] for hc in historia])
+                registro["_historia"] = historia
+
+            # La historia clínica va en buckets aparte (ver historia_clinica)
+            historias = {r["dni"]: r.pop("_historia") for _, r in nuevos}
+            n, fallidos = db.insert_many(db.pacientes, [r for _, r in nuevos])
+            insertados += n
+            for error in fallidos:
+                linea, registro = nuevos[error["index"]]
+                historias.pop(registro["dni"], None)
+                errores.append({"linea": linea, "dni": registro["dni"], "error": error.get("errmsg")})
+            historia_clinica.agregar_historias({dni: historia for dni, historia in historias.items() if historia})
+
+    segundos = time.perf_counter() - inicio
+    return {
+        "leidos": leidos,
+        "insertados": insertados,
+        "errores": errores,
+        "segundos": segundos,
+        "filas_por_segundo": leidos / segundos if segundos else 0.0,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa pacientes/médicos desde CSV o JSONL")
+    parser.add_argument("archivo")
+    parser.add_argument("--lote", type=int, default=LOTE)
+    parser.add_argument("--procesos", type=int, default=None)
+    args = parser.parse_args()
+
+    resultado = importar(args.archivo, args.lote, args.procesos)
+    for e in resultado["errores"]:
+        print(f"Línea {e['linea']} (DNI {e['dni']}): {e['error']}")
+    print(f"\nLeídos: {resultado['leidos']} - Insertados: {resultado['insertados']} - "
+          f"Errores: {len(resultado['errores'])}")
+    print(f"Tiempo: {resultado['segundos']:.1f}s ({resultado['filas_por_segundo']:.0f} filas/s)")
@@ -0,0 +1,152 @@
+"""Índices de MongoDB para los patrones de consulta de VidaSana.
+
+INDICES declara los índices de cada colección y CONSULTAS las formas de
+consulta que usan gestion_turnos / gestion_pacientes / seguimiento_habitos.
+Al agregar una consulta nueva, sumarla a CONSULTAS: tests/test_indices.py
+falla si alguna termina en un COLLSCAN o en un SORT en memoria.
+
+    python indices.py             crea los índices que falten
+    python indices.py --verificar explica cada consulta (sale con 1 si hay COLLSCAN)
+    python indices.py --tamanios  tamaño de cada índice
+"""
+import sys
+from datetime import datetime
+from typing import Dict, List, Tuple
+import db
+
+INDICES: Dict[str, List[Tuple[List[Tuple[str, int]], Dict]]] = {
+    "pacientes": [
+        ([("dni", 1)], {"unique": True}),
+        # Búsqueda de médicos por nombre en registrar_turno_console
+        ([("rol", 1), ("apellido", 1)], {}),
+    ],
+    "turnos": [
+        # Turnos de un paciente o de un médico en cualquier estado, ordenados por
+        # fecha (consultar_paciente, consultar_turnos_paciente, la red). Los únicos
+        # parciales de abajo solo sirven a consultas con estado "programado"; con
+        # `estado` al final estos no repiten su patrón de claves
+        ([("dni", 1), ("fecha", 1), ("estado", 1)], {}),
+        ([("medico_dni", 1), ("fecha", 1), ("estado", 1)], {}),
+        # Turnos de un día (programar_recordatorios_dia)
+        ([("fecha", -1)], {}),
+        # Un turno programado por horario para cada médico y cada paciente: rechaza
+        # dos reservas del mismo horario (el resto lo controla agenda.reservar)
+        ([("medico_dni", 1), ("fecha", 1)],
+         {"unique": True, "name": "medico_fecha_programado",
+          "partialFilterExpression": {"estado": "programado"}}),
+        ([("dni", 1), ("fecha", 1)],
+         {"unique": True, "name": "dni_fecha_programado",
+          "partialFilterExpression": {"estado": "programado"}}),
+    ],
+    # Configuración de agenda por médico (agenda.py)
+    "agendas": [
+        ([("medico_dni", 1)], {"unique": True}),
+        ([("especialidad", 1)], {}),
+    ],
+    "habitos": [
+        # Un registro por paciente por día
+        ([("dni", 1), ("fecha", -1)], {"unique": True}),
+    ],
+    # Buckets de historia clínica de un paciente, del más nuevo al más viejo
+    "historia_clinica": [
+        ([("dni", 1), ("hasta", -1), ("_id", -1)], {}),
+    ],
+    # Un resumen por paciente, período e inicio (también lo exige $merge)
+    "habitos_resumen": [
+        ([("dni", 1), ("periodo", 1), ("inicio", 1)], {"unique": True}),
+    ],
+}
+
+# Índices reemplazados que asegurar_indices borra si siguen creados
+OBSOLETOS: Dict[str, List[str]] = {
+    # Mismo patrón que los únicos parciales medico_fecha_programado y dni_fecha_programado
+    "turnos": ["dni_1_fecha_1", "medico_dni_1_fecha_1"],
+}
+
+# (colección, filtro, orden) con valores de ejemplo
+CONSULTAS: List[Tuple[str, Dict, List[Tuple[str, int]]]] = [
+    ("pacientes", {"dni": "0"}, []),
+    ("pacientes", {"dni": {"$in": ["0", "1"]}}, []),
+    ("pacientes", {"nombre": {"$regex": "^a$", "$options": "i"},
+                   "apellido": {"$regex": "^b$", "$options": "i"}, "rol": "medico"}, []),
+    ("turnos", {"dni": "0"}, []),
+    ("turnos", {"dni": "0"}, [("fecha", 1)]),
+    ("turnos", {"medico_dni": "0"}, [("fecha", 1)]),
+    ("turnos", {"fecha": {"$gte": datetime(2030, 1, 1), "$lt": datetime(2030, 1, 2)},
+                "estado": "programado"}, []),
+    ("turnos", {"medico_dni": {"$in": ["0", "1"]}, "estado": "programado",
+                "fecha": {"$gt": datetime(2030, 1, 1), "$lt": datetime(2030, 1, 2)}}, []),
+    ("agendas", {"especialidad": "clinica"}, []),
+    ("habitos", {"dni": "0"}, [("fecha", -1)]),
+    ("habitos", {"dni": "0", "fecha": {"$gte": datetime(2030, 1, 1), "$lte": datetime(2030, 1, 31)}},
+     [("fecha", -1)]),
+    ("habitos_resumen", {"dni": "0", "periodo": "semana"}, [("inicio", 1)]),
+    ("historia_clinica", {"dni": "0"}, [("hasta", -1), ("_id", -1)]),
+    ("historia_clinica", {"dni": {"$in": ["0", "1"]}}, []),
+]
+
+def asegurar_indices() -> bool:
+    """Crea los índices declarados (create_index es idempotente) y borra los obsoletos."""
+    ok = True
+    for nombre, obsoletos in OBSOLETOS.items():
+        coleccion = db.get_collection(nombre)
+        existentes = {i["name"] for i in coleccion.list_indexes()}
+        for indice in obsoletos:
+            if indice in existentes:
+                coleccion.drop_index(indice)
+    for nombre, indices in INDICES.items():
+        coleccion = db.get_collection(nombre)
+        for claves, opciones in indices:
+            try:
+                coleccion.create_index(claves, **opciones)
+            except Exception as e:
+                print(f"Advertencia al crear índice {nombre} {claves}: {str(e)}")
+                ok = False
+    return ok
+
+def _etapas(plan: Dict) -> List[str]:
+    etapas = [plan.get("stage")]
+    for hijo in plan.get("inputStages", []) + [plan.get("inputStage")]:
+        if hijo:
+            etapas.extend(_etapas(hijo))
+    return etapas
+
+def explicar(nombre: str, filtro: Dict, orden: List[Tuple[str, int]]) -> List[str]:
+    """Etapas del plan ganador para una consulta."""
+    cursor = db.get_collection(nombre).find(filtro)
+    if orden:
+        cursor = cursor.sort(orden)
+    plan = cursor.explain()["queryPlanner"]["winningPlan"]
+    # En servidores recientes el plan del motor SBE viene anidado
+    return _etapas(plan.get("queryPlan", plan))
+
+def verificar_planes() -> List[str]:
+    """Devuelve las consultas que hacen COLLSCAN u ordenan en memoria."""
+    problemas = []
+    for nombre, filtro, orden in CONSULTAS:
+        etapas = explicar(nombre, filtro, orden)
+        if "COLLSCAN" in etapas or "SORT" in etapas:
+            problemas.append(f"{nombre} {filtro} {orden}: {' <- '.join(etapas)}")
+    return problemas
+
+def tamanios_indices() -> Dict[str, Dict[str, int]]:
+    tamanios = {}
+    for nombre in INDICES:
+        stats = next(db.get_collection(nombre).aggregate([{"$collStats": {"storageStats": {}}}]))
+        tamanios[nombre] = stats["storageStats"]["indexSizes"]
+    return tamanios
+
+if __name__ == "__main__":
+    if "--verificar" in sys.argv:
+        problemas = verificar_planes()
+        for p in problemas:
+            print(f"Plan sin índice: {p}")
+        if problemas:
+            sys.exit(1)
+        print(f"{len(CONSULTAS)} consultas verificadas, todas usan índices")
+    elif "--tamanios" in sys.argv:
+        for nombre, indices in tamanios_indices().items():
+            for indice, bytes_ in indices.items():
+                print(f"{nombre:<12}{indice:<28}{bytes_ / 1024:>10.1f} KiB")
+    elif asegurar_indices():
+        print("Índices creados correctamente")
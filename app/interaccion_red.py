@@ -1,7 +1,39 @@
+"""Red médico-paciente en Neo4j: nodos :Usuario {dni} y relaciones (médico)-[:SIGUE]->(paciente).
+
+Las consultas Cypher viven en GrafoNeo4j; el resto de la aplicación usa el
+grafo de db.get_grafo(), que con VIDASANA_BACKEND=memoria es un
+memoria.GrafoMemoria con los mismos métodos.
+
+    python interaccion_red.py --sincronizar [--lote 5000]   crea la red a partir de los turnos
+"""
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
 import db
+import fechas
+
+# MERGE sobre :Usuario(dni) usa el índice de la restricción única
+RESTRICCIONES = [
+    "CREATE CONSTRAINT usuario_dni IF NOT EXISTS FOR (u:Usuario) REQUIRE u.dni IS UNIQUE",
+]
+
+LOTE_SINCRONIZACION = 5000
+
+# Se incrementa con cada cambio en la red (relación SIGUE nueva o propiedades
+# escritas). analitica_red cachea en Redis por versión, así un cambio
+# invalida todo sin borrar llaves.
+VERSION_RED = "red:version"
+
+def marcar_cambio_red() -> None:
+    try:
+        db.get_redis().incr(VERSION_RED)
+    except Exception as e:
+        print(f"No se pudo invalidar la caché de la red: {str(e)}")
 
 
-def seguir(tx, dni_medico, dni_paciente, m_nombre=None, m_apellido=None, p_nombre=None, p_apellido=None):
+def seguir(tx, dni_medico, dni_paciente, m_nombre=None, m_apellido=None, p_nombre=None, p_apellido=None) -> bool:
+    """Crea la relación si no existe; devuelve True si es nueva."""
     query = (
         "MERGE (m:Usuario {dni: $dni_medico}) "
         "ON CREATE SET m.nombre = coalesce($m_nombre, m.nombre), m.apellido = coalesce($m_apellido, m.apellido) "
@@ -9,7 +41,7 @@ def seguir(tx, dni_medico, dni_paciente, m_nombre=None, m_apellido=None, p_nombr
         "ON CREATE SET p.nombre = coalesce($p_nombre, p.nombre), p.apellido = coalesce($p_apellido, p.apellido) "
         "MERGE (m)-[:SIGUE]->(p)"
     )
-    tx.run(
+    resumen = tx.run(
         query,
         dni_medico=dni_medico,
         dni_paciente=dni_paciente,
@@ -17,43 +49,302 @@ def seguir(tx, dni_medico, dni_paciente, m_nombre=None, m_apellido=None, p_nombr
         m_apellido=m_apellido,
         p_nombre=p_nombre,
         p_apellido=p_apellido,
-    )
+    ).consume()
+    return resumen.counters.relationships_created > 0
+
+
+TAMANIO_PAGINA = 100
 
+def _nativo(valor):
+    # El driver devuelve neo4j.time.DateTime; se pasa a datetime de Python
+    return valor.to_native() if hasattr(valor, "to_native") else valor
 
-def mostrar_red(tx, dni_medico: str):
-    
+def _filtros_red(prefijo: Optional[str], visto_desde: Optional[datetime]) -> Tuple[str, Dict]:
+    condiciones, parametros = [], {}
+    if prefijo:
+        condiciones.append("(toLower(p.nombre) STARTS WITH $prefijo OR toLower(p.apellido) STARTS WITH $prefijo)")
+        parametros["prefijo"] = prefijo.lower()
+    if visto_desde:
+        condiciones.append("r.ultimo_turno >= $visto_desde")
+        parametros["visto_desde"] = visto_desde
+    return " AND ".join(condiciones), parametros
+
+def pagina_red(tx, dni_medico: str, despues_de: Optional[str] = None, limite: int = TAMANIO_PAGINA,
+               prefijo: Optional[str] = None, visto_desde: Optional[datetime] = None) -> List[Dict]:
+    """Pacientes seguidos por el médico ordenados por dni, a partir de `despues_de`.
+
+    Paginación por clave: la página siguiente se pide con el dni del último
+    paciente recibido, sin SKIP. `prefijo` filtra por comienzo de nombre o
+    apellido y `visto_desde` por fecha del último turno.
+    """
+    condiciones, parametros = _filtros_red(prefijo, visto_desde)
+    if despues_de is not None:
+        condiciones = " AND ".join(filter(None, ["p.dni > $despues_de", condiciones]))
+        parametros["despues_de"] = despues_de
     query = (
-        "MATCH (m:Usuario {dni: $dni_medico})-[:SIGUE]->(p:Usuario) "
-        "RETURN p.nombre AS nombre, p.apellido AS apellido, p.dni AS dni"
+        "MATCH (m:Usuario {dni: $dni_medico})-[r:SIGUE]->(p:Usuario) "
+        + (f"WHERE {condiciones} " if condiciones else "")
+        + "RETURN p.nombre AS nombre, p.apellido AS apellido, p.dni AS dni, r.ultimo_turno AS ultimo_turno "
+        "ORDER BY p.dni LIMIT $limite"
     )
-    result = tx.run(query, dni_medico=dni_medico)
-    pacientes = []
-    for r in result:
-        pacientes.append({
-            "nombre": r.get("nombre"),
-            "apellido": r.get("apellido"),
-            "dni": r.get("dni")
-        })
-    # Imprimir la lista de pacientes seguida por el médico
-    if not pacientes:
-        print(f"El médico con DNI {dni_medico} no sigue a ningún paciente.")
+    result = tx.run(query, dni_medico=dni_medico, limite=limite, **parametros)
+    return [
+        {"nombre": r.get("nombre"), "apellido": r.get("apellido"), "dni": r.get("dni"),
+         "ultimo_turno": _nativo(r.get("ultimo_turno"))}
+        for r in result
+    ]
+
+def contar_red(tx, dni_medico: str, prefijo: Optional[str] = None,
+               visto_desde: Optional[datetime] = None) -> int:
+    """Cantidad de pacientes seguidos; sin filtros sale del grado del nodo."""
+    condiciones, parametros = _filtros_red(prefijo, visto_desde)
+    if condiciones:
+        query = (f"MATCH (m:Usuario {{dni: $dni_medico}})-[r:SIGUE]->(p:Usuario) WHERE {condiciones} "
+                 "RETURN count(p) AS total")
     else:
-        print(f"Pacientes seguidos por el médico (DNI {dni_medico}):")
-        for p in pacientes:
-            print(f" - {p['nombre']} {p['apellido']} (DNI: {p['dni']})")
+        query = "MATCH (m:Usuario {dni: $dni_medico})-[:SIGUE]->() RETURN count(*) AS total"
+    return tx.run(query, dni_medico=dni_medico, **parametros).single()["total"]
+
+def iterar_red(dni_medico: str, tamanio: int = TAMANIO_PAGINA, **filtros) -> Iterator[Dict]:
+    """Recorre toda la red del médico trayendo una página a la vez."""
+    grafo = db.get_grafo()
+    despues_de = None
+    while True:
+        pagina = grafo.pagina(dni_medico, despues_de, tamanio, **filtros)
+        yield from pagina
+        if len(pagina) < tamanio:
+            return
+        despues_de = pagina[-1]["dni"]
+
+def mostrar_red(dni_medico: str, despues_de: Optional[str] = None, limite: int = TAMANIO_PAGINA,
+                **filtros) -> List[Dict]:
+    """Imprime una página de la red; para seguir, volver a llamar con el último dni."""
+    grafo = db.get_grafo()
+    if despues_de is None:
+        total = grafo.contar(dni_medico, **filtros)
+    pacientes = grafo.pagina(dni_medico, despues_de, limite, **filtros)
+    if despues_de is None:
+        if not total:
+            print(f"El médico con DNI {dni_medico} no sigue a ningún paciente.")
+            return pacientes
+        print(f"Pacientes seguidos por el médico (DNI {dni_medico}): {total}")
+    for p in pacientes:
+        visto = f" - último turno {fechas.formatear(p['ultimo_turno'])}" if p["ultimo_turno"] else ""
+        print(f" - {p['nombre']} {p['apellido']} (DNI: {p['dni']}){visto}")
     return pacientes
 
 
-if __name__ == "__main__":
-    if not db.driver:
+_ESCRIBIR_USUARIOS = (
+    "UNWIND $rows AS row "
+    "MERGE (u:Usuario {dni: row.dni}) "
+    "SET u.nombre = coalesce(row.nombre, u.nombre), u.apellido = coalesce(row.apellido, u.apellido)"
+)
+
+# Las dos puntas ya existen: MATCH por dni en lugar de MERGE de nodos por fila
+_ESCRIBIR_SIGUE = (
+    "UNWIND $rows AS row "
+    "MATCH (m:Usuario {dni: row.medico}) "
+    "MATCH (p:Usuario {dni: row.paciente}) "
+    "MERGE (m)-[r:SIGUE]->(p) "
+    "SET r.turnos = row.turnos, "
+    "r.ultimo_turno = CASE WHEN r.ultimo_turno IS NULL OR row.ultimo_turno > r.ultimo_turno "
+    "THEN row.ultimo_turno ELSE r.ultimo_turno END"
+)
+
+def _escribir_lote(tx, usuarios: List[Dict], relaciones: List[Dict]) -> Tuple[int, int]:
+    """Escribe el lote; devuelve (relaciones SIGUE creadas, propiedades escritas)."""
+    nodos = tx.run(_ESCRIBIR_USUARIOS, rows=usuarios).consume().counters
+    sigue = tx.run(_ESCRIBIR_SIGUE, rows=relaciones).consume().counters
+    return sigue.relationships_created, nodos.properties_set + sigue.properties_set
+
+
+# Un salto de vecindario: UNWIND de [null] con la frontera vacía para no perder la fila
+_SALTO_VECINDARIO = (
+    "UNWIND CASE frontera WHEN [] THEN [null] ELSE frontera END AS f "
+    "OPTIONAL MATCH (f)-[:SIGUE]-(v:Usuario) WHERE size(vistos) <= $limite AND NOT v IN vistos "
+    "WITH vistos, collect(DISTINCT v)[..$limite] AS frontera "
+    "WITH vistos + frontera AS vistos, frontera "
+)
+
+
+class GrafoNeo4j:
+    """Repositorio de la red sobre Neo4j: cada método corre en su propia sesión."""
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def _leer(self, funcion, *args, **kwargs):
+        with self.driver.session() as session:
+            return session.read_transaction(funcion, *args, **kwargs)
+
+    def _escribir(self, funcion, *args, **kwargs):
+        with self.driver.session() as session:
+            return session.write_transaction(funcion, *args, **kwargs)
+
+    def _consultar(self, query: str, **parametros) -> List[Dict]:
+        return self._leer(lambda tx: [r.data() for r in tx.run(query, **parametros)])
+
+    def asegurar_restricciones(self) -> None:
+        with self.driver.session() as session:
+            for restriccion in RESTRICCIONES:
+                session.run(restriccion)
+
+    def seguir(self, dni_medico: str, dni_paciente: str, m_nombre=None, m_apellido=None,
+               p_nombre=None, p_apellido=None) -> bool:
+        return self._escribir(seguir, dni_medico, dni_paciente, m_nombre, m_apellido, p_nombre, p_apellido)
+
+    def escribir_lote(self, usuarios: List[Dict], relaciones: List[Dict]) -> Tuple[int, int]:
+        return self._escribir(_escribir_lote, usuarios, relaciones)
+
+    def pagina(self, dni_medico: str, despues_de: Optional[str] = None, limite: int = TAMANIO_PAGINA,
+               **filtros) -> List[Dict]:
+        return self._leer(pagina_red, dni_medico, despues_de, limite, **filtros)
+
+    def contar(self, dni_medico: str, **filtros) -> int:
+        return self._leer(contar_red, dni_medico, **filtros)
+
+    # Consultas de analitica_red
+    def medicos_compartidos(self, dni_medico: str, limite: int) -> List[Dict]:
+        return self._consultar(
+            "MATCH (m:Usuario {dni: $dni})-[:SIGUE]->(p:Usuario)<-[:SIGUE]-(o:Usuario) "
+            "WHERE o <> m "
+            "RETURN o.dni AS dni, o.nombre AS nombre, o.apellido AS apellido, count(p) AS compartidos "
+            "ORDER BY compartidos DESC, dni LIMIT $limite",
+            dni=dni_medico, limite=limite,
+        )
+
+    def equipo_atencion(self, dni_paciente: str) -> List[Dict]:
+        filas = self._consultar(
+            "MATCH (m:Usuario)-[r:SIGUE]->(p:Usuario {dni: $dni}) "
+            "RETURN m.dni AS dni, m.nombre AS nombre, m.apellido AS apellido, "
+            "r.ultimo_turno AS ultimo_turno, r.turnos AS turnos "
+            "ORDER BY r.ultimo_turno DESC, dni",
+            dni=dni_paciente,
+        )
+        for f in filas:
+            f["ultimo_turno"] = _nativo(f["ultimo_turno"])
+        return filas
+
+    def vecindario(self, dni: str, saltos: int, limite: int) -> List[str]:
+        # Un salto por vez con DISTINCT entre saltos: un camino variable (*1..n)
+        # enumera todos los caminos antes del LIMIT, y con un médico con miles
+        # de pacientes eso explota. La frontera se corta en $limite y, una vez
+        # juntados $limite usuarios, no se expande más.
+        filas = self._consultar(
+            "MATCH (u:Usuario {dni: $dni}) WITH [u] AS vistos, [u] AS frontera "
+            + _SALTO_VECINDARIO * int(saltos)
+            + "RETURN [v IN vistos[1..] | v.dni][..$limite] AS dnis",
+            dni=dni, limite=limite,
+        )
+        return filas[0]["dnis"] if filas else []
+
+    def distribucion_grados(self, entrantes: bool) -> List[Dict]:
+        patron = "(u:Usuario)<-[:SIGUE]-()" if entrantes else "(u:Usuario)-[:SIGUE]->()"
+        return self._consultar(
+            f"MATCH {patron} WITH u, count(*) AS grado "
+            "RETURN grado, count(u) AS usuarios ORDER BY grado"
+        )
+
+
+_AGRUPAR_PARES = {"$group": {"_id": {"medico": "$medico_dni", "paciente": "$dni"},
+                              "ultimo_turno": {"$max": "$fecha"}, "turnos": {"$sum": 1}}}
+# Pares por consulta al recontar una sincronización incremental
+PARES_POR_CONSULTA = 1000
+
+def _relaciones_desde_turnos(desde: Optional[datetime] = None) -> Iterator[Dict]:
+    """Un par (médico, paciente) por grupo de turnos, con la fecha del último.
+
+    Con `desde` se buscan los pares con turnos creados desde esa fecha y se
+    cuentan todos sus turnos, así `turnos` sigue siendo el total del par.
+    """
+    if not desde:
+        yield from db.turnos.aggregate([_AGRUPAR_PARES], allowDiskUse=True)
+        return
+    # Los turnos anteriores a la migración de fechas guardan `creado` como texto
+    nuevos = db.turnos.aggregate([
+        {"$match": {"$or": [{"creado": {"$gte": desde}}, {"creado": {"$type": "string"}}]}},
+        {"$group": {"_id": {"medico": "$medico_dni", "paciente": "$dni"}}},
+    ], allowDiskUse=True)
+    pares: List[Dict] = []
+    for grupo in nuevos:
+        pares.append({"medico_dni": grupo["_id"].get("medico"), "dni": grupo["_id"].get("paciente")})
+        if len(pares) == PARES_POR_CONSULTA:
+            yield from db.turnos.aggregate([{"$match": {"$or": pares}}, _AGRUPAR_PARES])
+            pares = []
+    if pares:
+        yield from db.turnos.aggregate([{"$match": {"$or": pares}}, _AGRUPAR_PARES])
+
+def sincronizar_desde_turnos(lote: int = LOTE_SINCRONIZACION, desde: Optional[datetime] = None) -> Dict:
+    """Cada médico sigue a los pacientes con los que tiene turnos.
+
+    Lee los pares agrupados en Mongo y los escribe con UNWIND, una
+    transacción por lote. Con `desde` solo escribe los pares con turnos
+    creados desde esa fecha (sincronización incremental), con su total de
+    turnos. Vuelve a correrlo no duplica nada.
+    """
+    grafo = db.get_grafo()
+    grafo.asegurar_restricciones()
+    inicio = time.perf_counter()
+    relaciones_total = usuarios_total = creadas = propiedades = 0
+    relaciones: List[Dict] = []
+
+    def escribir() -> None:
+        nonlocal relaciones_total, usuarios_total, creadas, propiedades
+        dnis = {r["medico"] for r in relaciones} | {r["paciente"] for r in relaciones}
+        encontrados = db.find_usuarios(list(dnis))
+        usuarios = [{"dni": dni, "nombre": (encontrados.get(dni) or {}).get("nombre"),
+                     "apellido": (encontrados.get(dni) or {}).get("apellido")} for dni in dnis]
+        nuevas, escritas = grafo.escribir_lote(usuarios, relaciones)
+        creadas += nuevas
+        propiedades += escritas
+        usuarios_total += len(usuarios)
+        relaciones_total += len(relaciones)
+
+    for grupo in _relaciones_desde_turnos(desde):
+        par = grupo["_id"]
+        if not par.get("medico") or not par.get("paciente"):
+            continue
+        ultimo = grupo["ultimo_turno"]
+        relaciones.append({"medico": par["medico"], "paciente": par["paciente"], "turnos": grupo["turnos"],
+                           # Turnos anteriores a la migración de fechas la guardan como texto
+                           "ultimo_turno": ultimo if isinstance(ultimo, datetime) else None})
+        if len(relaciones) >= lote:
+            escribir()
+            relaciones = []
+    if relaciones:
+        escribir()
+    # Nombres, turnos y último turno también se ven en las páginas cacheadas
+    if creadas or propiedades:
+        marcar_cambio_red()
+
+    segundos = time.perf_counter() - inicio
+    return {
+        "usuarios": usuarios_total,
+        "relaciones": relaciones_total,
+        "creadas": creadas,
+        "segundos": segundos,
+        "relaciones_por_segundo": relaciones_total / segundos if segundos else 0.0,
+    }
+
+
+if __name__ == "__main__" and "--sincronizar" in sys.argv:
+    if not db.get_grafo():
+        print("Neo4j driver no disponible (configurar NEO4J_URI/credentials).")
+        sys.exit(1)
+    lote = int(sys.argv[sys.argv.index("--lote") + 1]) if "--lote" in sys.argv else LOTE_SINCRONIZACION
+    resultado = sincronizar_desde_turnos(lote)
+    print(f"Relaciones: {resultado['relaciones']} ({resultado['usuarios']} nodos escritos) "
+          f"en {resultado['segundos']:.1f}s ({resultado['relaciones_por_segundo']:.0f} relaciones/s)")
+elif __name__ == "__main__":
+    if not db.get_grafo():
         print("Neo4j driver no disponible (configurar NEO4J_URI/credentials).")
     else:
         # Solo crear relación entre usuarios que ya existen en MongoDB
-        medico = db.pacientes.find_one({"dni": "999"})
-        paciente = db.pacientes.find_one({"dni": "12345678"})
+        medico = db.pacientes.find_one({"dni": "999"}, {"_id": 1})
+        paciente = db.pacientes.find_one({"dni": "12345678"}, {"_id": 1})
         if medico and paciente:
-            with db.driver.session() as session:
-                session.write_transaction(seguir, "999", "12345678")
-                session.read_transaction(mostrar_red)
+            if db.get_grafo().seguir("999", "12345678"):
+                marcar_cambio_red()
+            mostrar_red("999")
         else:
             print("Usuarios deben existir en MongoDB antes de crear relaciones")
@@ -0,0 +1,1395 @@
+"""Motor de almacenamiento en memoria para correr VidaSana sin servicios.
+
+Implementa el subconjunto de pymongo, redis-py y de la red de Neo4j que usa
+la aplicación, dentro del proceso:
+
+    ClienteMongoMemoria / BaseMemoria / ColeccionMemoria
+        filtros con los operadores de consulta habituales, proyecciones,
+        índices (únicos y parciales incluidos) que se usan para elegir
+        candidatos, updates con $set/$inc/$push/$min/$max/..., bulk_write y
+        un intérprete de agregaciones con las etapas y expresiones que usan
+        los módulos (no $collStats).
+    RedisMemoria
+        strings con TTL, hashes, sorted sets, INCR y pipelines atómicos.
+    GrafoMemoria
+        relaciones SIGUE con los mismos métodos que interaccion_red.GrafoNeo4j.
+
+Se elige con VIDASANA_BACKEND=memoria (ver db.py). Todo es seguro entre
+hilos con un lock por colección / servidor. `latencia` simula una pausa por
+ida y vuelta e `idas_y_vueltas` las cuenta, para benchmarks. Con las métricas
+prendidas las colecciones registran cada comando en metricas.py como lo haría
+el CommandListener de pymongo (Redis y la red se miden en db.py).
+"""
+import functools
+import re
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, deque
+from datetime import date, datetime, timedelta
+from itertools import count
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import metricas
+
+try:
+    from bson import ObjectId
+except ImportError:  # Sin pymongo instalado: ids hexadecimales crecientes
+    _ids = count(1)
+
+    def ObjectId() -> str:
+        return f"{next(_ids):024x}"
+
+try:
+    from pymongo.errors import BulkWriteError, DuplicateKeyError
+except ImportError:
+    class DuplicateKeyError(Exception):
+        def __init__(self, error: str, code: int = 11000, details: Optional[Dict] = None):
+            super().__init__(error)
+            self.code = code
+            self.details = details
+
+    class BulkWriteError(Exception):
+        def __init__(self, results: Dict):
+            super().__init__("batch op errors occurred")
+            self.code = 65
+            self.details = results
+
+
+class _Resultado:
+    def __init__(self, **campos: Any):
+        self.__dict__.update(campos)
+
+
+def _copiar(valor: Any) -> Any:
+    if isinstance(valor, dict):
+        return {k: _copiar(v) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [_copiar(v) for v in valor]
+    return valor
+
+# Rutas y valores -------------------------------------------------------------
+
+def _valores(doc: Any, ruta: str) -> List[Any]:
+    """Valores en `ruta` recorriendo arrays como MongoDB (para filtros)."""
+    actuales = [doc]
+    for parte in ruta.split("."):
+        siguientes = []
+        for actual in actuales:
+            if isinstance(actual, dict):
+                if parte in actual:
+                    siguientes.append(actual[parte])
+            elif isinstance(actual, list):
+                if parte.isdigit():
+                    if int(parte) < len(actual):
+                        siguientes.append(actual[int(parte)])
+                else:
+                    siguientes.extend(e[parte] for e in actual if isinstance(e, dict) and parte in e)
+        actuales = siguientes
+    return actuales
+
+def _valor(doc: Any, ruta: str) -> Any:
+    """Valor en `ruta` para expresiones y orden; None si falta."""
+    actual = doc
+    for parte in ruta.split("."):
+        if isinstance(actual, dict):
+            actual = actual.get(parte)
+        elif isinstance(actual, list):
+            if parte.isdigit():
+                actual = actual[int(parte)] if int(parte) < len(actual) else None
+            else:
+                actual = [e.get(parte) for e in actual if isinstance(e, dict) and parte in e]
+        else:
+            return None
+    return actual
+
+def _fijar(doc: Dict, ruta: str, valor: Any) -> None:
+    partes = ruta.split(".")
+    actual: Any = doc
+    for parte in partes[:-1]:
+        actual = actual[int(parte)] if isinstance(actual, list) else actual.setdefault(parte, {})
+    if isinstance(actual, list):
+        actual[int(partes[-1])] = valor
+    else:
+        actual[partes[-1]] = valor
+
+def _borrar(doc: Any, partes: List[str]) -> None:
+    if isinstance(doc, list):
+        for e in doc:
+            _borrar(e, partes)
+    elif isinstance(doc, dict) and partes[0] in doc:
+        if len(partes) == 1:
+            del doc[partes[0]]
+        else:
+            _borrar(doc[partes[0]], partes[1:])
+
+_TIPOS_ORDEN = [(type(None), 0), (bool, 8), ((int, float), 1), (str, 2), (dict, 3), (list, 4), (datetime, 9)]
+
+def _clave_orden(valor: Any) -> Tuple:
+    """Orden entre tipos como MongoDB: null < números < texto < objetos < arrays < bool < fechas."""
+    for tipo, rango in _TIPOS_ORDEN:
+        if isinstance(valor, tipo):
+            if rango in (3, 4):
+                return (rango, str(valor))
+            return (rango, valor) if rango else (0,)
+    return (7, str(valor))
+
+def _ordenar(documentos: List[Dict], orden: List[Tuple[str, int]]) -> List[Dict]:
+    for campo, direccion in reversed(orden):
+        documentos.sort(key=lambda d: _clave_orden(_valor(d, campo)), reverse=direccion < 0)
+    return documentos
+
+def _normalizar_orden(orden: Any, direccion: Optional[int] = None) -> List[Tuple[str, int]]:
+    if not orden:
+        return []
+    if isinstance(orden, str):
+        return [(orden, direccion or 1)]
+    if isinstance(orden, dict):
+        return list(orden.items())
+    return [(c, d) for c, d in orden]
+
+# Filtros ---------------------------------------------------------------------
+
+def _comparar(a: Any, b: Any, operador: Callable[[Any, Any], bool]) -> bool:
+    if a is None or b is None or isinstance(a, (dict, list)):
+        return False
+    try:
+        return operador(a, b)
+    except TypeError:
+        return False
+
+def _regex(condicion: Dict) -> "re.Pattern":
+    patron = condicion["$regex"]
+    if isinstance(patron, re.Pattern):
+        return patron
+    banderas = 0
+    for letra, bandera in (("i", re.I), ("m", re.M), ("s", re.S), ("x", re.X)):
+        if letra in condicion.get("$options", ""):
+            banderas |= bandera
+    return re.compile(patron, banderas)
+
+def _igual(valores: List[Any], esperado: Any) -> bool:
+    if esperado is None and not valores:
+        return True
+    for v in valores:
+        if v == esperado or (isinstance(v, list) and esperado in v):
+            return True
+    return False
+
+_TIPOS_BSON = {
+    "string": str, "date": datetime, "bool": bool, "object": dict, "array": list,
+    "int": int, "long": int, "double": float, "null": type(None),
+}
+
+def _es_tipo(valor: Any, tipo: str) -> bool:
+    if tipo == "number":
+        return isinstance(valor, (int, float)) and not isinstance(valor, bool)
+    esperado = _TIPOS_BSON[tipo]
+    return isinstance(valor, esperado) and (esperado is bool or not isinstance(valor, bool))
+
+_COMPARACIONES = {
+    "$gt": lambda a, b: a > b, "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b, "$lte": lambda a, b: a <= b,
+}
+
+def _cumple_campo(valores: List[Any], condicion: Any) -> bool:
+    if isinstance(condicion, re.Pattern):
+        condicion = {"$regex": condicion}
+    if not isinstance(condicion, dict) or not any(k.startswith("$") for k in condicion):
+        return _igual(valores, condicion)
+    planos = [e for v in valores for e in (v if isinstance(v, list) else [v])]
+    for operador, esperado in condicion.items():
+        if operador == "$eq":
+            ok = _igual(valores, esperado)
+        elif operador == "$ne":
+            ok = not _igual(valores, esperado)
+        elif operador in _COMPARACIONES:
+            ok = any(_comparar(v, esperado, _COMPARACIONES[operador]) for v in planos)
+        elif operador == "$in":
+            ok = any(_igual(valores, e) for e in esperado)
+        elif operador == "$nin":
+            ok = not any(_igual(valores, e) for e in esperado)
+        elif operador == "$exists":
+            ok = bool(valores) == bool(esperado)
+        elif operador == "$regex":
+            patron = _regex(condicion)
+            ok = any(isinstance(v, str) and patron.search(v) for v in planos)
+        elif operador == "$options":
+            continue
+        elif operador == "$not":
+            ok = not _cumple_campo(valores, esperado)
+        elif operador == "$type":
+            tipos = esperado if isinstance(esperado, list) else [esperado]
+            ok = any(_es_tipo(v, t) for v in planos for t in tipos)
+        elif operador == "$size":
+            ok = any(isinstance(v, list) and len(v) == esperado for v in valores)
+        elif operador == "$elemMatch":
+            ok = any(isinstance(v, list) and any(coincide(e, esperado) if isinstance(e, dict)
+                                                 else _cumple_campo([e], esperado) for e in v)
+                     for v in valores)
+        else:
+            raise NotImplementedError(f"Operador {operador} no soportado por el motor en memoria")
+        if not ok:
+            return False
+    return True
+
+def coincide(doc: Dict, filtro: Optional[Dict]) -> bool:
+    for campo, condicion in (filtro or {}).items():
+        if campo == "$or":
+            if not any(coincide(doc, f) for f in condicion):
+                return False
+        elif campo == "$and":
+            if not all(coincide(doc, f) for f in condicion):
+                return False
+        elif campo == "$nor":
+            if any(coincide(doc, f) for f in condicion):
+                return False
+        elif campo == "$expr":
+            if not evaluar(condicion, doc):
+                return False
+        elif not _cumple_campo(_valores(doc, campo), condicion):
+            return False
+    return True
+
+# Proyecciones y updates ------------------------------------------------------
+
+def _incluir(origen: Dict, partes: List[str], destino: Dict) -> None:
+    clave = partes[0]
+    if clave not in origen:
+        return
+    valor = origen[clave]
+    if len(partes) == 1:
+        destino[clave] = _copiar(valor)
+    elif isinstance(valor, dict):
+        _incluir(valor, partes[1:], destino.setdefault(clave, {}))
+    elif isinstance(valor, list):
+        elementos = [e for e in valor if isinstance(e, dict)]
+        lista = destino.setdefault(clave, [{} for _ in elementos])
+        for elemento, parcial in zip(elementos, lista):
+            _incluir(elemento, partes[1:], parcial)
+
+def proyectar(doc: Dict, proyeccion: Optional[Any]) -> Dict:
+    if not proyeccion:
+        return _copiar(doc)
+    if isinstance(proyeccion, (list, tuple)):
+        proyeccion = {c: 1 for c in proyeccion}
+    incluir_id = proyeccion.get("_id", 1)
+    campos = {c: v for c, v in proyeccion.items() if c != "_id"}
+    if campos and all(v in (1, True) for v in campos.values()):
+        resultado: Dict = {"_id": doc["_id"]} if incluir_id and "_id" in doc else {}
+        for campo in campos:
+            _incluir(doc, campo.split("."), resultado)
+        return resultado
+    resultado = _copiar(doc)
+    for campo in campos:
+        _borrar(resultado, campo.split("."))
+    if not incluir_id:
+        resultado.pop("_id", None)
+    return resultado
+
+def _actualizar(doc: Dict, update: Dict, insertando: bool) -> None:
+    if not any(k.startswith("$") for k in update):
+        id_ = doc.get("_id")
+        doc.clear()
+        doc.update(_copiar(update))
+        if id_ is not None:
+            doc["_id"] = id_
+        return
+    for operador, campos in update.items():
+        for ruta, valor in campos.items():
+            actual = _valor(doc, ruta)
+            if operador == "$set" or (operador == "$setOnInsert" and insertando):
+                _fijar(doc, ruta, _copiar(valor))
+            elif operador == "$setOnInsert":
+                continue
+            elif operador == "$unset":
+                _borrar(doc, ruta.split("."))
+            elif operador == "$inc":
+                _fijar(doc, ruta, (actual or 0) + valor)
+            elif operador == "$min":
+                if actual is None or _comparar(valor, actual, lambda a, b: a < b):
+                    _fijar(doc, ruta, valor)
+            elif operador == "$max":
+                if actual is None or _comparar(valor, actual, lambda a, b: a > b):
+                    _fijar(doc, ruta, valor)
+            elif operador in ("$push", "$addToSet"):
+                nuevos = valor["$each"] if isinstance(valor, dict) and "$each" in valor else [valor]
+                lista = list(actual or [])
+                for nuevo in nuevos:
+                    if operador == "$push" or nuevo not in lista:
+                        lista.append(_copiar(nuevo))
+                recorte = valor.get("$slice") if operador == "$push" and isinstance(valor, dict) else None
+                if recorte is not None:
+                    lista = lista[recorte:] if recorte < 0 else lista[:recorte]
+                _fijar(doc, ruta, lista)
+            elif operador == "$pull":
+                _fijar(doc, ruta, [e for e in actual or [] if e != valor])
+            else:
+                raise NotImplementedError(f"Update {operador} no soportado por el motor en memoria")
+
+def _documento_upsert(filtro: Dict) -> Dict:
+    doc: Dict = {}
+    for campo, condicion in filtro.items():
+        if campo.startswith("$"):
+            continue
+        if isinstance(condicion, dict) and any(k.startswith("$") for k in condicion):
+            if "$eq" in condicion:
+                _fijar(doc, campo, condicion["$eq"])
+            continue
+        _fijar(doc, campo, _copiar(condicion))
+    return doc
+
+# Expresiones de agregación ---------------------------------------------------
+
+def _numero(valor: Any) -> bool:
+    return isinstance(valor, (int, float)) and not isinstance(valor, bool)
+
+def _truncar_fecha(fecha: Any, unidad: str, inicio_semana: str = "sunday") -> Optional[datetime]:
+    if not isinstance(fecha, datetime):
+        return None
+    if unidad == "hour":
+        return fecha.replace(minute=0, second=0, microsecond=0)
+    dia = fecha.replace(hour=0, minute=0, second=0, microsecond=0)
+    if unidad == "week":
+        primero = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"].index(
+            inicio_semana.lower())
+        return dia - timedelta(days=(dia.weekday() - primero) % 7)
+    if unidad == "month":
+        return dia.replace(day=1)
+    if unidad == "year":
+        return dia.replace(month=1, day=1)
+    return dia
+
+def _convertir(argumentos: Dict, doc: Dict) -> Any:
+    valor = evaluar(argumentos["input"], doc)
+    if valor is None:
+        return argumentos.get("onNull")
+    try:
+        destino = argumentos["to"]
+        if destino in ("double", "decimal"):
+            return float(valor)
+        if destino in ("int", "long"):
+            return int(float(valor))
+        if destino == "string":
+            return str(valor)
+        if destino == "bool":
+            return bool(valor)
+        if destino == "date":
+            return valor if isinstance(valor, datetime) else datetime.fromisoformat(str(valor))
+    except (TypeError, ValueError):
+        if "onError" in argumentos:
+            return argumentos["onError"]
+        raise
+    raise NotImplementedError(f"$convert a {argumentos['to']} no soportado por el motor en memoria")
+
+def _aritmetica(valores: List[Any], operador: Callable[[Any, Any], Any]) -> Any:
+    if any(v is None for v in valores):
+        return None
+    resultado = valores[0]
+    for v in valores[1:]:
+        resultado = operador(resultado, v)
+    return resultado
+
+def _restar(a: Any, b: Any) -> Any:
+    if isinstance(a, datetime) and isinstance(b, datetime):
+        return (a - b).total_seconds() * 1000
+    if isinstance(a, datetime):
+        return a - timedelta(milliseconds=b)
+    return a - b
+
+_OPERADORES: Dict[str, Callable[[Any, Dict], Any]] = {
+    "$literal": lambda a, d: a,
+    "$ifNull": lambda a, d: next((v for v in (evaluar(e, d) for e in a[:-1]) if v is not None),
+                                  evaluar(a[-1], d)),
+    "$convert": _convertir,
+    "$toDouble": lambda a, d: _convertir({"input": a, "to": "double"}, d),
+    "$toInt": lambda a, d: _convertir({"input": a, "to": "int"}, d),
+    "$toString": lambda a, d: _convertir({"input": a, "to": "string"}, d),
+    "$arrayElemAt": lambda a, d: (lambda lista, i: lista[i] if isinstance(lista, list) and -len(lista) <= i < len(lista)
+                                  else None)(evaluar(a[0], d), evaluar(a[1], d)),
+    "$split": lambda a, d: (lambda texto, sep: texto.split(sep) if isinstance(texto, str) else None)(
+        evaluar(a[0], d), evaluar(a[1], d)),
+    "$cond": lambda a, d: (evaluar(a["then"], d) if evaluar(a["if"], d) else evaluar(a["else"], d))
+    if isinstance(a, dict) else (evaluar(a[1], d) if evaluar(a[0], d) else evaluar(a[2], d)),
+    "$in": lambda a, d: evaluar(a[0], d) in (evaluar(a[1], d) or []),
+    "$eq": lambda a, d: evaluar(a[0], d) == evaluar(a[1], d),
+    "$ne": lambda a, d: evaluar(a[0], d) != evaluar(a[1], d),
+    "$gt": lambda a, d: _clave_orden(evaluar(a[0], d)) > _clave_orden(evaluar(a[1], d)),
+    "$gte": lambda a, d: _clave_orden(evaluar(a[0], d)) >= _clave_orden(evaluar(a[1], d)),
+    "$lt": lambda a, d: _clave_orden(evaluar(a[0], d)) < _clave_orden(evaluar(a[1], d)),
+    "$lte": lambda a, d: _clave_orden(evaluar(a[0], d)) <= _clave_orden(evaluar(a[1], d)),
+    "$and": lambda a, d: all(evaluar(e, d) for e in a),
+    "$or": lambda a, d: any(evaluar(e, d) for e in a),
+    "$not": lambda a, d: not evaluar(a[0] if isinstance(a, list) else a, d),
+    "$add": lambda a, d: _aritmetica([evaluar(e, d) for e in a],
+                                     lambda x, y: x + timedelta(milliseconds=y) if isinstance(x, datetime) else x + y),
+    "$subtract": lambda a, d: _aritmetica([evaluar(e, d) for e in a], _restar),
+    "$multiply": lambda a, d: _aritmetica([evaluar(e, d) for e in a], lambda x, y: x * y),
+    "$divide": lambda a, d: _aritmetica([evaluar(e, d) for e in a], lambda x, y: x / y),
+    "$size": lambda a, d: len(evaluar(a, d) or []),
+    "$toLower": lambda a, d: str(evaluar(a, d) or "").lower(),
+    "$concat": lambda a, d: _aritmetica([evaluar(e, d) for e in a], lambda x, y: x + y),
+    "$dateTrunc": lambda a, d: _truncar_fecha(evaluar(a["date"], d), a["unit"], a.get("startOfWeek", "sunday")),
+    "$regexMatch": lambda a, d: isinstance(evaluar(a["input"], d), str) and bool(
+        _regex({"$regex": a["regex"], "$options": a.get("options", "")}).search(evaluar(a["input"], d))),
+    "$max": lambda a, d: max((v for v in (evaluar(e, d) for e in a) if v is not None), default=None,
+                             key=_clave_orden),
+    "$min": lambda a, d: min((v for v in (evaluar(e, d) for e in a) if v is not None), default=None,
+                             key=_clave_orden),
+}
+
+def evaluar(expresion: Any, doc: Dict) -> Any:
+    """Evalúa una expresión de agregación sobre un documento."""
+    if isinstance(expresion, str) and expresion.startswith("$"):
+        if expresion == "$$ROOT":
+            return doc
+        return _valor(doc, expresion[1:])
+    if isinstance(expresion, dict):
+        if len(expresion) == 1:
+            operador, argumentos = next(iter(expresion.items()))
+            if operador.startswith("$"):
+                funcion = _OPERADORES.get(operador)
+                if funcion is None:
+                    raise NotImplementedError(f"Expresión {operador} no soportada por el motor en memoria")
+                return funcion(argumentos, doc)
+        return {k: evaluar(v, doc) for k, v in expresion.items()}
+    if isinstance(expresion, list):
+        return [evaluar(e, doc) for e in expresion]
+    return expresion
+
+def _congelar(valor: Any) -> Any:
+    if isinstance(valor, dict):
+        return tuple((k, _congelar(v)) for k, v in valor.items())
+    if isinstance(valor, list):
+        return tuple(_congelar(v) for v in valor)
+    return valor
+
+def _percentil(valores: List[Any], p: float) -> Any:
+    ordenados = sorted(v for v in valores if _numero(v))
+    if not ordenados:
+        return None
+    return ordenados[max(0, min(len(ordenados) - 1, int(-(-p * len(ordenados) // 1)) - 1))]
+
+def _acumular(operador: str, argumento: Any, documentos: List[Dict]) -> Any:
+    if operador == "$count":
+        return len(documentos)
+    if operador == "$percentile":
+        valores = [evaluar(argumento["input"], d) for d in documentos]
+        return [_percentil(valores, p) for p in argumento["p"]]
+    valores = [evaluar(argumento, d) for d in documentos]
+    if operador == "$sum":
+        return sum(v for v in valores if _numero(v))
+    if operador == "$avg":
+        numeros = [v for v in valores if _numero(v)]
+        return sum(numeros) / len(numeros) if numeros else None
+    if operador in ("$min", "$max"):
+        presentes = [v for v in valores if v is not None]
+        if not presentes:
+            return None
+        return (min if operador == "$min" else max)(presentes, key=_clave_orden)
+    if operador == "$push":
+        return valores
+    if operador == "$addToSet":
+        unicos: List[Any] = []
+        for v in valores:
+            if v not in unicos:
+                unicos.append(v)
+        return unicos
+    if operador == "$first":
+        return valores[0] if valores else None
+    if operador == "$last":
+        return valores[-1] if valores else None
+    raise NotImplementedError(f"Acumulador {operador} no soportado por el motor en memoria")
+
+# Etapas de agregación --------------------------------------------------------
+
+def _etapa_group(documentos: List[Dict], especificacion: Dict) -> List[Dict]:
+    grupos: Dict[Any, Tuple[Any, List[Dict]]] = {}
+    for d in documentos:
+        clave = evaluar(especificacion["_id"], d)
+        grupos.setdefault(_congelar(clave), (clave, []))[1].append(d)
+    resultado = []
+    for clave, miembros in grupos.values():
+        salida = {"_id": clave}
+        for campo, acumulador in especificacion.items():
+            if campo != "_id":
+                operador, argumento = next(iter(acumulador.items()))
+                salida[campo] = _acumular(operador, argumento, miembros)
+        resultado.append(salida)
+    return resultado
+
+def _etapa_project(documentos: List[Dict], especificacion: Dict) -> List[Dict]:
+    campos = {c: v for c, v in especificacion.items() if c != "_id"}
+    if campos and all(v in (0, False) for v in campos.values()) or (not campos and especificacion.get("_id") in (0, False)):
+        return [proyectar(d, especificacion) for d in documentos]
+    resultado = []
+    for d in documentos:
+        salida: Dict = {}
+        if especificacion.get("_id", 1) in (1, True) and "_id" in d:
+            salida["_id"] = d["_id"]
+        elif especificacion.get("_id") not in (0, 1, True, False, None):
+            salida["_id"] = evaluar(especificacion["_id"], d)
+        for campo, valor in campos.items():
+            if valor in (1, True):
+                _incluir(d, campo.split("."), salida)
+            else:
+                _fijar(salida, campo, evaluar(valor, d))
+        resultado.append(salida)
+    return resultado
+
+def _ventana(valores: List[Any], i: int, limites: List[Any]) -> List[Any]:
+    desde = 0 if limites[0] == "unbounded" else i + (0 if limites[0] == "current" else limites[0])
+    hasta = len(valores) - 1 if limites[1] == "unbounded" else i + (0 if limites[1] == "current" else limites[1])
+    return valores[max(0, desde):max(0, hasta + 1)]
+
+def _etapa_ventanas(documentos: List[Dict], especificacion: Dict) -> List[Dict]:
+    particiones: Dict[Any, List[Dict]] = {}
+    for d in documentos:
+        particiones.setdefault(_congelar(evaluar(especificacion.get("partitionBy"), d)), []).append(d)
+    resultado = []
+    for miembros in particiones.values():
+        _ordenar(miembros, _normalizar_orden(especificacion.get("sortBy")))
+        for campo, salida in especificacion["output"].items():
+            if "$shift" in salida:
+                desplazamiento = salida["$shift"]
+                valores = [evaluar(desplazamiento["output"], d) for d in miembros]
+                for i, d in enumerate(miembros):
+                    j = i + desplazamiento["by"]
+                    d[campo] = valores[j] if 0 <= j < len(valores) else desplazamiento.get("default")
+                continue
+            operador = next(k for k in salida if k != "window")
+            limites = salida.get("window", {}).get("documents", ["unbounded", "unbounded"])
+            for i, d in enumerate(miembros):
+                d[campo] = _acumular(operador, salida[operador], _ventana(miembros, i, limites))
+        resultado.extend(miembros)
+    return resultado
+
+
+class CursorMemoria:
+    """Cursor de find: se puede ordenar y limitar antes de iterar."""
+
+    def __init__(self, coleccion: "ColeccionMemoria", filtro: Optional[Dict], proyeccion: Any,
+                 orden: Any = None, limite: int = 0, salteo: int = 0):
+        self._coleccion = coleccion
+        self._filtro = filtro or {}
+        self._proyeccion = proyeccion
+        self._orden = _normalizar_orden(orden)
+        self._limite = limite
+        self._salteo = salteo
+        self._iterador: Optional[Iterator[Dict]] = None
+
+    def sort(self, orden: Any, direccion: Optional[int] = None) -> "CursorMemoria":
+        self._orden = _normalizar_orden(orden, direccion)
+        return self
+
+    def limit(self, limite: int) -> "CursorMemoria":
+        self._limite = limite
+        return self
+
+    def skip(self, salteo: int) -> "CursorMemoria":
+        self._salteo = salteo
+        return self
+
+    def _resultados(self) -> List[Dict]:
+        documentos = self._coleccion._buscar(self._filtro)
+        if self._orden:
+            documentos = _ordenar(documentos, self._orden)
+        documentos = documentos[self._salteo:]
+        if self._limite:
+            documentos = documentos[:self._limite]
+        return [proyectar(d, self._proyeccion) for d in documentos]
+
+    def __iter__(self) -> Iterator[Dict]:
+        if self._iterador is None:
+            with metricas.span("mongo", "find", self._coleccion.name):
+                self._iterador = iter(self._resultados())
+        return self._iterador
+
+    def __next__(self) -> Dict:
+        return next(iter(self))
+
+    def explain(self) -> Dict:
+        """Plan aproximado: IXSCAN si un índice acota los candidatos, SORT si hay que ordenar."""
+        indice = self._coleccion._indice_para(self._filtro)
+        plan: Dict = {"stage": "IXSCAN", "indexName": indice.nombre} if indice else {"stage": "COLLSCAN"}
+        if indice:
+            plan = {"stage": "FETCH", "inputStage": plan}
+        ordenado = False
+        if indice:
+            # El índice ya entrega ordenado por los campos que siguen a las igualdades
+            restantes = [c for c, _ in indice.claves]
+            while restantes and len(_igualdades(self._filtro.get(restantes[0])) or []) == 1:
+                restantes.pop(0)
+            ordenado = [c for c, _ in self._orden] == restantes[:len(self._orden)]
+        if self._orden and not ordenado:
+            plan = {"stage": "SORT", "inputStage": plan}
+        return {"queryPlanner": {"winningPlan": plan}}
+
+
+class _Indice:
+    def __init__(self, claves: List[Tuple[str, int]], nombre: str, unico: bool, parcial: Optional[Dict]):
+        self.claves = claves
+        self.nombre = nombre
+        self.unico = unico
+        self.parcial = parcial
+        self.primera = claves[0][0]
+        # Valor del primer campo -> ids (los arrays se indexan por elemento)
+        self.por_primera: Dict[Any, set] = {}
+        # Clave completa -> id, para los índices únicos
+        self.unicos: Dict[Any, Any] = {}
+
+    def incluye(self, doc: Dict) -> bool:
+        return self.parcial is None or coincide(doc, self.parcial)
+
+    def clave(self, doc: Dict) -> Any:
+        return _congelar(tuple(_valor(doc, c) for c, _ in self.claves))
+
+    def _primeras(self, doc: Dict) -> List[Any]:
+        valor = _valor(doc, self.primera)
+        return [_congelar(v) for v in valor] if isinstance(valor, list) and valor else [_congelar(valor)]
+
+    def conflicto(self, doc: Dict) -> bool:
+        if not self.unico or not self.incluye(doc):
+            return False
+        otro = self.unicos.get(self.clave(doc))
+        return otro is not None and otro != doc["_id"]
+
+    def agregar(self, doc: Dict) -> None:
+        if not self.incluye(doc):
+            return
+        for v in self._primeras(doc):
+            self.por_primera.setdefault(v, set()).add(doc["_id"])
+        if self.unico:
+            self.unicos[self.clave(doc)] = doc["_id"]
+
+    def quitar(self, doc: Dict) -> None:
+        if not self.incluye(doc):
+            return
+        for v in self._primeras(doc):
+            ids = self.por_primera.get(v)
+            if ids:
+                ids.discard(doc["_id"])
+                if not ids:
+                    del self.por_primera[v]
+        if self.unico and self.unicos.get(self.clave(doc)) == doc["_id"]:
+            del self.unicos[self.clave(doc)]
+
+
+_RANGOS = {"$gt", "$gte", "$lt", "$lte"}
+
+def _es_rango(condicion: Any) -> bool:
+    return isinstance(condicion, dict) and bool(condicion) and set(condicion) <= _RANGOS
+
+def _igualdades(condicion: Any) -> Optional[List[Any]]:
+    """Valores exactos que pide la condición de un campo (igualdad o $in), o None."""
+    if isinstance(condicion, dict):
+        if "$eq" in condicion:
+            return [condicion["$eq"]]
+        if "$in" in condicion and not any(isinstance(v, (re.Pattern, dict)) for v in condicion["$in"]):
+            return list(condicion["$in"])
+        return None
+    if isinstance(condicion, re.Pattern) or condicion is None:
+        return None
+    return [condicion]
+
+
+def _comando(nombre: str) -> Callable:
+    """Mide el método como el comando de MongoDB equivalente (ver metricas.py)."""
+    def decorador(metodo: Callable) -> Callable:
+        @functools.wraps(metodo)
+        def medido(self: "ColeccionMemoria", *args: Any, **kwargs: Any) -> Any:
+            with metricas.span("mongo", nombre, self.name):
+                return metodo(self, *args, **kwargs)
+        return medido
+    return decorador
+
+
+class ColeccionMemoria:
+    def __init__(self, nombre: str = "", documentos: Optional[Iterable[Dict]] = None,
+                 latencia: float = 0.0, base: Optional["BaseMemoria"] = None):
+        self.name = nombre
+        self.latencia = latencia
+        self.idas_y_vueltas = 0
+        self._base = base
+        self._lock = threading.RLock()
+        self._documentos: Dict[Any, Dict] = {}
+        # Orden de inserción de cada _id, para devolver los candidatos de un índice en ese orden
+        self._posicion: Dict[Any, int] = {}
+        self._secuencia = count()
+        self._indices: Dict[str, _Indice] = {}
+        for d in documentos or []:
+            self._insertar(_copiar(d))
+
+    @property
+    def documentos(self) -> List[Dict]:
+        return list(self._documentos.values())
+
+    def _red(self) -> None:
+        self.idas_y_vueltas += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    # Índices -----------------------------------------------------------------
+    @_comando("createIndexes")
+    def create_index(self, claves: Any, unique: bool = False, name: Optional[str] = None,
+                     partialFilterExpression: Optional[Dict] = None, **opciones: Any) -> str:
+        claves = _normalizar_orden(claves)
+        nombre = name or "_".join(f"{c}_{d}" for c, d in claves)
+        with self._lock:
+            self._red()
+            if nombre in self._indices:
+                return nombre
+            indice = _Indice(claves, nombre, unique, partialFilterExpression)
+            for doc in self._documentos.values():
+                if indice.conflicto(doc):
+                    raise DuplicateKeyError(f"E11000 duplicate key error index: {nombre}", 11000)
+                indice.agregar(doc)
+            self._indices[nombre] = indice
+            return nombre
+
+    def list_indexes(self) -> List[Dict]:
+        return [{"name": "_id_", "key": {"_id": 1}}] + [
+            {"name": i.nombre, "key": dict(i.claves), "unique": i.unico} for i in self._indices.values()
+        ]
+
+    def drop_index(self, nombre: str) -> None:
+        with self._lock:
+            self._indices.pop(nombre, None)
+
+    def drop(self) -> None:
+        with self._lock:
+            self._documentos.clear()
+            self._posicion.clear()
+            self._indices.clear()
+
+    def _indice_para(self, filtro: Dict) -> Optional[_Indice]:
+        """Índice (no parcial) cuyo primer campo tiene igualdad en el filtro, o un rango."""
+        por_rango = None
+        for indice in self._indices.values():
+            if indice.parcial is not None or indice.primera not in filtro:
+                continue
+            condicion = filtro[indice.primera]
+            if _igualdades(condicion) is not None:
+                return indice
+            if por_rango is None and _es_rango(condicion):
+                por_rango = indice
+        return por_rango
+
+    def _candidatos(self, indice: _Indice, condicion: Any) -> set:
+        valores = _igualdades(condicion)
+        if valores is None:
+            # Rango: se recorren los valores distintos del índice, no los documentos
+            return set().union(*(ids for v, ids in indice.por_primera.items() if _cumple_campo([v], condicion)))
+        return set().union(*(indice.por_primera.get(_congelar(v), ()) for v in valores))
+
+    def _buscar(self, filtro: Dict) -> List[Dict]:
+        """Documentos (sin copiar) que cumplen el filtro, usando _id o un índice si se puede."""
+        with self._lock:
+            self._red()
+            ids = _igualdades(filtro.get("_id")) if "_id" in filtro else None
+            if ids is None:
+                indice = self._indice_para(filtro)
+                if indice is not None:
+                    try:
+                        # Conservar el orden de inserción como MongoDB sin índice
+                        ids = sorted(self._candidatos(indice, filtro[indice.primera]), key=self._posicion.__getitem__)
+                    except TypeError:
+                        ids = None
+                    else:
+                        # Con valores simples el índice ya garantiza la condición de ese campo
+                        valores = _igualdades(filtro[indice.primera])
+                        if valores is not None and not any(isinstance(v, (list, dict)) for v in valores):
+                            filtro = {c: v for c, v in filtro.items() if c != indice.primera}
+            if ids is None:
+                return [d for d in self._documentos.values() if coincide(d, filtro)]
+            return [d for d in (self._documentos.get(i) for i in ids) if d is not None and coincide(d, filtro)]
+
+    # Escrituras --------------------------------------------------------------
+    def _insertar(self, doc: Dict) -> Any:
+        if "_id" not in doc:
+            doc["_id"] = ObjectId()
+        if doc["_id"] in self._documentos:
+            raise DuplicateKeyError(f"E11000 duplicate key error index: _id_ dup key: {doc['_id']}", 11000)
+        for indice in self._indices.values():
+            if indice.conflicto(doc):
+                raise DuplicateKeyError(f"E11000 duplicate key error index: {indice.nombre}", 11000)
+        self._documentos[doc["_id"]] = doc
+        self._posicion[doc["_id"]] = next(self._secuencia)
+        for indice in self._indices.values():
+            indice.agregar(doc)
+        return doc["_id"]
+
+    def _reemplazar(self, anterior: Dict, nuevo: Dict) -> None:
+        # Solo se tocan los índices cuya clave cambió (los parciales pueden cambiar de pertenencia)
+        cambiados = [i for i in self._indices.values()
+                     if i.parcial is not None or i.clave(anterior) != i.clave(nuevo)]
+        for indice in cambiados:
+            if indice.conflicto(nuevo):
+                raise DuplicateKeyError(f"E11000 duplicate key error index: {indice.nombre}", 11000)
+        for indice in cambiados:
+            indice.quitar(anterior)
+            indice.agregar(nuevo)
+        self._documentos[nuevo["_id"]] = nuevo
+
+    @_comando("insert")
+    def insert_one(self, documento: Dict) -> _Resultado:
+        with self._lock:
+            self._red()
+            # pymongo agrega el _id al documento recibido
+            documento.setdefault("_id", ObjectId())
+            return _Resultado(inserted_id=self._insertar(_copiar(documento)))
+
+    @_comando("insert")
+    def insert_many(self, documentos: List[Dict], ordered: bool = True) -> _Resultado:
+        with self._lock:
+            self._red()
+            insertados, errores = [], []
+            for i, documento in enumerate(documentos):
+                documento.setdefault("_id", ObjectId())
+                try:
+                    insertados.append(self._insertar(_copiar(documento)))
+                except DuplicateKeyError as e:
+                    errores.append({"index": i, "code": 11000, "errmsg": str(e), "op": documento})
+                    if ordered:
+                        break
+            if errores:
+                raise BulkWriteError({"writeErrors": errores, "nInserted": len(insertados)})
+            return _Resultado(inserted_ids=insertados)
+
+    def _update(self, filtro: Dict, update: Dict, upsert: bool, multi: bool) -> _Resultado:
+        with self._lock:
+            encontrados = self._buscar(filtro)
+            if not multi:
+                encontrados = encontrados[:1]
+            modificados = 0
+            for doc in encontrados:
+                nuevo = _copiar(doc)
+                _actualizar(nuevo, update, False)
+                if nuevo != doc:
+                    self._reemplazar(doc, nuevo)
+                    modificados += 1
+            upserted_id = None
+            if not encontrados and upsert:
+                nuevo = _documento_upsert(filtro)
+                _actualizar(nuevo, update, True)
+                upserted_id = self._insertar(nuevo)
+            return _Resultado(matched_count=len(encontrados), modified_count=modificados,
+                              upserted_id=upserted_id)
+
+    @_comando("update")
+    def update_one(self, filtro: Dict, update: Dict, upsert: bool = False) -> _Resultado:
+        return self._update(filtro, update, upsert, False)
+
+    @_comando("update")
+    def update_many(self, filtro: Dict, update: Dict, upsert: bool = False) -> _Resultado:
+        return self._update(filtro, update, upsert, True)
+
+    @_comando("update")
+    def replace_one(self, filtro: Dict, documento: Dict, upsert: bool = False) -> _Resultado:
+        return self._update(filtro, documento, upsert, False)
+
+    def _delete(self, filtro: Dict, multi: bool) -> _Resultado:
+        with self._lock:
+            encontrados = self._buscar(filtro)
+            if not multi:
+                encontrados = encontrados[:1]
+            for doc in encontrados:
+                for indice in self._indices.values():
+                    indice.quitar(doc)
+                del self._documentos[doc["_id"]]
+                del self._posicion[doc["_id"]]
+            return _Resultado(deleted_count=len(encontrados))
+
+    @_comando("delete")
+    def delete_one(self, filtro: Dict) -> _Resultado:
+        return self._delete(filtro, False)
+
+    @_comando("delete")
+    def delete_many(self, filtro: Dict) -> _Resultado:
+        return self._delete(filtro, True)
+
+    @_comando("bulkWrite")
+    def bulk_write(self, operaciones: List[Any], ordered: bool = True) -> _Resultado:
+        """Acepta las operaciones de pymongo (InsertOne, UpdateOne, UpdateMany, DeleteOne, ...)."""
+        totales = Counter()
+        errores = []
+        with self._lock:
+            self._red()
+            for i, op in enumerate(operaciones):
+                tipo = type(op).__name__
+                try:
+                    if tipo == "InsertOne":
+                        op._doc.setdefault("_id", ObjectId())
+                        self._insertar(_copiar(op._doc))
+                        totales["inserted_count"] += 1
+                    elif tipo in ("UpdateOne", "UpdateMany", "ReplaceOne"):
+                        r = self._update(op._filter, op._doc, bool(op._upsert), tipo == "UpdateMany")
+                        totales["matched_count"] += r.matched_count
+                        totales["modified_count"] += r.modified_count
+                        totales["upserted_count"] += r.upserted_id is not None
+                    elif tipo in ("DeleteOne", "DeleteMany"):
+                        totales["deleted_count"] += self._delete(op._filter, tipo == "DeleteMany").deleted_count
+                    else:
+                        raise NotImplementedError(f"{tipo} no soportado por el motor en memoria")
+                except DuplicateKeyError as e:
+                    errores.append({"index": i, "code": 11000, "errmsg": str(e)})
+                    if ordered:
+                        break
+        if errores:
+            raise BulkWriteError({"writeErrors": errores, "nInserted": totales["inserted_count"],
+                                  "nMatched": totales["matched_count"], "nModified": totales["modified_count"]})
+        return _Resultado(**{c: totales[c] for c in ("inserted_count", "matched_count", "modified_count",
+                                                     "upserted_count", "deleted_count")})
+
+    # Lecturas ----------------------------------------------------------------
+    def find(self, filtro: Optional[Dict] = None, proyeccion: Any = None, sort: Any = None,
+             limit: int = 0, skip: int = 0, **opciones: Any) -> CursorMemoria:
+        return CursorMemoria(self, filtro, proyeccion or opciones.get("projection"), sort, limit, skip)
+
+    def find_one(self, filtro: Optional[Dict] = None, proyeccion: Any = None, sort: Any = None,
+                 **opciones: Any) -> Optional[Dict]:
+        return next(iter(self.find(filtro, proyeccion, sort, 1, **opciones)), None)
+
+    @_comando("aggregate")
+    def count_documents(self, filtro: Dict, **opciones: Any) -> int:
+        return len(self._buscar(filtro))
+
+    @_comando("count")
+    def estimated_document_count(self) -> int:
+        return len(self._documentos)
+
+    @_comando("aggregate")
+    def aggregate(self, pipeline: List[Dict], **opciones: Any) -> Iterator[Dict]:
+        etapas = list(pipeline)
+        # Un $match inicial usa los índices como en find
+        filtro = etapas.pop(0)["$match"] if etapas and "$match" in etapas[0] else {}
+        documentos = [_copiar(d) for d in self._buscar(filtro)]
+        for etapa in etapas:
+            nombre, especificacion = next(iter(etapa.items()))
+            if nombre == "$match":
+                documentos = [d for d in documentos if coincide(d, especificacion)]
+            elif nombre == "$group":
+                documentos = _etapa_group(documentos, especificacion)
+            elif nombre == "$sort":
+                documentos = _ordenar(documentos, _normalizar_orden(especificacion))
+            elif nombre == "$limit":
+                documentos = documentos[:especificacion]
+            elif nombre == "$skip":
+                documentos = documentos[especificacion:]
+            elif nombre == "$project":
+                documentos = _etapa_project(documentos, especificacion)
+            elif nombre in ("$set", "$addFields"):
+                for d in documentos:
+                    for campo, expresion in especificacion.items():
+                        _fijar(d, campo, evaluar(expresion, d))
+            elif nombre == "$unwind":
+                ruta = (especificacion if isinstance(especificacion, str) else especificacion["path"])[1:]
+                documentos = [dict(d, **{ruta: e}) for d in documentos for e in (_valor(d, ruta) or [])]
+            elif nombre == "$count":
+                documentos = [{especificacion: len(documentos)}] if documentos else []
+            elif nombre == "$setWindowFields":
+                documentos = _etapa_ventanas(documentos, especificacion)
+            elif nombre == "$merge":
+                self._merge(documentos, especificacion)
+                documentos = []
+            else:
+                raise NotImplementedError(f"Etapa {nombre} no soportada por el motor en memoria")
+        return iter(documentos)
+
+    def _merge(self, documentos: List[Dict], especificacion: Dict) -> None:
+        destino = self._base[especificacion["into"]] if self._base else self
+        campos = especificacion.get("on", "_id")
+        campos = [campos] if isinstance(campos, str) else campos
+        al_coincidir = especificacion.get("whenMatched", "merge")
+        sin_coincidir = especificacion.get("whenNotMatched", "insert")
+        for d in documentos:
+            filtro = {c: _valor(d, c) for c in campos}
+            existente = destino.find_one(filtro)
+            if existente is None:
+                if sin_coincidir == "insert":
+                    destino.insert_one(d)
+            elif al_coincidir == "replace":
+                destino.replace_one(filtro, {k: v for k, v in d.items() if k != "_id"})
+            elif al_coincidir == "merge":
+                destino.update_one(filtro, {"$set": {k: v for k, v in d.items() if k != "_id"}})
+            elif al_coincidir == "fail":
+                raise DuplicateKeyError(f"$merge: documento existente para {filtro}", 11000)
+
+
+class BaseMemoria:
+    def __init__(self, nombre: str):
+        self.name = nombre
+        self._colecciones: Dict[str, ColeccionMemoria] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, nombre: str) -> ColeccionMemoria:
+        coleccion = self._colecciones.get(nombre)
+        if coleccion is None:
+            with self._lock:
+                coleccion = self._colecciones.setdefault(nombre, ColeccionMemoria(nombre, base=self))
+        return coleccion
+
+    get_collection = __getitem__
+
+    def __getattr__(self, nombre: str) -> ColeccionMemoria:
+        # base.coleccion, como en pymongo
+        if nombre.startswith("_"):
+            raise AttributeError(nombre)
+        return self[nombre]
+
+    def list_collection_names(self) -> List[str]:
+        return list(self._colecciones)
+
+    def drop_collection(self, nombre: str) -> None:
+        self._colecciones.pop(nombre, None)
+
+
+class ClienteMongoMemoria:
+    def __init__(self):
+        self._bases: Dict[str, BaseMemoria] = {}
+
+    def __getitem__(self, nombre: str) -> BaseMemoria:
+        return self._bases.setdefault(nombre, BaseMemoria(nombre))
+
+    def close(self) -> None:
+        pass
+
+# Redis -----------------------------------------------------------------------
+
+class RedisMemoria:
+    """Subconjunto de redis.Redis: strings con TTL, hashes, sorted sets y pipelines."""
+
+    def __init__(self, latencia: float = 0.0):
+        self.latencia = latencia
+        self.idas_y_vueltas = 0
+        self.comandos = 0
+        self._lock = threading.RLock()
+        self._datos: Dict[str, Tuple[bytes, Optional[float]]] = {}
+        self._hashes: Dict[str, Dict[str, bytes]] = {}
+        # Sorted sets: puntaje por miembro y lista ordenada de (puntaje, miembro)
+        self._zsets: Dict[str, Tuple[Dict[str, float], List[Tuple[float, str]]]] = {}
+
+    def _red(self) -> None:
+        self.idas_y_vueltas += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    @staticmethod
+    def _bytes(valor: Any) -> bytes:
+        return valor if isinstance(valor, bytes) else str(valor).encode("utf-8")
+
+    def _vigente(self, key: str) -> Optional[Tuple[bytes, Optional[float]]]:
+        item = self._datos.get(key)
+        if item and item[1] is not None and item[1] <= time.monotonic():
+            del self._datos[key]
+            return None
+        return item
+
+    # Comandos (cada uno ya descuenta su ida y vuelta) -----------------------
+    def _set(self, key: str, value: Any, ex: Any = None, nx: bool = False) -> Optional[bool]:
+        if nx and self._vigente(key):
+            return None
+        if ex is None:
+            self._datos[key] = (self._bytes(value), None)
+            return True
+        return self._setex(key, ex, value)
+
+    def _setex(self, key: str, ttl: Any, value: Any) -> bool:
+        segundos = ttl.total_seconds() if hasattr(ttl, "total_seconds") else ttl
+        self._datos[key] = (self._bytes(value), time.monotonic() + segundos)
+        return True
+
+    def _get(self, key: str) -> Optional[bytes]:
+        item = self._vigente(key)
+        return item[0] if item else None
+
+    def _mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        return [self._get(k) for k in keys]
+
+    def _ttl(self, key: str) -> int:
+        item = self._vigente(key)
+        if not item:
+            return -2
+        if item[1] is None:
+            return -1
+        return int(round(item[1] - time.monotonic()))
+
+    def _expire(self, key: str, ttl: Any) -> bool:
+        item = self._vigente(key)
+        if not item:
+            return False
+        return self._setex(key, ttl, item[0])
+
+    def _exists(self, *keys: str) -> int:
+        return sum(1 for k in keys if self._vigente(k) or k in self._hashes or k in self._zsets)
+
+    def _delete(self, *keys: str) -> int:
+        borrados = 0
+        for k in keys:
+            borrados += any([self._datos.pop(k, None) is not None, self._hashes.pop(k, None) is not None,
+                             self._zsets.pop(k, None) is not None])
+        return borrados
+
+    def _incr(self, key: str) -> int:
+        item = self._vigente(key)
+        valor = int(item[0]) + 1 if item else 1
+        self._datos[key] = (self._bytes(valor), item[1] if item else None)
+        return valor
+
+    def _hset(self, key: str, campo: str, value: Any) -> int:
+        nuevo = campo not in self._hashes.get(key, {})
+        self._hashes.setdefault(key, {})[campo] = self._bytes(value)
+        return int(nuevo)
+
+    def _hsetnx(self, key: str, campo: str, value: Any) -> int:
+        if campo in self._hashes.get(key, {}):
+            return 0
+        return self._hset(key, campo, value)
+
+    def _hget(self, key: str, campo: str) -> Optional[bytes]:
+        return self._hashes.get(key, {}).get(campo)
+
+    def _hmget(self, key: str, campos: List[str]) -> List[Optional[bytes]]:
+        h = self._hashes.get(key, {})
+        return [h.get(c) for c in campos]
+
+    def _hdel(self, key: str, *campos: str) -> int:
+        h = self._hashes.get(key, {})
+        return sum(1 for c in campos if h.pop(c, None) is not None)
+
+    def _zadd(self, key: str, mapping: Dict[str, float], nx: bool = False, xx: bool = False) -> int:
+        puntajes, orden = self._zsets.setdefault(key, ({}, []))
+        nuevos = 0
+        for miembro, puntaje in mapping.items():
+            if miembro not in puntajes and xx:
+                continue
+            if miembro in puntajes:
+                if nx:
+                    continue
+                del orden[bisect_left(orden, (puntajes[miembro], miembro))]
+            else:
+                nuevos += 1
+            puntajes[miembro] = float(puntaje)
+            insort(orden, (float(puntaje), miembro))
+        return nuevos
+
+    def _zscore(self, key: str, miembro: str) -> Optional[float]:
+        return self._zsets.get(key, ({}, []))[0].get(miembro)
+
+    def _zrem(self, key: str, *miembros: str) -> int:
+        puntajes, orden = self._zsets.get(key, ({}, []))
+        quitados = 0
+        for miembro in miembros:
+            if miembro in puntajes:
+                del orden[bisect_left(orden, (puntajes.pop(miembro), miembro))]
+                quitados += 1
+        return quitados
+
+    def _rango(self, key: str, minimo: Any, maximo: Any) -> Tuple[int, int]:
+        orden = self._zsets.get(key, ({}, []))[1]
+        return (bisect_left(orden, (float(minimo),)),
+                bisect_right(orden, (float(maximo), chr(0x10FFFF))))
+
+    def _zrangebyscore(self, key: str, minimo: Any, maximo: Any,
+                       start: Optional[int] = None, num: Optional[int] = None) -> List[bytes]:
+        desde, hasta = self._rango(key, minimo, maximo)
+        if start is not None:
+            desde, hasta = desde + start, min(hasta, desde + start + num)
+        return [m.encode("utf-8") for _, m in self._zsets.get(key, ({}, []))[1][desde:hasta]]
+
+    def _zcard(self, key: str) -> int:
+        return len(self._zsets.get(key, ({}, []))[0])
+
+    def _zcount(self, key: str, minimo: Any, maximo: Any) -> int:
+        desde, hasta = self._rango(key, minimo, maximo)
+        return hasta - desde
+
+    def _flushdb(self) -> bool:
+        self._datos.clear()
+        self._hashes.clear()
+        self._zsets.clear()
+        return True
+
+    def _ping(self) -> bool:
+        return True
+
+    def _ejecutar(self, nombre: str, *args: Any, **kwargs: Any) -> Any:
+        self.comandos += 1
+        return getattr(self, f"_{nombre}")(*args, **kwargs)
+
+    def __getattr__(self, nombre: str):
+        if hasattr(type(self), f"_{nombre}"):
+            def comando(*args: Any, **kwargs: Any) -> Any:
+                with self._lock:
+                    self._red()
+                    return self._ejecutar(nombre, *args, **kwargs)
+            return comando
+        raise AttributeError(nombre)
+
+    def pipeline(self, transaction: bool = True) -> "PipelineMemoria":
+        return PipelineMemoria(self)
+
+    def close(self) -> None:
+        pass
+
+
+class PipelineMemoria:
+    """Encola comandos y los ejecuta juntos (de forma atómica) en una ida y vuelta."""
+
+    def __init__(self, redis_memoria: RedisMemoria):
+        self._redis = redis_memoria
+        self._pendientes: List[Tuple[str, tuple, Dict]] = []
+
+    def __getattr__(self, nombre: str):
+        def encolar(*args: Any, **kwargs: Any) -> "PipelineMemoria":
+            self._pendientes.append((nombre, args, kwargs))
+            return self
+        return encolar
+
+    def execute(self) -> List[Any]:
+        with self._redis._lock:
+            self._redis._red()
+            resultados = [self._redis._ejecutar(n, *a, **k) for n, a, k in self._pendientes]
+        self._pendientes = []
+        return resultados
+
+    def __enter__(self) -> "PipelineMemoria":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._pendientes = []
+
+# Red médico-paciente ---------------------------------------------------------
+
+class GrafoMemoria:
+    """Relaciones SIGUE en diccionarios de adyacencia, con los métodos de interaccion_red.GrafoNeo4j."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.usuarios: Dict[str, Dict] = {}
+        # médico -> paciente -> propiedades de la relación (el mismo dict en ambos sentidos)
+        self.siguiendo: Dict[str, Dict[str, Dict]] = {}
+        self.seguidores: Dict[str, Dict[str, Dict]] = {}
+
+    def asegurar_restricciones(self) -> None:
+        pass
+
+    def agregar(self, dni_medico: str, dni_paciente: str, ultimo_turno: Optional[datetime] = None,
+                turnos: Optional[int] = None) -> bool:
+        """Crea o actualiza la relación; devuelve True si es nueva (carga directa, sin nombres)."""
+        with self._lock:
+            relacion = self.siguiendo.get(dni_medico, {}).get(dni_paciente)
+            if relacion is None:
+                relacion = {"ultimo_turno": ultimo_turno, "turnos": turnos}
+                self.siguiendo.setdefault(dni_medico, {})[dni_paciente] = relacion
+                self.seguidores.setdefault(dni_paciente, {})[dni_medico] = relacion
+                self.usuarios.setdefault(dni_medico, {})
+                self.usuarios.setdefault(dni_paciente, {})
+                return True
+            if turnos is not None:
+                relacion["turnos"] = turnos
+            if ultimo_turno and (relacion["ultimo_turno"] is None or ultimo_turno > relacion["ultimo_turno"]):
+                relacion["ultimo_turno"] = ultimo_turno
+            return False
+
+    def seguir(self, dni_medico: str, dni_paciente: str, m_nombre: Optional[str] = None,
+               m_apellido: Optional[str] = None, p_nombre: Optional[str] = None,
+               p_apellido: Optional[str] = None) -> bool:
+        with self._lock:
+            for dni, nombre, apellido in ((dni_medico, m_nombre, m_apellido), (dni_paciente, p_nombre, p_apellido)):
+                if dni not in self.usuarios:
+                    self.usuarios[dni] = {"nombre": nombre, "apellido": apellido}
+            return self.agregar(dni_medico, dni_paciente)
+
+    def escribir_lote(self, usuarios: List[Dict], relaciones: List[Dict]) -> Tuple[int, int]:
+        """(relaciones creadas, propiedades cambiadas), como los contadores de Neo4j."""
+        with self._lock:
+            propiedades = 0
+            for u in usuarios:
+                actual = self.usuarios.setdefault(u["dni"], {})
+                for campo in ("nombre", "apellido"):
+                    if u.get(campo) is not None and actual.get(campo) != u[campo]:
+                        actual[campo] = u[campo]
+                        propiedades += 1
+            creadas = 0
+            for r in relaciones:
+                if r["medico"] not in self.usuarios or r["paciente"] not in self.usuarios:
+                    continue
+                previa = dict(self.siguiendo.get(r["medico"], {}).get(r["paciente"]) or {})
+                if self.agregar(r["medico"], r["paciente"], r.get("ultimo_turno"), r.get("turnos")):
+                    creadas += 1
+                else:
+                    actual = self.siguiendo[r["medico"]][r["paciente"]]
+                    propiedades += sum(previa[k] != actual[k] for k in previa)
+            return creadas, propiedades
+
+    def _usuario(self, dni: str) -> Dict:
+        datos = self.usuarios.get(dni, {})
+        return {"dni": dni, "nombre": datos.get("nombre"), "apellido": datos.get("apellido")}
+
+    def _filtrados(self, dni_medico: str, prefijo: Optional[str], visto_desde: Optional[datetime]) -> List[str]:
+        prefijo = prefijo.lower() if prefijo else None
+        dnis = []
+        for dni, relacion in self.siguiendo.get(dni_medico, {}).items():
+            if prefijo:
+                datos = self.usuarios.get(dni, {})
+                if not any((datos.get(c) or "").lower().startswith(prefijo) for c in ("nombre", "apellido")):
+                    continue
+            if visto_desde and not (relacion["ultimo_turno"] and relacion["ultimo_turno"] >= visto_desde):
+                continue
+            dnis.append(dni)
+        return dnis
+
+    def pagina(self, dni_medico: str, despues_de: Optional[str] = None, limite: int = 100,
+               prefijo: Optional[str] = None, visto_desde: Optional[datetime] = None) -> List[Dict]:
+        with self._lock:
+            dnis = sorted(self._filtrados(dni_medico, prefijo, visto_desde))
+            desde = bisect_right(dnis, despues_de) if despues_de is not None else 0
+            return [dict(self._usuario(dni), ultimo_turno=self.siguiendo[dni_medico][dni]["ultimo_turno"])
+                    for dni in dnis[desde:desde + limite]]
+
+    def contar(self, dni_medico: str, prefijo: Optional[str] = None,
+               visto_desde: Optional[datetime] = None) -> int:
+        with self._lock:
+            if not prefijo and not visto_desde:
+                return len(self.siguiendo.get(dni_medico, {}))
+            return len(self._filtrados(dni_medico, prefijo, visto_desde))
+
+    def medicos_compartidos(self, dni_medico: str, limite: int) -> List[Dict]:
+        with self._lock:
+            compartidos: Counter = Counter()
+            for paciente in self.siguiendo.get(dni_medico, {}):
+                compartidos.update(self.seguidores[paciente].keys())
+            del compartidos[dni_medico]
+            mejores = sorted(compartidos.items(), key=lambda item: (-item[1], item[0]))[:limite]
+            return [dict(self._usuario(dni), compartidos=n) for dni, n in mejores]
+
+    def equipo_atencion(self, dni_paciente: str) -> List[Dict]:
+        with self._lock:
+            equipo = [dict(self._usuario(dni), **relacion)
+                      for dni, relacion in self.seguidores.get(dni_paciente, {}).items()]
+        equipo.sort(key=lambda m: m["dni"])
+        equipo.sort(key=lambda m: m["ultimo_turno"] or datetime.min, reverse=True)
+        return equipo
+
+    def vecindario(self, dni: str, saltos: int, limite: int) -> List[str]:
+        with self._lock:
+            vistos = {dni}
+            encontrados: List[str] = []
+            frontera = deque([(dni, 0)])
+            while frontera and len(encontrados) < limite:
+                actual, distancia = frontera.popleft()
+                if distancia == saltos:
+                    continue
+                for vecino in (*self.siguiendo.get(actual, {}), *self.seguidores.get(actual, {})):
+                    if vecino not in vistos:
+                        vistos.add(vecino)
+                        encontrados.append(vecino)
+                        frontera.append((vecino, distancia + 1))
+            return encontrados[:limite]
+
+    def distribucion_grados(self, entrantes: bool) -> List[Dict]:
+        with self._lock:
+            adyacencia = self.seguidores if entrantes else self.siguiendo
+            grados = Counter(len(vecinos) for vecinos in adyacencia.values() if vecinos)
+        return [{"grado": g, "usuarios": n} for g, n in sorted(grados.items())]
@@ -0,0 +1,258 @@
+"""Tiempos y cantidad de llamadas a MongoDB, Redis y Neo4j.
+
+Cada llamada a un backend se mide como un span etiquetado con backend,
+operación y destino (colección, prefijo de la llave de Redis o "red") y se
+acumula en un histograma. Se activa con METRICAS=1 o metricas.activar()
+antes de que db cree los clientes; apagado no se instala nada y span()
+devuelve un objeto nulo compartido.
+
+Los ganchos están en los clientes y no en los helpers de db, así se mide
+todo lo que llega al backend (también colecciones usadas directamente,
+cursores y pipelines):
+
+    MongoDB   un CommandListener de pymongo (memoria.py mide lo mismo en el motor en memoria)
+    Redis     instrumentar_redis: un comando o un pipeline es una ida y vuelta
+    Neo4j     instrumentar: cada método del repositorio de la red es una transacción
+
+    metricas.prometheus()   texto en formato de exposición de Prometheus
+    metricas.como_json()    lista de series con llamadas, errores y percentiles aproximados
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+
+METRICAS = os.getenv("METRICAS", "0") == "1"
+
+# Límites superiores de los buckets, en milisegundos
+LIMITES_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class Histograma:
+    __slots__ = ("buckets", "suma", "cantidad", "errores")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LIMITES_MS) + 1)
+        self.suma = 0.0
+        self.cantidad = 0
+        self.errores = 0
+
+    def observar(self, ms: float, error: bool = False) -> None:
+        self.buckets[bisect_left(LIMITES_MS, ms)] += 1
+        self.suma += ms
+        self.cantidad += 1
+        self.errores += error
+
+    def percentil(self, p: float) -> Optional[float]:
+        """Límite del bucket que contiene el percentil (el último bucket no tiene límite)."""
+        if not self.cantidad:
+            return None
+        objetivo, acumulado = p * self.cantidad, 0
+        for limite, n in zip(LIMITES_MS, self.buckets):
+            acumulado += n
+            if acumulado >= objetivo:
+                return limite
+        return float("inf")
+
+
+_lock = threading.Lock()
+_series: Dict[Tuple[str, str, str], Histograma] = {}
+
+def activar(activas: bool = True) -> None:
+    """Prende o apaga la medición; los clientes ya creados no cambian."""
+    global METRICAS
+    METRICAS = activas
+
+def reiniciar() -> None:
+    with _lock:
+        _series.clear()
+
+def observar(backend: str, operacion: str, destino: str, ms: float, error: bool = False) -> None:
+    clave = (backend, operacion, destino)
+    with _lock:
+        histograma = _series.get(clave)
+        if histograma is None:
+            histograma = _series[clave] = Histograma()
+        histograma.observar(ms, error)
+
+
+class _SpanNulo:
+    def __enter__(self) -> "_SpanNulo":
+        return self
+
+    def __exit__(self, *exc: Any) -> bool:
+        return False
+
+_NULO = _SpanNulo()
+
+
+class Span:
+    __slots__ = ("backend", "operacion", "destino", "_inicio")
+
+    def __init__(self, backend: str, operacion: str, destino: str):
+        self.backend = backend
+        self.operacion = operacion
+        self.destino = destino
+
+    def __enter__(self) -> "Span":
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo: Any, *exc: Any) -> bool:
+        observar(self.backend, self.operacion, self.destino,
+                 (time.perf_counter() - self._inicio) * 1000, tipo is not None)
+        return False
+
+def span(backend: str, operacion: str, destino: str = ""):
+    """Mide el bloque `with` como una llamada al backend (no hace nada si está apagado)."""
+    if not METRICAS:
+        return _NULO
+    return Span(backend, operacion, destino)
+
+# Ganchos de los clientes --------------------------------------------------------
+
+def escuchas_mongo() -> List[Any]:
+    """event_listeners para MongoClient: vacío si las métricas están apagadas."""
+    if not METRICAS:
+        return []
+    from pymongo import monitoring
+
+    class EscuchaComandos(monitoring.CommandListener):
+        def __init__(self):
+            # request_id -> colección, de started a succeeded/failed
+            self._destinos: Dict[int, str] = {}
+
+        def started(self, event) -> None:
+            destino = event.command.get(event.command_name)
+            if not isinstance(destino, str):
+                destino = event.command.get("collection", "")
+            self._destinos[event.request_id] = destino
+
+        def succeeded(self, event) -> None:
+            observar("mongo", event.command_name, self._destinos.pop(event.request_id, ""),
+                     event.duration_micros / 1000)
+
+        def failed(self, event) -> None:
+            observar("mongo", event.command_name, self._destinos.pop(event.request_id, ""),
+                     event.duration_micros / 1000, True)
+
+    return [EscuchaComandos()]
+
+def _prefijo(args: tuple) -> str:
+    if not args:
+        return ""
+    llave = args[0][0] if isinstance(args[0], (list, tuple)) and args[0] else args[0]
+    if isinstance(llave, bytes):
+        llave = llave.decode("utf-8", "replace")
+    return llave.split(":", 1)[0] if isinstance(llave, str) else ""
+
+
+class _Instrumentado:
+    """Proxy que mide cada método llamado sobre el objeto envuelto."""
+
+    def __init__(self, objeto: Any, backend: str, destino: Optional[str] = None):
+        object.__setattr__(self, "_objeto", objeto)
+        object.__setattr__(self, "_backend", backend)
+        object.__setattr__(self, "_destino", destino)
+
+    def __getattr__(self, nombre: str) -> Any:
+        atributo = getattr(self._objeto, nombre)
+        if not callable(atributo) or nombre.startswith("_"):
+            return atributo
+        if self._backend == "redis" and nombre == "pipeline":
+            return lambda *args, **kwargs: _PipelineInstrumentado(atributo(*args, **kwargs))
+
+        def medido(*args: Any, **kwargs: Any) -> Any:
+            destino = self._destino if self._destino is not None else _prefijo(args)
+            with span(self._backend, nombre, destino):
+                return atributo(*args, **kwargs)
+        return medido
+
+    def __setattr__(self, nombre: str, valor: Any) -> None:
+        setattr(self._objeto, nombre, valor)
+
+
+class _PipelineInstrumentado:
+    """Los comandos se encolan sin medir; execute es una ida y vuelta."""
+
+    def __init__(self, pipeline: Any):
+        self._pipeline = pipeline
+        self._destino: Optional[str] = None
+
+    def __getattr__(self, nombre: str) -> Any:
+        atributo = getattr(self._pipeline, nombre)
+        if not callable(atributo) or nombre.startswith("_"):
+            return atributo
+
+        def encolar(*args: Any, **kwargs: Any) -> "_PipelineInstrumentado":
+            if self._destino is None:
+                self._destino = _prefijo(args)
+            atributo(*args, **kwargs)
+            return self
+        return encolar
+
+    def execute(self, *args: Any, **kwargs: Any) -> List[Any]:
+        with span("redis", "pipeline", self._destino or ""):
+            try:
+                return self._pipeline.execute(*args, **kwargs)
+            finally:
+                self._destino = None
+
+    def __enter__(self) -> "_PipelineInstrumentado":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._pipeline.__exit__(*exc)
+
+def instrumentar_redis(cliente: Any) -> Any:
+    """Envuelve un cliente de Redis si las métricas están prendidas."""
+    return _Instrumentado(cliente, "redis") if METRICAS else cliente
+
+def instrumentar(objeto: Any, backend: str, destino: str) -> Any:
+    """Envuelve un repositorio (por ejemplo el grafo) si las métricas están prendidas."""
+    return _Instrumentado(objeto, backend, destino) if METRICAS else objeto
+
+# Exportación --------------------------------------------------------------------
+
+def _copia() -> List[Tuple[Tuple[str, str, str], Histograma]]:
+    with _lock:
+        copia = []
+        for clave, h in sorted(_series.items()):
+            nuevo = Histograma()
+            nuevo.buckets, nuevo.suma, nuevo.cantidad, nuevo.errores = list(h.buckets), h.suma, h.cantidad, h.errores
+            copia.append((clave, nuevo))
+        return copia
+
+def llamadas(backend: Optional[str] = None) -> int:
+    """Total de llamadas registradas (idas y vueltas), de un backend o de todos."""
+    with _lock:
+        return sum(h.cantidad for (b, _, _), h in _series.items() if backend is None or b == backend)
+
+def como_json() -> List[Dict]:
+    return [
+        {"backend": b, "operacion": o, "destino": d, "llamadas": h.cantidad, "errores": h.errores,
+         "total_ms": h.suma, "p50_ms": h.percentil(0.50), "p95_ms": h.percentil(0.95), "p99_ms": h.percentil(0.99)}
+        for (b, o, d), h in _copia()
+    ]
+
+def prometheus() -> str:
+    lineas = [
+        "# HELP vidasana_backend_ms Duración de las llamadas a los backends en milisegundos",
+        "# TYPE vidasana_backend_ms histogram",
+    ]
+    errores = []
+    for (b, o, d), h in _copia():
+        etiquetas = f'backend="{b}",operacion="{o}",destino="{d}"'
+        acumulado = 0
+        for limite, n in zip(LIMITES_MS, h.buckets):
+            acumulado += n
+            lineas.append(f'vidasana_backend_ms_bucket{{{etiquetas},le="{limite}"}} {acumulado}')
+        lineas.append(f'vidasana_backend_ms_bucket{{{etiquetas},le="+Inf"}} {h.cantidad}')
+        lineas.append(f"vidasana_backend_ms_sum{{{etiquetas}}} {h.suma:.3f}")
+        lineas.append(f"vidasana_backend_ms_count{{{etiquetas}}} {h.cantidad}")
+        errores.append(f"vidasana_backend_errores_total{{{etiquetas}}} {h.errores}")
+    if errores:
+        lineas += ["# HELP vidasana_backend_errores_total Llamadas a los backends que fallaron",
+                   "# TYPE vidasana_backend_errores_total counter"] + errores
+    return "\n".join(lineas) + "\n"
@@ -0,0 +1,161 @@
+"""Migraciones de una sola vez sobre las bases de VidaSana.
+
+Se ejecutan a mano (o en el deploy) en lugar de correr en cada import de `db`:
+
+    python migraciones.py
+"""
+from typing import Dict, List
+import db
+import fechas
+import historia_clinica
+import indices
+
+# Campos de fecha guardados como texto antes de usar datetime
+CAMPOS_FECHA: Dict[str, List[str]] = {
+    "turnos": ["fecha", "creado"],
+    "habitos": ["fecha", "timestamp"],
+}
+
+# Función para limpiar DNIs duplicados antes de crear el índice
+def _limpiar_duplicados():
+    pipeline = [
+        {"$group": {
+            "_id": "$dni",
+            "doc_id": {"$last": "$_id"},
+            "count": {"$sum": 1}
+        }},
+        {"$match": {
+            "count": {"$gt": 1}
+        }}
+    ]
+    
+    duplicados = list(db.pacientes.aggregate(pipeline, allowDiskUse=True))
+    for dup in duplicados:
+        # Mantener solo el documento más reciente para cada DNI
+        db.pacientes.delete_many({
+            "dni": dup["_id"],
+            "_id": {"$ne": dup["doc_id"]}
+        })
+
+def _preparar_indice_habitos():
+    """Deja un registro por (dni, fecha) y quita el índice viejo no único."""
+    duplicados = db.habitos.aggregate([
+        {"$group": {"_id": {"dni": "$dni", "fecha": "$fecha"},
+                    "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True)
+    for dup in duplicados:
+        # Mantener el primer registro del día
+        db.habitos.delete_many({"_id": {"$in": dup["ids"][1:]}})
+    for idx in db.habitos.list_indexes():
+        if idx.get("name") == "dni_1_fecha_-1" and not idx.get("unique"):
+            db.habitos.drop_index(idx["name"])
+
+def _preparar_indices_turnos():
+    """Marca como `superpuesto` los turnos programados que repiten médico u horario.
+
+    Se conserva el primero de cada grupo; los demás quedan fuera de los
+    índices únicos parciales sin borrar datos.
+    """
+    for campo in ("medico_dni", "dni"):
+        duplicados = db.turnos.aggregate([
+            {"$match": {"estado": "programado"}},
+            {"$group": {"_id": {"clave": f"${campo}", "fecha": "$fecha"},
+                        "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}}
+        ], allowDiskUse=True)
+        for dup in duplicados:
+            db.turnos.update_many({"_id": {"$in": dup["ids"][1:]}}, {"$set": {"estado": "superpuesto"}})
+
+# Crear índices de forma segura
+def setup_indices() -> bool:
+    try:
+        # Primero limpiar duplicados para poder crear los índices únicos
+        _limpiar_duplicados()
+        _preparar_indice_habitos()
+        _preparar_indices_turnos()
+    except Exception as e:
+        print(f"Advertencia al limpiar duplicados: {str(e)}")
+        return False
+    return indices.asegurar_indices()
+
+def _resolver_duplicado(nombre: str, _id, cambios: Dict) -> None:
+    """Un documento que al convertir su fecha repite una clave única ya convertida.
+
+    Igual que en setup_indices: el hábito repetido se borra (queda el ya
+    convertido) y el turno repetido se marca `superpuesto`.
+    """
+    coleccion = db.get_collection(nombre)
+    if nombre == "habitos":
+        coleccion.delete_one({"_id": _id})
+    else:
+        coleccion.update_one({"_id": _id}, {"$set": dict(cambios, estado="superpuesto")})
+
+def migrar_fechas(lote: int = 1000) -> Dict[str, int]:
+    """Convierte a datetime las fechas guardadas como texto, en lotes por _id.
+
+    Corre antes de crear los índices únicos (ver migrar). Si ya existen, los
+    documentos que quedarían repetidos se resuelven con _resolver_duplicado.
+    """
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError
+    convertidos = {}
+    for nombre, campos in CAMPOS_FECHA.items():
+        coleccion = db.get_collection(nombre)
+        filtro = {"$or": [{c: {"$type": "string"}} for c in campos]}
+        proyeccion = {c: 1 for c in campos}
+        total = 0
+        ultimo_id = None
+        while True:
+            consulta = dict(filtro)
+            if ultimo_id is not None:
+                consulta["_id"] = {"$gt": ultimo_id}
+            documentos = list(coleccion.find(consulta, proyeccion).sort("_id", 1).limit(lote))
+            if not documentos:
+                break
+            operaciones, pendientes = [], []
+            for doc in documentos:
+                cambios = {}
+                for c in campos:
+                    if isinstance(doc.get(c), str):
+                        try:
+                            cambios[c] = fechas.a_datetime(doc[c])
+                        except ValueError:
+                            print(f"Advertencia: {nombre} {doc['_id']} tiene {c} inválida: {doc[c]!r}")
+                if cambios:
+                    operaciones.append(UpdateOne({"_id": doc["_id"]}, {"$set": cambios}))
+                    pendientes.append((doc["_id"], cambios))
+            if operaciones:
+                try:
+                    total += coleccion.bulk_write(operaciones, ordered=False).modified_count
+                except BulkWriteError as e:
+                    total += e.details.get("nModified", 0)
+                    for error in e.details["writeErrors"]:
+                        if error.get("code") != 11000:
+                            raise
+                        _resolver_duplicado(nombre, *pendientes[error["index"]])
+                        total += 1
+            ultimo_id = documentos[-1]["_id"]
+        convertidos[nombre] = total
+        print(f"{nombre}: {total} documentos con fechas convertidas")
+    return convertidos
+
+def migrar() -> bool:
+    """Ejecuta todas las migraciones pendientes (son idempotentes).
+
+    Primero se convierten las fechas: dos textos distintos pueden dar el mismo
+    datetime ("2030-01-01" y un registro nuevo del mismo día), y recién con
+    las fechas convertidas setup_indices deduplica y crea los índices únicos.
+    """
+    migrar_fechas()
+    if not setup_indices():
+        return False
+    historias = historia_clinica.migrar_historias()
+    print(f"Historias clínicas movidas a buckets: {historias['migrados']}")
+    for fallido in historias["fallidos"]:
+        print(f"Historia clínica del DNI {fallido['dni']} sin migrar: {fallido['error']}")
+    return not historias["fallidos"]
+
+if __name__ == "__main__":
+    if migrar():
+        print("Migraciones aplicadas correctamente")
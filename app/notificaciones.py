@@ -0,0 +1,210 @@
+"""Bandeja de salida de notificaciones por email.
+
+El flujo que notifica (registrar_turno, registrar_habito, evaluar_riesgo,
+riesgo_lote, recordatorios) solo encola; un grupo de hilos aparte entrega
+en lotes, con reintentos con espera exponencial y un límite de envíos por
+segundo. La cola es una colas.ColaProgramada: un reintento es el mismo
+trabajo con un vencimiento posterior. Si Redis no está disponible se envía
+en el momento, como antes.
+
+El transporte se elige con NOTIFICACIONES_TRANSPORTE:
+
+    consola          imprime el email (db.simular_email), por defecto
+    archivo          agrega una línea JSON por email en NOTIFICACIONES_ARCHIVO
+
+    python notificaciones.py [--hilos 4]    corre los trabajadores
+"""
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+import db
+import colas
+
+NOTIFICACIONES_TRANSPORTE = os.getenv("NOTIFICACIONES_TRANSPORTE", "consola")
+NOTIFICACIONES_ARCHIVO = os.getenv("NOTIFICACIONES_ARCHIVO", "notificaciones.jsonl")
+# Envíos por segundo entre todos los hilos de un proceso (0 = sin límite)
+NOTIFICACIONES_POR_SEGUNDO = float(os.getenv("NOTIFICACIONES_POR_SEGUNDO", 50))
+
+LOTE = 100
+MAX_INTENTOS = 5
+ESPERA_BASE = 2  # segundos; se duplica en cada reintento
+ESPERA_MAXIMA = 300
+
+log = logging.getLogger(__name__)
+
+cola = colas.ColaProgramada("notificaciones")
+
+
+class TransporteConsola:
+    def enviar(self, notificacion: Dict) -> None:
+        db.simular_email(notificacion["para"], notificacion["asunto"], notificacion["cuerpo"])
+
+
+class TransporteArchivo:
+    """Agrega cada email como una línea JSON; reemplaza al servidor SMTP en pruebas."""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+
+    def enviar(self, notificacion: Dict) -> None:
+        linea = json.dumps(dict(notificacion, enviado=time.time()), ensure_ascii=False, default=str)
+        with self._lock, open(self.ruta, "a", encoding="utf-8") as f:
+            f.write(linea + "\n")
+
+
+def crear_transporte(nombre: str = NOTIFICACIONES_TRANSPORTE):
+    if nombre == "archivo":
+        return TransporteArchivo(NOTIFICACIONES_ARCHIVO)
+    return TransporteConsola()
+
+transporte = crear_transporte()
+
+
+class LimitadorTasa:
+    """Balde de fichas compartido por los hilos: `por_segundo` envíos sostenidos."""
+
+    def __init__(self, por_segundo: float):
+        self.por_segundo = por_segundo
+        self._fichas = por_segundo
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def esperar(self) -> None:
+        if not self.por_segundo:
+            return
+        with self._lock:
+            ahora = time.monotonic()
+            self._fichas = min(self.por_segundo, self._fichas + (ahora - self._ultimo) * self.por_segundo)
+            self._ultimo = ahora
+            self._fichas -= 1
+            espera = -self._fichas / self.por_segundo if self._fichas < 0 else 0
+        if espera:
+            time.sleep(espera)
+
+
+class _Metricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.contadores = {"encoladas": 0, "enviadas_en_linea": 0, "entregadas": 0,
+                           "reintentos": 0, "descartadas": 0}
+        # Demora entre encolar y entregar de las últimas entregas (segundos)
+        self.demoras: deque = deque(maxlen=10_000)
+
+    def sumar(self, nombre: str, cantidad: int = 1) -> None:
+        with self._lock:
+            self.contadores[nombre] += cantidad
+
+    def entregada(self, demora: float) -> None:
+        with self._lock:
+            self.contadores["entregadas"] += 1
+            self.demoras.append(demora)
+
+_metricas = _Metricas()
+
+def metricas() -> Dict:
+    """Contadores del proceso, profundidad de la cola y demora de entrega (p50/p95)."""
+    with _metricas._lock:
+        datos: Dict = dict(_metricas.contadores)
+        demoras = sorted(_metricas.demoras)
+    if demoras:
+        datos["demora_p50"] = statistics.median(demoras)
+        datos["demora_p95"] = demoras[max(0, int(len(demoras) * 0.95) - 1)]
+    try:
+        datos.update(cola.estadisticas())
+    except Exception:
+        pass
+    return datos
+
+def _notificacion(para: str, asunto: str, cuerpo: str) -> Dict:
+    return {"para": para, "asunto": asunto, "cuerpo": cuerpo, "encolada": time.time(), "intentos": 0}
+
+def encolar_muchos(emails: Iterable[Tuple[str, str, str]], claves: Optional[List[str]] = None) -> int:
+    """Encola emails (destinatario, asunto, cuerpo); devuelve cuántos quedaron encolados.
+
+    Con `claves` cada email usa esa clave como id, y una clave ya encolada o
+    entregada no se repite. Si no se puede encolar, se envía en el momento.
+    """
+    notificaciones = [_notificacion(*e) for e in emails]
+    if not notificaciones:
+        return 0
+    ids = claves or [uuid.uuid4().hex for _ in notificaciones]
+    try:
+        nuevas = cola.programar((i, n["encolada"], n) for i, n in zip(ids, notificaciones))
+        _metricas.sumar("encoladas", nuevas)
+        return nuevas
+    except Exception as e:
+        print(f"No se pudo encolar la notificación, se envía en el momento: {str(e)}")
+        for n in notificaciones:
+            transporte.enviar(n)
+        _metricas.sumar("enviadas_en_linea", len(notificaciones))
+        return 0
+
+def encolar(para: str, asunto: str, cuerpo: str, clave: Optional[str] = None) -> int:
+    return encolar_muchos([(para, asunto, cuerpo)], [clave] if clave else None)
+
+def _espera(intentos: int) -> float:
+    return min(ESPERA_MAXIMA, ESPERA_BASE * 2 ** (intentos - 1))
+
+def despachar(lote: int = LOTE, limitador: Optional[LimitadorTasa] = None) -> int:
+    """Entrega un lote reclamado de la cola; devuelve cuántas notificaciones procesó."""
+    reclamadas = cola.reclamar(lote)
+    entregadas, reintentos, descartadas = [], [], []
+    for id_, n in reclamadas:
+        if limitador:
+            limitador.esperar()
+        try:
+            transporte.enviar(n)
+        except Exception as e:
+            n["intentos"] += 1
+            n["error"] = str(e)
+            if n["intentos"] >= MAX_INTENTOS:
+                log.warning("Notificación a %s descartada tras %d intentos: %s", n["para"], n["intentos"], e)
+                descartadas.append(id_)
+            else:
+                reintentos.append((id_, time.time() + _espera(n["intentos"]), n))
+            continue
+        entregadas.append(id_)
+        _metricas.entregada(time.time() - n["encolada"])
+    cola.confirmar(entregadas)
+    cola.reprogramar(reintentos)
+    cola.descartar(descartadas)
+    _metricas.sumar("reintentos", len(reintentos))
+    _metricas.sumar("descartadas", len(descartadas))
+    return len(reclamadas)
+
+def correr(hilos: int = 4, intervalo: float = 1.0, detener: Optional[threading.Event] = None) -> List[threading.Thread]:
+    """Lanza `hilos` trabajadores que despachan hasta que se active `detener`."""
+    detener = detener or threading.Event()
+    limitador = LimitadorTasa(NOTIFICACIONES_POR_SEGUNDO)
+
+    def trabajar() -> None:
+        colas.bucle_trabajador(lambda: despachar(LOTE, limitador), LOTE, intervalo, detener, log)
+
+    trabajadores = [threading.Thread(target=trabajar, name=f"notificaciones-{i}", daemon=True)
+                    for i in range(hilos)]
+    for t in trabajadores:
+        t.start()
+    return trabajadores
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(threadName)s %(message)s")
+    hilos = int(sys.argv[sys.argv.index("--hilos") + 1]) if "--hilos" in sys.argv else 4
+    detener = threading.Event()
+    trabajadores = correr(hilos, detener=detener)
+    print(f"Despachando notificaciones con {hilos} hilos ({NOTIFICACIONES_TRANSPORTE})")
+    try:
+        while True:
+            time.sleep(30)
+            print(f"Métricas: {metricas()}")
+    except KeyboardInterrupt:
+        detener.set()
+        for t in trabajadores:
+            t.join()
@@ -0,0 +1,74 @@
+"""Recordatorios de turnos: se programan al reservar y se envían ANTICIPACION antes.
+
+Usa una colas.ColaProgramada con el id del turno como id del recordatorio,
+así reservar o reprogramar el día de nuevo no lo duplica. El despachador
+corre aparte:
+
+    python recordatorios.py            despacha recordatorios vencidos en un bucle
+"""
+import logging
+import sys
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import db
+import colas
+import notificaciones
+
+ANTICIPACION = timedelta(minutes=10)
+LOTE_DESPACHO = 500
+
+log = logging.getLogger(__name__)
+
+cola = colas.ColaProgramada("recordatorios")
+
+def _trabajo(turno_id: str, dni: str, fecha: datetime, mensaje: str) -> Tuple[str, float, Dict]:
+    # Un turno dado con menos anticipación se recuerda en el momento
+    vence = max(fecha - ANTICIPACION, datetime.now())
+    return f"turno:{turno_id}", vence.timestamp(), {"turno_id": turno_id, "dni": dni, "mensaje": mensaje}
+
+def programar(turno_id: str, dni: str, fecha: datetime, mensaje: str) -> bool:
+    return programar_muchos([(turno_id, dni, fecha, mensaje)]) >= 0
+
+def programar_muchos(recordatorios: Iterable[Tuple[str, str, datetime, str]]) -> int:
+    """Programa recordatorios (turno_id, dni, fecha, mensaje); devuelve los nuevos o -1 si falla Redis."""
+    try:
+        return cola.programar(_trabajo(*r) for r in recordatorios)
+    except Exception as e:
+        print(f"Error al programar recordatorios: {str(e)}")
+        return -1
+
+def enviar(recordatorios: List[Dict]) -> None:
+    """Pasa los recordatorios a la bandeja de notificaciones; el mail se busca al enviar para usar el vigente."""
+    usuarios = db.find_usuarios([r["dni"] for r in recordatorios])
+    vigentes = [r for r in recordatorios if usuarios.get(r["dni"])]
+    notificaciones.encolar_muchos(
+        [(usuarios[r["dni"]]["mail"], "Recordatorio de Turno", r["mensaje"]) for r in vigentes],
+        [f"recordatorio:{r.get('turno_id') or uuid.uuid4().hex}" for r in vigentes],
+    )
+
+def despachar(lote: int = LOTE_DESPACHO, entregar: Callable[[List[Dict]], None] = enviar) -> int:
+    """Entrega un lote de recordatorios vencidos; devuelve cuántos se entregaron.
+
+    Si la entrega falla no se confirma: el lote vuelve a vencer pasada la
+    visibilidad de la cola y se reintenta.
+    """
+    reclamados = cola.reclamar(lote)
+    if not reclamados:
+        return 0
+    entregar([datos for _, datos in reclamados])
+    cola.confirmar([id_ for id_, _ in reclamados])
+    return len(reclamados)
+
+def correr(intervalo: float = 1.0, detener: Optional[threading.Event] = None) -> None:
+    """Despacha hasta que se active `detener`; espera `intervalo` cuando no hay nada vencido."""
+    colas.bucle_trabajador(despachar, LOTE_DESPACHO, intervalo, detener or threading.Event(), log)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    try:
+        print(f"Despachando recordatorios ({cola.estadisticas()['programados']} programados)")
+        correr()
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,122 @@
+"""Evaluación de riesgo nocturna para toda la población de pacientes.
+
+    python riesgo_lote.py [--procesos N] [--lote 1000]
+
+Recorre `pacientes` trayendo solo los diagnósticos (de los buckets de
+historia_clinica, un $in por lote), calcula el puntaje en
+procesos en paralelo con las mismas reglas que evaluar_riesgo, lo guarda con
+bulk_write en el campo `riesgo` (el mismo que actualizar_historia_clinica
+suma entrada por entrada) y encola las alertas de riesgo alto
+en notificaciones por lote, con una clave por paciente y día para que volver
+a correr el proceso no las repita.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from datetime import date
+import db
+import historia_clinica
+import notificaciones
+from gestion_turnos import APLICADAS_MAXIMO, RIESGO_ALTO, email_alerta_riesgo, puntaje_riesgo, riesgo_inicial
+
+LOTE = 1000
+
+# (dni, diagnósticos, ids de las entradas más nuevas)
+Fila = Tuple[str, List[str], List[str]]
+
+def _puntuar_lote(filas: List[Fila]) -> List[Tuple[str, Dict]]:
+    # Corre en los procesos del pool
+    return [(dni, riesgo_inicial(diagnosticos, aplicadas)) for dni, diagnosticos, aplicadas in filas]
+
+def _lotes(filas: Iterable[Fila], tamanio: int) -> Iterator[List[Fila]]:
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) == tamanio:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+def puntuar(filas: Iterable[Fila], procesos: Optional[int] = None, lote: int = LOTE) -> Iterator[List[Tuple[str, Dict]]]:
+    """Puntúa (dni, diagnósticos) en paralelo, devolviendo los resultados por lote.
+
+    Mantiene a lo sumo dos lotes por proceso en vuelo para que la memoria no
+    dependa del tamaño de la población.
+    """
+    procesos = procesos or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        pendientes = []
+        for filas_lote in _lotes(filas, lote):
+            pendientes.append(pool.submit(_puntuar_lote, filas_lote))
+            if len(pendientes) >= 2 * procesos:
+                yield pendientes.pop(0).result()
+        for futuro in pendientes:
+            yield futuro.result()
+
+def _filas_pacientes(lote: int) -> Iterator[Fila]:
+    cursor = db.pacientes.find(
+        {"rol": "paciente"},
+        # historiaClinica solo existe en pacientes todavía no migrados a buckets
+        {"_id": 0, "dni": 1, "historiaClinica.diagnostico": 1},
+        batch_size=lote,
+    )
+    for pacientes in _lotes(cursor, lote):
+        # Los diagnósticos de todo el lote en una sola consulta a los buckets
+        historias = historia_clinica.diagnosticos_por_paciente([p["dni"] for p in pacientes], APLICADAS_MAXIMO)
+        for p in pacientes:
+            diagnosticos, aplicadas = historias[p["dni"]]
+            yield p["dni"], ([hc.get("diagnostico", "") for hc in p.get("historiaClinica", [])]
+                             + diagnosticos), aplicadas
+
+def _alertas(puntajes: List[Tuple[str, Dict]]) -> List[Tuple[str, Tuple[str, str, str]]]:
+    """(clave, email) de las alertas de riesgo alto del lote."""
+    altos = {dni: puntaje_riesgo(r) for dni, r in puntajes if puntaje_riesgo(r) >= RIESGO_ALTO}
+    if not altos:
+        return []
+    destinatarios = db.pacientes.find(
+        {"dni": {"$in": list(altos)}}, {"_id": 0, "dni": 1, "nombre": 1, "mail": 1}
+    )
+    hoy = date.today().isoformat()
+    return [(f"riesgo:{p['dni']}:{hoy}", email_alerta_riesgo(p, altos[p["dni"]]))
+            for p in destinatarios if p.get("mail")]
+
+def evaluar_poblacion(procesos: Optional[int] = None, lote: int = LOTE) -> Dict:
+    from pymongo import UpdateOne
+    inicio = time.perf_counter()
+    evaluados = 0
+
+    for puntajes in puntuar(_filas_pacientes(lote), procesos, lote):
+        # Si se agregaron entradas desde la lectura, actualizar_historia_clinica ya
+        # guardó un valor más nuevo; si hay menos contadas que leídas, se corrige.
+        # `aplicadas` evita que una entrada leída acá se vuelva a sumar después
+        db.pacientes.bulk_write([
+            UpdateOne(
+                {"dni": dni, "$or": [{"riesgo.entradas": {"$lte": riesgo["entradas"]}},
+                                     {"riesgo": {"$exists": False}}]},
+                {"$set": {"riesgo": riesgo}}
+            )
+            for dni, riesgo in puntajes
+        ], ordered=False)
+        evaluados += len(puntajes)
+        alertas = _alertas(puntajes)
+        if alertas:
+            notificaciones.encolar_muchos([e for _, e in alertas], [c for c, _ in alertas])
+
+    segundos = time.perf_counter() - inicio
+    return {
+        "evaluados": evaluados,
+        "segundos": segundos,
+        "pacientes_por_segundo": evaluados / segundos if segundos else 0.0,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--procesos", type=int, default=None)
+    parser.add_argument("--lote", type=int, default=LOTE)
+    args = parser.parse_args()
+    resultado = evaluar_poblacion(args.procesos, args.lote)
+    print(f"Pacientes evaluados: {resultado['evaluados']} en {resultado['segundos']:.1f}s "
+          f"({resultado['pacientes_por_segundo']:.0f}/s)")
@@ -1,7 +1,18 @@
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import json
+import logging
+import time
 import db
+import fechas
+import analitica_habitos
+import coincidencias
+import notificaciones
+
+log = logging.getLogger(__name__)
+
+# Campos opcionales que acepta registrar_habitos_lote
+_CAMPOS_LOTE = ["ejercicio", "estres", "frecuencia_ejercicio"]
 
 def validar_habito(data: Dict) -> bool:
     """Valida los datos de un registro de hábitos."""
@@ -21,12 +32,44 @@ def validar_habito(data: Dict) -> bool:
             return False
             
         # Validar fecha
-        datetime.strptime(data["fecha"], "%Y-%m-%d")
+        fechas.a_datetime(data["fecha"])
         return True
         
-    except (ValueError, IndexError):
+    except (ValueError, IndexError, AttributeError):
         return False
 
+def _armar_registro(
+    dni: str,
+    fecha,
+    sueno: str,
+    alimentacion: str,
+    sintomas: str,
+    ejercicio: str = "No realizado",
+    estres: int = 5,
+    frecuencia_ejercicio: int = 0
+) -> Dict:
+    return {
+        "dni": dni,
+        "fecha": fechas.inicio_del_dia(fecha),
+        "sueno": sueno,
+        "sueno_horas": analitica_habitos.horas_sueno(sueno),
+        "alimentacion": alimentacion,
+        "sintomas": sintomas,
+        "ejercicio": ejercicio,
+        "frecuencia_ejercicio": max(0, min(7, int(frecuencia_ejercicio))),  # Clamp entre 0-7
+        "estres": max(1, min(10, int(estres))),  # Clamp entre 1-10
+        "timestamp": datetime.now(),
+        "alerta_sintomas": coincidencias.hay_sintomas_alerta(sintomas)
+    }
+
+def _alertar_sintomas(paciente: Dict, sintomas: str) -> None:
+    notificaciones.encolar(
+        paciente["mail"],
+        "Alerta: Síntomas Reportados",
+        f"Se han detectado síntomas que requieren atención:\n{sintomas}\n\n"
+        f"Por favor, contacte a su médico si los síntomas persisten."
+    )
+
 def registrar_habito(
     dni: str,
     sueno: str,
@@ -38,72 +81,119 @@ def registrar_habito(
 ) -> Optional[str]:
     
     # Verificar que existe el paciente
-    paciente = db.find_one(db.pacientes, {"dni": dni})
+    paciente = db.find_usuario(dni)
     if not paciente:
         print("Paciente no encontrado")
         return None
         
-    registro = {
-        "dni": dni,
-        "fecha": datetime.now().strftime("%Y-%m-%d"),
-        "sueno": sueno,
-        "alimentacion": alimentacion,
-        "sintomas": sintomas,
-        "ejercicio": ejercicio,
-        "frecuencia_ejercicio": max(0, min(7, frecuencia_ejercicio)),  # Clamp entre 0-7
-        "estres": max(1, min(10, estres)),  # Clamp entre 1-10
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
+    registro = _armar_registro(dni, None, sueno, alimentacion, sintomas,
+                               ejercicio, estres, frecuencia_ejercicio)
     
     if not validar_habito(registro):
         print("Datos inválidos")
         return None
         
+    # El índice único (dni, fecha) rechaza un segundo registro en el día
     try:
-        # Verificar si ya existe registro hoy
-        hoy = datetime.now().strftime("%Y-%m-%d")
-        if db.find_one(db.habitos, {"dni": dni, "fecha": hoy}):
-            print("Ya existe un registro para hoy")
-            return None
-            
         _id = db.insert_one(db.habitos, registro)
-        
-        # Analizar síntomas y alertar si es necesario
-        sintomas_alerta = ["dolor intenso", "fiebre", "dificultad respirar", 
-                          "mareo", "desmayo", "pérdida conciencia"]
-                          
-        if any(s in sintomas.lower() for s in sintomas_alerta):
-            db.simular_email(
-                paciente["mail"],
-                "Alerta: Síntomas Reportados",
-                f"Se han detectado síntomas que requieren atención:\n{sintomas}\n\n"
-                f"Por favor, contacte a su médico si los síntomas persisten."
-            )
-            
-        print(f"Registro de hábitos guardado exitosamente")
-        return _id
-        
     except Exception as e:
-        print(f"Error al guardar registro: {str(e)}")
+        if db.es_clave_duplicada(e):
+            print("Ya existe un registro para hoy")
+        else:
+            print(f"Error al guardar registro: {str(e)}")
         return None
 
+    # El registro ya quedó guardado: si falla lo derivado se informa aparte y
+    # se devuelve el id igual (reintentar crearía un duplicado)
+    try:
+        # Mantener los resúmenes semanal y mensual al día
+        analitica_habitos.actualizar_resumenes([registro])
+    except Exception:
+        log.exception("No se actualizaron los resúmenes de %s (reconstruir con "
+                      "analitica_habitos.py --reconstruir %s)", dni, dni)
+    try:
+        # Analizar síntomas y alertar si es necesario
+        if registro["alerta_sintomas"]:
+            _alertar_sintomas(paciente, sintomas)
+    except Exception:
+        log.exception("No se encoló la alerta de síntomas de %s", dni)
+
+    print(f"Registro de hábitos guardado exitosamente")
+    return _id
+
+def registrar_habitos_lote(registros: List[Dict]) -> Dict:
+    """Ingesta en lote de registros de hábitos (integraciones y backfill).
+
+    Cada registro trae dni, fecha, sueno, alimentacion y sintomas (y opcionalmente
+    ejercicio, estres y frecuencia_ejercicio). El control de un registro por día
+    lo hace el índice único (dni, fecha) con un insert_many desordenado, sin
+    lecturas previas. Solo se envían alertas de síntomas por registros de hoy.
+
+    Devuelve un resultado por registro de entrada (`estado`: insertado,
+    duplicado, invalido, paciente_inexistente o error) y el throughput medido.
+    """
+    inicio = time.perf_counter()
+    resultados: List[Dict] = [{"indice": i} for i in range(len(registros))]
+    pacientes = db.find_usuarios([str(r.get("dni")) for r in registros])
+
+    nuevos: List[Tuple[int, Dict]] = []
+    for i, datos in enumerate(registros):
+        dni = str(datos.get("dni"))
+        if dni not in pacientes:
+            resultados[i]["estado"] = "paciente_inexistente"
+            continue
+        try:
+            campos = {k: datos[k] for k in _CAMPOS_LOTE if k in datos}
+            registro = _armar_registro(dni, datos["fecha"], datos["sueno"], datos["alimentacion"],
+                                       datos["sintomas"], **campos)
+        except (KeyError, ValueError, TypeError):
+            registro = None
+        if registro is None or not validar_habito(registro):
+            resultados[i]["estado"] = "invalido"
+            continue
+        nuevos.append((i, registro))
+
+    _, errores = db.insert_many(db.habitos, [r for _, r in nuevos])
+    fallidos = {}
+    for error in errores:
+        i = nuevos[error["index"]][0]
+        fallidos[i] = "duplicado" if error.get("code") == 11000 else "error"
+        if fallidos[i] == "error":
+            resultados[i]["error"] = error.get("errmsg")
+
+    insertados = [r for i, r in nuevos if i not in fallidos]
+    for i, _ in nuevos:
+        resultados[i]["estado"] = fallidos.get(i, "insertado")
+    # Los registros ya quedaron guardados: si fallan los resúmenes se informa y
+    # se siguen devolviendo los resultados y enviando las alertas
+    try:
+        analitica_habitos.actualizar_resumenes(insertados)
+    except Exception:
+        log.exception("No se actualizaron los resúmenes de %d registros (reconstruir con "
+                      "analitica_habitos.py --reconstruir)", len(insertados))
+
+    hoy = fechas.inicio_del_dia()
+    for registro in insertados:
+        if registro["alerta_sintomas"] and registro["fecha"] == hoy:
+            _alertar_sintomas(pacientes[registro["dni"]], registro["sintomas"])
+
+    segundos = time.perf_counter() - inicio
+    return {
+        "resultados": resultados,
+        "insertados": len(insertados),
+        "segundos": segundos,
+        "registros_por_segundo": len(registros) / segundos if segundos else 0.0,
+    }
+
 def consultar_habitos(
     dni: str,
     desde: Optional[str] = None,
-    hasta: Optional[str] = None
+    hasta: Optional[str] = None,
+    limite: int = 30
 ) -> List[Dict]:
     
-    query = {"dni": dni}
-    
-    if desde:
-        query["fecha"] = {"$gte": desde}
-    if hasta:
-        query.setdefault("fecha", {})["$lte"] = hasta
-        
-    registros = list(db.habitos.find(
-        query,
-        sort=[("fecha", -1)]
-    ))
+    # Solo se traen los últimos `limite` registros; el resto con analitica_habitos.listar_habitos
+    registros = analitica_habitos.listar_habitos(dni, desde, hasta, limite=limite)
     
     if not registros:
         print("No se encontraron registros")
@@ -111,7 +201,7 @@ def consultar_habitos(
         
     print("\n Resumen de Hábitos:")
     for r in registros:
-        print(f"\n Fecha: {r['fecha']}")
+        print(f"\n Fecha: {fechas.formatear(r['fecha'], fechas.FORMATO_FECHA)}")
         print(f" Sueño: {r['sueno']}")
         print(f" Alimentación: {r['alimentacion']}")
         print(f" Ejercicio: {r['ejercicio']}")
@@ -122,21 +212,12 @@ def consultar_habitos(
             
     if len(registros) >= 7:
         print("\n Análisis de la última semana:")
-        ultima_semana = registros[:7]
-        horas_sueno = []
-        niveles_estres = []
-        
-        for r in ultima_semana:
-            try:
-                horas_sueno.append(float(r['sueno'].split()[0]))
-                niveles_estres.append(r['estres'])
-            except (ValueError, IndexError):
-                continue
-                
-        if horas_sueno:
-            print(f"Promedio de sueño: {sum(horas_sueno)/len(horas_sueno):.1f} horas")
-        if niveles_estres:
-            print(f"Promedio de estrés: {sum(niveles_estres)/len(niveles_estres):.1f}/10")
+        # Promedios calculados en el servidor sobre los últimos 7 registros del rango
+        resumen = analitica_habitos.resumen_ultimos(dni, 7, desde, hasta) or {}
+        if resumen.get("sueno") is not None:
+            print(f"Promedio de sueño: {resumen['sueno']:.1f} horas")
+        if resumen.get("estres") is not None:
+            print(f"Promedio de estrés: {resumen['estres']:.1f}/10")
             
     return registros
 
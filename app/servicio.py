@@ -0,0 +1,443 @@
+"""Servicio HTTP/JSON de VidaSana para muchos usuarios a la vez.
+
+Expone las operaciones de acciones.py y gestion_* sin input(): cada
+pedido trae su sesión y se atiende en su propio hilo. Todos los hilos
+comparten los clientes de db (MongoClient, el pool de conexiones de Redis y
+el driver de Neo4j son seguros entre hilos).
+
+    python servicio.py [--host 0.0.0.0] [--puerto 8080] [--registro]
+
+Sesiones: POST /sesiones con {"dni", "password"} devuelve un token
+"<dni>.<secreto>" con un secreto al azar; la sesión es la llave
+`sesion:{dni}:{secreto}` en Redis (con el mismo TTL que en la consola, pero
+aparte de `acceso:{dni}`) y cada pedido manda el token en
+`Authorization: Bearer <token>`. DELETE /sesiones cierra solo esa sesión.
+
+    GET    /salud                      estado y backend
+    GET    /metricas                   metricas.prometheus() (METRICAS=1), con cada ruta como backend "http"
+    GET    /metricas.json              metricas.como_json()
+    POST   /usuarios                   alta de pacientes (mismos campos que la consola, sin rol)
+    POST   /medicos                    alta de médicos (médicos)
+    POST   /sesiones                   login
+    DELETE /sesiones                   logout
+    GET    /usuarios/{dni}             datos del usuario (sin contraseña)
+    GET    /historia/{dni}             ?pagina=&tamanio=
+    POST   /historia/{dni}             {"diagnostico", "tratamiento"} (médicos)
+    POST   /habitos                    {"sueno", "alimentacion", "sintomas", ...} del usuario
+    GET    /habitos/{dni}              ?desde=&hasta=&limite=
+    POST   /turnos                     {"fecha", "especialidad", "medico_dni", "dni"}
+    GET    /turnos/libres              ?especialidad=&n=
+    GET    /turnos/{dni}
+    GET    /riesgo/{dni}               puntaje (encola la alerta si es alto, como la consola)
+    GET    /red                        ?despues_de=&prefijo=&limite= (médicos)
+    POST   /red/seguir                 {"dni_paciente"} (médicos)
+
+Los pacientes solo acceden a sus propios datos; los médicos, a los de
+cualquier paciente. Lo que las funciones imprimen se captura por hilo y se
+devuelve en "mensajes". Los parámetros numéricos tienen que ser positivos y
+los tamaños de página se recortan a MAX_PAGINA. Un error inesperado responde
+500 con un mensaje genérico; el detalle queda en el log.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import acciones
+import agenda
+import analitica_habitos
+import db
+import gestion_pacientes
+import gestion_turnos
+import historia_clinica
+import interaccion_red
+import metricas
+import seguimiento_habitos
+
+MAX_CUERPO = 64 * 1024
+# Tope de limite/tamanio/n en las consultas paginadas
+MAX_PAGINA = 500
+
+log = logging.getLogger(__name__)
+
+
+class ErrorHTTP(Exception):
+    def __init__(self, estado: int, mensaje: str):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+class Peticion:
+    __slots__ = ("usuario", "parametros", "consulta", "cuerpo", "secreto")
+
+    def __init__(self, usuario: Optional[Dict], parametros: Dict[str, str], consulta: Dict[str, str], cuerpo: Dict,
+                 secreto: Optional[str] = None):
+        self.usuario = usuario
+        self.parametros = parametros
+        self.consulta = consulta
+        self.cuerpo = cuerpo
+        self.secreto = secreto
+
+    def entero(self, nombre: str, defecto: int, maximo: Optional[int] = None) -> int:
+        try:
+            valor = int(self.consulta.get(nombre, defecto))
+        except ValueError:
+            raise ErrorHTTP(400, f"{nombre} debe ser un número entero")
+        if valor < 1:
+            raise ErrorHTTP(400, f"{nombre} debe ser mayor que cero")
+        return min(valor, maximo) if maximo else valor
+
+
+# Salida por hilo ----------------------------------------------------------------
+
+class _SalidaPorHilo:
+    """Reemplaza a sys.stdout: cada hilo que está capturando escribe en su propio buffer."""
+
+    def __init__(self, original: Any):
+        self._original = original
+        self._local = threading.local()
+
+    def write(self, texto: str) -> int:
+        buffer = getattr(self._local, "buffer", None)
+        return (buffer if buffer is not None else self._original).write(texto)
+
+    def flush(self) -> None:
+        if getattr(self._local, "buffer", None) is None:
+            self._original.flush()
+
+    def __getattr__(self, nombre: str) -> Any:
+        return getattr(self._original, nombre)
+
+    @contextlib.contextmanager
+    def capturar(self):
+        self._local.buffer = buffer = io.StringIO()
+        try:
+            yield buffer
+        finally:
+            self._local.buffer = None
+
+_salida: Optional[_SalidaPorHilo] = None
+
+def _capturar():
+    return _salida.capturar() if _salida else contextlib.nullcontext(io.StringIO())
+
+
+# Rutas --------------------------------------------------------------------------
+
+# (método, patrón, plantilla, función, requiere sesión, rol)
+RUTAS: List[Tuple[str, "re.Pattern", str, Callable, bool, Optional[str]]] = []
+
+def ruta(metodo: str, plantilla: str, sesion: bool = True, rol: Optional[str] = None) -> Callable:
+    patron = re.compile("^" + re.sub(r"\\\{(\w+)\\\}", r"(?P<\1>\\d+)", re.escape(plantilla)) + "$")
+
+    def registrar(funcion: Callable) -> Callable:
+        RUTAS.append((metodo, patron, plantilla, funcion, sesion, rol))
+        return funcion
+    return registrar
+
+def _resolver(metodo: str, camino: str) -> Tuple[Callable, str, Dict[str, str], bool, Optional[str]]:
+    encontrada = False
+    for m, patron, plantilla, funcion, sesion, rol in RUTAS:
+        coincidencia = patron.match(camino)
+        if coincidencia:
+            if m == metodo:
+                return funcion, plantilla, coincidencia.groupdict(), sesion, rol
+            encontrada = True
+    raise ErrorHTTP(405 if encontrada else 404, "Método no permitido" if encontrada else "Ruta inexistente")
+
+def _sesion(autorizacion: Optional[str]) -> Tuple[Dict, str]:
+    """Usuario y secreto de la sesión del encabezado Authorization, validada contra Redis."""
+    if not autorizacion or not autorizacion.startswith("Bearer "):
+        raise ErrorHTTP(401, "Falta el token de sesión")
+    dni, _, secreto = autorizacion[len("Bearer "):].strip().partition(".")
+    if not dni.isdigit() or not secreto or not db.check_session_token(dni, secreto):
+        raise ErrorHTTP(401, "Sesión inválida o vencida")
+    usuario = db.find_usuario(dni)
+    if not usuario:
+        raise ErrorHTTP(401, "Usuario inexistente")
+    return usuario, secreto
+
+def _rol(usuario: Dict) -> str:
+    return str(usuario.get("rol", "")).strip().lower()
+
+def _acceso_a(peticion: Peticion, dni: str) -> None:
+    if peticion.usuario["dni"] != dni and _rol(peticion.usuario) != "medico":
+        raise ErrorHTTP(403, "Sin acceso a los datos de otro paciente")
+
+def _requeridos(cuerpo: Dict, *campos: str) -> None:
+    faltantes = [c for c in campos if cuerpo.get(c) in (None, "")]
+    if faltantes:
+        raise ErrorHTTP(400, f"Faltan campos: {', '.join(faltantes)}")
+
+def _publico(usuario: Dict) -> Dict:
+    return {k: v for k, v in usuario.items() if k not in ("password", "_id")}
+
+def _resultado(valor: Any, rechazo: str, estado: int = 200) -> Tuple[int, Any]:
+    """Las funciones de negocio devuelven None o False cuando no se pudo; el motivo queda en los mensajes."""
+    if valor is None or valor is False:
+        return 400, {"error": rechazo}
+    return estado, valor
+
+@ruta("GET", "/salud", sesion=False)
+def salud(peticion: Peticion) -> Tuple[int, Any]:
+    return 200, {"estado": "ok", "backend": db.VIDASANA_BACKEND, "metricas": metricas.METRICAS}
+
+@ruta("GET", "/metricas", sesion=False)
+def metricas_prometheus(peticion: Peticion) -> Tuple[int, Any]:
+    return 200, metricas.prometheus()
+
+@ruta("GET", "/metricas.json", sesion=False)
+def metricas_json(peticion: Peticion) -> Tuple[int, Any]:
+    return 200, metricas.como_json()
+
+def _alta(peticion: Peticion, rol: str) -> Tuple[int, Any]:
+    datos = dict(peticion.cuerpo)
+    # El rol lo decide la ruta, nunca el cuerpo
+    datos["rol"] = rol
+    datos["dni"] = "".join(filter(str.isdigit, str(datos.get("dni", ""))))
+    datos.setdefault("historiaClinica", [])
+    _id = gestion_pacientes.guardar_paciente(datos)
+    return _resultado(_id and {"id": _id, "dni": datos["dni"]}, "No se pudo crear el usuario", 201)
+
+@ruta("POST", "/usuarios", sesion=False)
+def crear_usuario(peticion: Peticion) -> Tuple[int, Any]:
+    return _alta(peticion, "paciente")
+
+@ruta("POST", "/medicos", rol="medico")
+def crear_medico(peticion: Peticion) -> Tuple[int, Any]:
+    return _alta(peticion, "medico")
+
+@ruta("POST", "/sesiones", sesion=False)
+def iniciar_sesion(peticion: Peticion) -> Tuple[int, Any]:
+    _requeridos(peticion.cuerpo, "dni", "password")
+    dni = str(peticion.cuerpo["dni"])
+    usuario = acciones.verificar_credenciales(dni, str(peticion.cuerpo["password"]))
+    if not usuario:
+        return 401, {"error": "DNI o contraseña incorrectos"}
+    secreto = db.set_session_token(dni)
+    if not secreto:
+        return 503, {"error": "No se pudo abrir la sesión"}
+    return 201, {"token": f"{dni}.{secreto}", "usuario": _publico(usuario), "ttl": db.ACCESO_TTL}
+
+@ruta("DELETE", "/sesiones")
+def cerrar_sesion(peticion: Peticion) -> Tuple[int, Any]:
+    db.revoke_session_token(peticion.usuario["dni"], peticion.secreto)
+    return 200, {"cerrada": True}
+
+@ruta("GET", "/usuarios/{dni}")
+def ver_usuario(peticion: Peticion) -> Tuple[int, Any]:
+    dni = peticion.parametros["dni"]
+    _acceso_a(peticion, dni)
+    usuario = db.find_usuario(dni)
+    if not usuario:
+        return 404, {"error": "Usuario no encontrado"}
+    return 200, _publico(usuario)
+
+@ruta("GET", "/historia/{dni}")
+def ver_historia(peticion: Peticion) -> Tuple[int, Any]:
+    dni = peticion.parametros["dni"]
+    _acceso_a(peticion, dni)
+    return 200, historia_clinica.leer_historia(dni, peticion.entero("pagina", 1), peticion.entero("tamanio", 20, MAX_PAGINA))
+
+@ruta("POST", "/historia/{dni}", rol="medico")
+def agregar_historia(peticion: Peticion) -> Tuple[int, Any]:
+    _requeridos(peticion.cuerpo, "diagnostico")
+    agregada = gestion_pacientes.actualizar_historia_clinica(
+        peticion.parametros["dni"], peticion.cuerpo["diagnostico"], peticion.cuerpo.get("tratamiento", ""))
+    return _resultado(agregada and {"agregada": True}, "No se pudo agregar la historia clínica", 201)
+
+@ruta("POST", "/habitos")
+def registrar_habito(peticion: Peticion) -> Tuple[int, Any]:
+    c = peticion.cuerpo
+    _requeridos(c, "sueno", "alimentacion")
+    _id = seguimiento_habitos.registrar_habito(
+        peticion.usuario["dni"], c["sueno"], c["alimentacion"], c.get("sintomas", ""),
+        c.get("ejercicio", "No realizado"), c.get("estres", 5), c.get("frecuencia_ejercicio", 0))
+    return _resultado(_id and {"id": _id}, "No se pudo registrar el hábito", 201)
+
+@ruta("GET", "/habitos/{dni}")
+def ver_habitos(peticion: Peticion) -> Tuple[int, Any]:
+    dni = peticion.parametros["dni"]
+    _acceso_a(peticion, dni)
+    # Sin los promedios que imprime consultar_habitos: solo los registros
+    return 200, analitica_habitos.listar_habitos(dni, peticion.consulta.get("desde"), peticion.consulta.get("hasta"),
+                                                 limite=peticion.entero("limite", 30, MAX_PAGINA))
+
+@ruta("POST", "/turnos")
+def registrar_turno(peticion: Peticion) -> Tuple[int, Any]:
+    c = peticion.cuerpo
+    _requeridos(c, "fecha", "especialidad", "medico_dni")
+    dni = str(c.get("dni") or peticion.usuario["dni"])
+    _acceso_a(peticion, dni)
+    _id = gestion_turnos.registrar_turno(dni, c["fecha"], c["especialidad"], str(c["medico_dni"]))
+    if not _id:
+        # Como en la consola: se ofrecen los próximos horarios libres
+        return 409, {"error": "No se pudo registrar el turno",
+                     "libres": agenda.proximos_turnos_libres(c["especialidad"], 5, dni=dni)}
+    return 201, {"id": _id}
+
+@ruta("GET", "/turnos/libres")
+def turnos_libres(peticion: Peticion) -> Tuple[int, Any]:
+    especialidad = peticion.consulta.get("especialidad")
+    if not especialidad:
+        raise ErrorHTTP(400, "Falta especialidad")
+    return 200, agenda.proximos_turnos_libres(especialidad, peticion.entero("n", 5, MAX_PAGINA), dni=peticion.usuario["dni"])
+
+@ruta("GET", "/turnos/{dni}")
+def ver_turnos(peticion: Peticion) -> Tuple[int, Any]:
+    dni = peticion.parametros["dni"]
+    _acceso_a(peticion, dni)
+    turnos = gestion_turnos.consultar_turnos_paciente(dni)
+    for t in turnos:
+        if t.get("medico"):
+            t["medico"] = _publico(t["medico"])
+    return 200, turnos
+
+@ruta("GET", "/riesgo/{dni}")
+def ver_riesgo(peticion: Peticion) -> Tuple[int, Any]:
+    dni = peticion.parametros["dni"]
+    _acceso_a(peticion, dni)
+    score = gestion_turnos.evaluar_riesgo(dni)
+    if score is None:
+        return 404, {"error": "Paciente no encontrado"}
+    return 200, {"dni": dni, "puntaje": score}
+
+@ruta("GET", "/red", rol="medico")
+def ver_red(peticion: Peticion) -> Tuple[int, Any]:
+    if not db.get_grafo():
+        return 503, {"error": "Neo4j no disponible"}
+    return 200, interaccion_red.mostrar_red(
+        peticion.usuario["dni"], peticion.consulta.get("despues_de"),
+        peticion.entero("limite", interaccion_red.TAMANIO_PAGINA, MAX_PAGINA), prefijo=peticion.consulta.get("prefijo"))
+
+@ruta("POST", "/red/seguir", rol="medico")
+def seguir(peticion: Peticion) -> Tuple[int, Any]:
+    _requeridos(peticion.cuerpo, "dni_paciente")
+    dni_paciente = "".join(filter(str.isdigit, str(peticion.cuerpo["dni_paciente"])))
+    seguido = acciones.seguir_paciente(peticion.usuario["dni"], dni_paciente)
+    return _resultado(seguido and {"dni_paciente": dni_paciente}, "No se pudo seguir al paciente", 201)
+
+
+# Servidor -----------------------------------------------------------------------
+
+class ManejadorVidaSana(BaseHTTPRequestHandler):
+    # Conexiones persistentes: cada respuesta lleva Content-Length. Sin Nagle,
+    # el cuerpo (escrito después de los encabezados) no espera el ACK demorado del cliente
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    registro = False
+
+    def do_GET(self) -> None:
+        self._atender("GET")
+
+    def do_POST(self) -> None:
+        self._atender("POST")
+
+    def do_DELETE(self) -> None:
+        self._atender("DELETE")
+
+    def _cuerpo(self) -> Dict:
+        try:
+            largo = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            largo = -1
+        # Sin leer el cuerpo la conexión persistente queda desincronizada: se cierra
+        if largo < 0:
+            self.close_connection = True
+            raise ErrorHTTP(400, "Content-Length inválido")
+        if largo > MAX_CUERPO:
+            self.close_connection = True
+            raise ErrorHTTP(413, "Cuerpo demasiado grande")
+        if not largo:
+            return {}
+        try:
+            cuerpo = json.loads(self.rfile.read(largo))
+        except ValueError:
+            raise ErrorHTTP(400, "JSON inválido")
+        if not isinstance(cuerpo, dict):
+            raise ErrorHTTP(400, "Se esperaba un objeto JSON")
+        return cuerpo
+
+    def _atender(self, metodo: str) -> None:
+        partes = urlsplit(self.path)
+        plantilla = "?"
+        with _capturar() as salida:
+            try:
+                # El cuerpo se lee siempre para no desincronizar la conexión persistente
+                cuerpo = self._cuerpo()
+                funcion, plantilla, parametros, sesion, rol = _resolver(metodo, partes.path)
+                with metricas.span("http", metodo, plantilla):
+                    usuario, secreto = _sesion(self.headers.get("Authorization")) if sesion else (None, None)
+                    if rol and _rol(usuario) != rol:
+                        raise ErrorHTTP(403, f"Solo para el rol {rol}")
+                    consulta = {k: v[0] for k, v in parse_qs(partes.query).items()}
+                    estado, respuesta = funcion(Peticion(usuario, parametros, consulta, cuerpo, secreto))
+            except ErrorHTTP as e:
+                estado, respuesta = e.estado, {"error": str(e)}
+            except Exception:
+                log.exception("Error interno en %s %s", metodo, plantilla)
+                estado, respuesta = 500, {"error": "Error interno"}
+        mensajes = [linea.strip() for linea in salida.getvalue().splitlines() if linea.strip()]
+        if isinstance(respuesta, str):
+            self._responder(estado, respuesta.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+            return
+        # Los mensajes de un 500 pueden traer el detalle del error: solo van al log
+        if mensajes and 400 <= estado < 500 and isinstance(respuesta, dict):
+            respuesta["mensajes"] = mensajes
+        datos = json.dumps(respuesta, default=str, ensure_ascii=False).encode("utf-8")
+        self._responder(estado, datos, "application/json; charset=utf-8")
+
+    def _responder(self, estado: int, datos: bytes, tipo: str) -> None:
+        self.send_response(estado)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(datos)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def log_message(self, formato: str, *args: Any) -> None:
+        if self.registro:
+            super().log_message(formato, *args)
+
+
+class ServidorVidaSana(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+def crear_servidor(host: str = "0.0.0.0", puerto: int = 8080, registro: bool = False) -> ServidorVidaSana:
+    """Crea el servidor (puerto 0 = uno libre); se atiende con serve_forever()."""
+    global _salida
+    if _salida is None:
+        _salida = _SalidaPorHilo(sys.stdout)
+        sys.stdout = _salida
+    ManejadorVidaSana.registro = registro
+    return ServidorVidaSana((host, puerto), ManejadorVidaSana)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--puerto", type=int, default=8080)
+    parser.add_argument("--registro", action="store_true", help="registrar cada pedido en stderr")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(threadName)s %(message)s")
+    import vidasana_app
+    vidasana_app.iniciar_trabajadores()
+    servidor = crear_servidor(args.host, args.puerto, args.registro)
+    print(f"VidaSana escuchando en http://{args.host}:{servidor.server_address[1]} ({db.VIDASANA_BACKEND})")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServicio detenido")
+    finally:
+        servidor.server_close()
+        db.cerrar_conexiones()
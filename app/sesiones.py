@@ -0,0 +1,99 @@
+"""Vencimiento de sesiones con un único hilo para todas las sesiones activas.
+
+Reemplaza al watcher por login que consultaba el TTL en un bucle sin pausa.
+Las sesiones se guardan en un heap ordenado por vencimiento y el hilo duerme
+hasta el próximo vencimiento (o hasta que se registre uno más cercano). Al
+vencer, se confirma con Redis en una sola ida y vuelta para todo el lote por
+si la sesión fue renovada mientras tanto.
+"""
+import heapq
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import db
+
+def _avisar_expiracion(dni: str) -> None:
+    print(f"\n Sesión para DNI {dni} expirada.")
+
+class ProgramadorSesiones:
+    def __init__(self, al_expirar: Callable[[str], None] = _avisar_expiracion):
+        self.al_expirar = al_expirar
+        self._heap: List[Tuple[float, str]] = []
+        # Vencimiento vigente por DNI; las entradas del heap que no coinciden
+        # quedaron obsoletas por una renovación o cancelación.
+        self._vencimientos: Dict[str, float] = {}
+        self._cond = threading.Condition()
+        self._hilo: Optional[threading.Thread] = None
+        self._detenido = False
+
+    def registrar(self, dni: str, ttl: int) -> None:
+        vence = time.monotonic() + ttl
+        with self._cond:
+            self._vencimientos[dni] = vence
+            heapq.heappush(self._heap, (vence, dni))
+            # Solo hace falta despertar al hilo si este vencimiento es el próximo
+            if self._heap[0][0] == vence:
+                self._cond.notify()
+            if self._hilo is None:
+                self._detenido = False
+                self._hilo = threading.Thread(target=self._ejecutar, name="sesiones", daemon=True)
+                self._hilo.start()
+
+    def cancelar(self, dni: str) -> None:
+        with self._cond:
+            self._vencimientos.pop(dni, None)
+
+    def activas(self) -> int:
+        with self._cond:
+            return len(self._vencimientos)
+
+    def detener(self) -> None:
+        with self._cond:
+            self._detenido = True
+            self._cond.notify()
+            hilo, self._hilo = self._hilo, None
+        if hilo:
+            hilo.join()
+
+    def _vencidas(self) -> List[str]:
+        """Espera (con el lock tomado) hasta que haya sesiones vencidas y las saca del heap."""
+        while not self._detenido:
+            if not self._heap:
+                self._cond.wait()
+                continue
+            vence, dni = self._heap[0]
+            if self._vencimientos.get(dni) != vence:
+                heapq.heappop(self._heap)
+                continue
+            espera = vence - time.monotonic()
+            if espera > 0:
+                self._cond.wait(espera)
+                continue
+
+            ahora = time.monotonic()
+            vencidas = []
+            while self._heap and self._heap[0][0] <= ahora:
+                vence, dni = heapq.heappop(self._heap)
+                if self._vencimientos.get(dni) == vence:
+                    del self._vencimientos[dni]
+                    vencidas.append(dni)
+            return vencidas
+        return []
+
+    def _ejecutar(self) -> None:
+        while True:
+            with self._cond:
+                vencidas = self._vencidas()
+                if self._detenido:
+                    return
+            if not vencidas:
+                continue
+            # Confirmar con Redis: si alguna sesión se renovó, se reprograma
+            for dni, ttl in db.get_access_ttls(vencidas).items():
+                if ttl:
+                    self.registrar(dni, ttl)
+                else:
+                    self.al_expirar(dni)
+
+# Instancia compartida por todo el proceso
+programador = ProgramadorSesiones()
@@ -0,0 +1,26 @@
+"""Las pruebas corren contra el backend en memoria (memoria.py), sin servicios.
+
+Los módulos de app/ se importan planos (`import db`), como en la aplicación.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "humo: prueba de humo sobre el motor en memoria, no sobre el servicio real")
+
+
+@pytest.fixture(autouse=True)
+def backend_memoria():
+    """Backend en memoria nuevo y caché de usuarios vacía en cada prueba."""
+    db.usar_backend("memoria")
+    db.usuarios_cache.limpiar()
+    yield
+    db.cerrar_conexiones()
+    db.usuarios_cache.limpiar()
@@ -0,0 +1,65 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import agenda
+import db
+import indices
+
+MANIANA = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+
+@pytest.fixture(autouse=True)
+def latencia(monkeypatch):
+    # Una pausa por ida y vuelta para que las reservas concurrentes se crucen
+    indices.asegurar_indices()
+    for nombre in ("turnos", "reservas", "agendas"):
+        monkeypatch.setattr(db.get_collection(nombre), "latencia", 0.001)
+
+
+def _turno(dni, medico_dni, fecha):
+    return {"dni": dni, "medico_dni": medico_dni, "fecha": fecha, "especialidad": "Clínica",
+            "estado": "programado", "creado": datetime.now()}
+
+
+def _en_paralelo(turnos):
+    listos = threading.Barrier(len(turnos))
+    ids = [None] * len(turnos)
+
+    def reservar(i):
+        listos.wait()
+        ids[i] = agenda.reservar(turnos[i])
+
+    hilos = [threading.Thread(target=reservar, args=(i,)) for i in range(len(turnos))]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    return [i for i in ids if i]
+
+
+def test_medico_sin_agenda_acepta_cualquier_horario():
+    assert agenda.reservar(_turno("1", "m", MANIANA + timedelta(hours=10, minutes=10)))
+    assert not agenda.reservar(_turno("2", "m", MANIANA + timedelta(hours=10, minutes=20)))
+    assert agenda.reservar(_turno("2", "m", MANIANA + timedelta(hours=10, minutes=40)))
+
+
+def test_paciente_no_queda_con_turnos_superpuestos_entre_grillas_distintas():
+    agenda.configurar_agenda("a", "Clínica", list(range(7)), "09:00", "18:00", 30)
+    agenda.configurar_agenda("b", "Clínica", list(range(7)), "09:15", "18:00", 45)
+    for ronda in range(10):
+        dia = MANIANA + timedelta(days=ronda)
+        # [9:30, 10:00) con "a" y [9:15, 10:00) con "b": distinto comienzo, mismo paciente
+        ganadores = _en_paralelo([_turno("p", "a", dia + timedelta(hours=9, minutes=30)),
+                                  _turno("p", "b", dia + timedelta(hours=9, minutes=15))])
+        assert len(ganadores) == 1
+    assert db.turnos.count_documents({"dni": "p"}) == 10
+
+
+def test_medico_sin_agenda_no_queda_con_turnos_superpuestos():
+    for ronda in range(10):
+        inicio = MANIANA + timedelta(days=ronda, hours=10)
+        ganadores = _en_paralelo([_turno(str(i), "m", inicio + timedelta(minutes=5 * i)) for i in range(4)])
+        assert len(ganadores) == 1
+    assert db.turnos.count_documents({"medico_dni": "m"}) == 10
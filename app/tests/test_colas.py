@@ -0,0 +1,61 @@
+import threading
+import time
+from collections import Counter
+
+import colas
+import db
+
+
+def _reclamar_en_paralelo(cola, hilos, ahora=None):
+    listos = threading.Barrier(hilos)
+    tomados = Counter()
+    lock = threading.Lock()
+
+    def trabajar():
+        listos.wait()
+        while True:
+            reclamados = cola.reclamar(7, ahora)
+            if not reclamados:
+                return
+            with lock:
+                tomados.update(id_ for id_, _ in reclamados)
+
+    trabajadores = [threading.Thread(target=trabajar) for _ in range(hilos)]
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+    return tomados
+
+
+def test_cada_trabajo_vencido_lo_toma_un_solo_trabajador(monkeypatch):
+    monkeypatch.setattr(db.get_redis(), "latencia", 0.0005)
+    cola = colas.ColaProgramada("prueba")
+    ahora = time.time()
+    assert cola.programar((str(i), ahora - 1, {"n": i}) for i in range(200)) == 200
+    tomados = _reclamar_en_paralelo(cola, 8)
+    assert set(tomados) == {str(i) for i in range(200)}
+    assert max(tomados.values()) == 1
+
+
+def test_trabajo_no_confirmado_vuelve_al_vencer_la_visibilidad():
+    cola = colas.ColaProgramada("prueba", visibilidad=1)
+    ahora = time.time()
+    cola.programar([("a", ahora - 1, {})])
+    assert [i for i, _ in cola.reclamar()] == ["a"]
+    assert cola.reclamar(ahora=ahora + 5) == []  # El reclamo sigue vigente
+    time.sleep(1.1)
+    assert [i for i, _ in cola.reclamar()] == ["a"]
+
+
+def test_reprogramar_y_confirmar_liberan_el_reclamo():
+    cola = colas.ColaProgramada("prueba")
+    ahora = time.time()
+    cola.programar([("a", ahora - 1, {"intento": 0})])
+    cola.reclamar()
+    cola.reprogramar([("a", ahora - 1, {"intento": 1})])
+    assert cola.reclamar() == [("a", {"intento": 1})]
+    cola.confirmar(["a"])
+    assert cola.reclamar(ahora=ahora + 3600) == []
+    assert cola.programar([("a", ahora - 1, {})]) == 0
+    assert cola.estadisticas() == {"programados": 0, "vencidos": 0}
@@ -0,0 +1,49 @@
+import db
+
+
+class _Cliente:
+    def __init__(self):
+        self.cerrado = False
+
+    def close(self):
+        self.cerrado = True
+
+
+def test_cerrar_conexiones_sin_clientes_no_falla():
+    db.cerrar_conexiones()
+    assert db._mongo_client is None and db._redis_client is None and db._driver is None
+
+
+def test_cerrar_conexiones_cierra_y_reinicia_los_clientes():
+    mongo, redis_ = _Cliente(), _Cliente()
+    db._mongo_client, db._redis_client = mongo, redis_
+    db.cerrar_conexiones()
+    assert mongo.cerrado and redis_.cerrado
+    assert db._mongo_client is None and db._redis_client is None
+    # La próxima llamada vuelve a crear el cliente
+    assert db.get_redis().ping()
+
+
+def test_atributos_perezosos_se_resuelven_al_usarlos():
+    assert "pacientes" not in vars(db)
+    db.pacientes.insert_one({"dni": "1"})
+    assert db.get_collection("pacientes").count_documents({"dni": "1"}) == 1
+
+
+def test_hidratar_referencias_no_expone_la_contrasena():
+    db.pacientes.insert_many([
+        {"dni": "m1", "nombre": "Doc", "rol": "medico", "password": b"hash"},
+        {"dni": "p1", "nombre": "Pac", "rol": "paciente", "password": b"hash"},
+    ])
+    turnos = [{"dni": "p1", "medico_dni": "m1"}, {"dni": "p1", "medico_dni": "inexistente"}]
+    db.hidratar_referencias(turnos, "medico_dni", "medico")
+    assert turnos[0]["medico"] == {"dni": "m1", "nombre": "Doc", "rol": "medico"}
+    assert turnos[1]["medico"] is None
+
+
+def test_hidratar_referencias_por_otra_clave_sin_coleccion():
+    db.pacientes.insert_one({"dni": "m1", "mail": "doc@x", "nombre": "Doc", "password": b"hash"})
+    documentos = [{"contacto": "doc@x"}]
+    db.hidratar_referencias(documentos, "contacto", "usuario", clave="mail")
+    assert documentos[0]["usuario"]["nombre"] == "Doc"
+    assert "password" not in documentos[0]["usuario"]
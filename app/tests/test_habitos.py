@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import analitica_habitos
+import db
+import seguimiento_habitos
+
+
+def _cargar(dni, dias):
+    hoy = datetime(2030, 3, 31)
+    # 4 horas de sueño los 10 días más viejos, 8 horas los últimos 10
+    db.habitos.insert_many([
+        seguimiento_habitos._armar_registro(dni, hoy - timedelta(days=d), f"{4 if d >= 10 else 8} horas",
+                                            "Variada", "", estres=2)
+        for d in range(dias)
+    ])
+    return hoy
+
+
+def test_resumen_de_consultar_habitos_usa_el_rango_pedido(capsys):
+    hoy = _cargar("1", 20)
+    desde, hasta = (hoy - timedelta(days=19)).strftime("%Y-%m-%d"), (hoy - timedelta(days=10)).strftime("%Y-%m-%d")
+    registros = seguimiento_habitos.consultar_habitos("1", desde, hasta)
+    assert len(registros) == 10
+    salida = capsys.readouterr().out
+    assert "Promedio de sueño: 4.0 horas" in salida
+
+
+def test_resumen_de_consultar_habitos_es_de_los_ultimos_7(capsys):
+    hoy = _cargar("1", 20)
+    registros = seguimiento_habitos.consultar_habitos("1", (hoy - timedelta(days=19)).strftime("%Y-%m-%d"))
+    assert len(registros) == 20
+    salida = capsys.readouterr().out
+    # Los 20 listados promedian 6 horas; los últimos 7, 8
+    assert "Análisis de la última semana" in salida
+    assert "Promedio de sueño: 8.0 horas" in salida
+
+
+def test_resumen_ultimos_sin_rango_toma_los_mas_nuevos():
+    _cargar("1", 20)
+    assert analitica_habitos.resumen_ultimos("1", 7)["sueno"] == 8.0
+
+
+def test_registrar_habito_devuelve_el_id_aunque_fallen_los_resumenes(monkeypatch, caplog):
+    db.pacientes.insert_one({"dni": "1", "nombre": "Ana", "rol": "paciente", "mail": "a@x"})
+
+    def falla(registros):
+        raise RuntimeError("sin conexión")
+
+    monkeypatch.setattr(analitica_habitos, "actualizar_resumenes", falla)
+    _id = seguimiento_habitos.registrar_habito("1", "7 horas", "Variada", "")
+    assert _id is not None
+    assert db.habitos.count_documents({"dni": "1"}) == 1
+    assert "No se actualizaron los resúmenes" in caplog.text
+
+
+def test_registrar_lote_informa_resultados_aunque_fallen_los_resumenes(monkeypatch, caplog):
+    db.pacientes.insert_one({"dni": "1", "nombre": "Ana", "rol": "paciente", "mail": "a@x"})
+    alertas = []
+
+    def falla(registros):
+        raise RuntimeError("sin conexión")
+
+    monkeypatch.setattr(analitica_habitos, "actualizar_resumenes", falla)
+    monkeypatch.setattr(seguimiento_habitos, "_alertar_sintomas", lambda p, s: alertas.append(s))
+    resultado = seguimiento_habitos.registrar_habitos_lote([
+        {"dni": "1", "fecha": datetime.now(), "sueno": "7 horas", "alimentacion": "Variada",
+         "sintomas": "fiebre"},
+        {"dni": "2", "fecha": datetime.now(), "sueno": "7 horas", "alimentacion": "Variada", "sintomas": ""},
+    ])
+    assert [r["estado"] for r in resultado["resultados"]] == ["insertado", "paciente_inexistente"]
+    assert resultado["insertados"] == 1 and alertas == ["fiebre"]
+    assert "No se actualizaron los resúmenes" in caplog.text
+
+
+
+def test_reconstruir_resumen_reemplaza_sin_vaciar_antes(monkeypatch):
+    _cargar("1", 20)
+    viejo = datetime(2020, 1, 6)
+    db.get_collection("habitos_resumen").insert_one({"dni": "1", "periodo": "semana", "inicio": viejo,
+                                                     "registros": 3})
+    analitica_habitos.reconstruir_resumen("1")
+    semanas = analitica_habitos.leer_resumen("1", "semana")
+    assert viejo not in [s["inicio"] for s in semanas]
+    assert sum(s["registros"] for s in semanas) == 20
+
+    # Si el $merge falla, los resúmenes que había siguen ahí
+    def falla(*args, **kwargs):
+        raise RuntimeError("merge")
+    monkeypatch.setattr(db.habitos, "aggregate", falla)
+    with pytest.raises(RuntimeError):
+        analitica_habitos.reconstruir_resumen("1")
+    assert sum(s["registros"] for s in analitica_habitos.leer_resumen("1", "semana")) == 20
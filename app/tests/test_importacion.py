@@ -0,0 +1,46 @@
+import json
+
+import importacion
+from importacion import leer_registros
+
+
+def test_lineas_jsonl_invalidas_se_informan_por_fila(tmp_path):
+    ruta = tmp_path / "usuarios.jsonl"
+    ruta.write_text('{"dni": "1"}\n{"dni": \n\n[1, 2]\n{"dni": "2"}\n', encoding="utf-8")
+    registros = list(leer_registros(str(ruta)))
+    assert [linea for linea, _ in registros] == [1, 2, 4, 5]
+    assert registros[0][1] == {"dni": "1"} and registros[3][1] == {"dni": "2"}
+    assert registros[1][1].startswith("JSON inválido")
+    assert registros[2][1] == "Se esperaba un objeto JSON"
+
+
+def test_importar_sigue_despues_de_una_linea_invalida(tmp_path, monkeypatch):
+    monkeypatch.setattr(importacion.db, "hash_password", str.encode)
+    ruta = tmp_path / "usuarios.jsonl"
+    usuario = ('{"nombre": "Ana", "apellido": "P", "dni": "%s", "fechaNacimiento": "1990-01-01", '
+               '"mail": "a@b.c", "password": "12345678", "telefono": "1", "rol": "paciente", "sexo": "F"}')
+    ruta.write_text("\n".join([usuario % "1", "{roto", usuario % "2"]) + "\n", encoding="utf-8")
+    resultado = importacion.importar(str(ruta), procesos=1)
+    assert resultado["insertados"] == 2
+    assert [(e["linea"], e["error"][:12]) for e in resultado["errores"]] == [(2, "JSON inválid")]
+
+
+def test_historia_mal_formada_es_un_error_de_la_fila(tmp_path, monkeypatch):
+    monkeypatch.setattr(importacion.db, "hash_password", str.encode)
+    ruta = tmp_path / "usuarios.jsonl"
+    base = {"nombre": "Ana", "apellido": "P", "fechaNacimiento": "1990-01-01", "mail": "a@b.c",
+            "password": "12345678", "telefono": "1", "rol": "paciente", "sexo": "F"}
+    filas = [
+        dict(base, dni="1", historiaClinica=[{"fecha": "2020-01-01", "diagnostico": "x"}]),
+        dict(base, dni="2", historiaClinica=[{"fecha": "ayer", "diagnostico": "x"}]),
+        dict(base, dni="3", historiaClinica="no es una lista"),
+        dict(base, dni="4", historiaClinica=["texto"]),
+        dict(base, dni="5", rol=" Medico "),
+    ]
+    ruta.write_text("\n".join(json.dumps(f) for f in filas) + "\n", encoding="utf-8")
+    resultado = importacion.importar(str(ruta), procesos=1)
+    assert resultado["insertados"] == 2
+    assert [e["linea"] for e in resultado["errores"]] == [2, 3, 4]
+    assert resultado["errores"][0]["error"].startswith("historiaClinica: Fecha inválida")
+    assert importacion.historia_clinica.diagnosticos("1") == ["x"]
+    assert importacion.db.find_usuario("5")["rol"] == "medico"
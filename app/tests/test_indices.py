@@ -0,0 +1,65 @@
+"""Cada forma de consulta de indices.CONSULTAS tiene que usar un índice.
+
+La prueba que vale es contra MongoDB (MONGO_URI, base `vidasana_pruebas`):
+corre siempre que haya un servidor y falla si no lo hay con
+VIDASANA_PRUEBAS_MONGO=1 (así se pide en CI). El `explain` del motor en
+memoria es una aproximación: esas corridas quedan marcadas como `humo`.
+"""
+import functools
+import os
+
+import pytest
+
+import db
+import indices
+
+BACKENDS = [pytest.param("memoria", marks=pytest.mark.humo), "servicios"]
+
+
+@functools.lru_cache(maxsize=None)
+def _mongo_disponible() -> str:
+    """Motivo por el que no se puede usar MongoDB, o "" si responde (se prueba una vez)."""
+    try:
+        from pymongo import MongoClient
+        MongoClient(db.MONGO_URI, serverSelectionTimeoutMS=1000).admin.command("ping")
+    except Exception as e:
+        return f"MongoDB no disponible en {db.MONGO_URI} ({type(e).__name__})"
+    return ""
+
+
+@pytest.fixture(params=BACKENDS)
+def con_indices(request, monkeypatch):
+    if request.param == "servicios":
+        motivo = _mongo_disponible()
+        if motivo and os.getenv("VIDASANA_PRUEBAS_MONGO") == "1":
+            pytest.fail(motivo)
+        if motivo:
+            pytest.skip(motivo)
+        monkeypatch.setattr(db, "MONGO_DB", "vidasana_pruebas")
+    db.usar_backend(request.param)
+    assert indices.asegurar_indices()
+    yield
+    if request.param == "servicios":
+        db.get_mongo_client().drop_database("vidasana_pruebas")
+    db.usar_backend("memoria")
+
+
+@pytest.mark.parametrize("nombre, filtro, orden", indices.CONSULTAS,
+                         ids=[f"{n}-{'-'.join(f)}" for n, f, _ in indices.CONSULTAS])
+def test_consulta_usa_indice(con_indices, nombre, filtro, orden):
+    etapas = indices.explicar(nombre, filtro, orden)
+    assert "COLLSCAN" not in etapas and "SORT" not in etapas, etapas
+
+
+def test_verificar_planes_detecta_una_consulta_sin_indice(con_indices, monkeypatch):
+    monkeypatch.setattr(indices, "CONSULTAS", [("turnos", {"especialidad": "Clínica"}, [])])
+    assert len(indices.verificar_planes()) == 1
+
+
+@pytest.mark.humo
+def test_asegurar_indices_borra_los_obsoletos():
+    turnos = db.get_collection("turnos")
+    turnos.create_index([("dni", 1), ("fecha", 1)])
+    assert indices.asegurar_indices()
+    nombres = {i["name"] for i in turnos.list_indexes()}
+    assert "dni_1_fecha_1" not in nombres and "dni_fecha_programado" in nombres
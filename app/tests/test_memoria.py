@@ -0,0 +1,360 @@
+"""El motor en memoria se comporta como los clientes reales en lo que usa la app.
+
+Cada prueba fija el resultado que dan MongoDB, Redis y Neo4j para los
+operadores, etapas y comandos que usan los módulos. Corre contra memoria.py;
+con VIDASANA_PRUEBAS_MONGO=1, VIDASANA_PRUEBAS_REDIS=1 o
+VIDASANA_PRUEBAS_NEO4J=1 también contra el servicio configurado (base
+`vidasana_pruebas`, Redis REDIS_DB_PRUEBAS=15 y nodos con dni `prueba-*`,
+que se borran al terminar).
+"""
+import os
+from datetime import datetime
+
+import pytest
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+import db
+
+
+def _backends(variable):
+    return ["memoria"] + (["servicios"] if os.getenv(variable) == "1" else [])
+
+
+@pytest.fixture(params=_backends("VIDASANA_PRUEBAS_MONGO"))
+def mongo(request, monkeypatch):
+    if request.param == "servicios":
+        monkeypatch.setattr(db, "MONGO_DB", "vidasana_pruebas")
+    db.usar_backend(request.param)
+    yield db.get_mongo_client()[db.MONGO_DB]
+    if request.param == "servicios":
+        db.get_mongo_client().drop_database("vidasana_pruebas")
+    db.usar_backend("memoria")
+
+
+@pytest.fixture(params=_backends("VIDASANA_PRUEBAS_REDIS"))
+def redis_(request, monkeypatch):
+    if request.param == "servicios":
+        monkeypatch.setattr(db, "REDIS_DB", int(os.getenv("REDIS_DB_PRUEBAS", 15)))
+    db.usar_backend(request.param)
+    db.get_redis().flushdb()
+    yield db.get_redis()
+    db.get_redis().flushdb()
+    db.usar_backend("memoria")
+
+
+@pytest.fixture(params=_backends("VIDASANA_PRUEBAS_NEO4J"))
+def grafo(request):
+    db.usar_backend(request.param)
+    if db.get_grafo() is None:
+        pytest.skip("Neo4j no disponible")
+    yield db.get_grafo()
+    if request.param == "servicios":
+        with db.get_driver().session() as sesion:
+            sesion.run("MATCH (u:Usuario) WHERE u.dni STARTS WITH 'prueba-' DETACH DELETE u").consume()
+    db.usar_backend("memoria")
+
+# Consultas -------------------------------------------------------------------
+
+DOCUMENTOS = [
+    {"_id": 1, "dni": "1", "n": 5, "tags": ["a", "b"], "fecha": datetime(2030, 1, 1),
+     "texto": "Dolor de Cabeza", "sub": {"x": 1}},
+    {"_id": 2, "dni": "2", "n": 10, "tags": ["c"], "fecha": "2030-01-02", "texto": "fiebre", "sub": {"x": 2}},
+    {"_id": 3, "dni": "3", "n": None, "tags": [], "texto": None},
+    {"_id": 4, "dni": "4"},
+]
+
+FILTROS = [
+    ({"n": 5}, [1]),
+    ({"n": None}, [3, 4]),
+    ({"n": {"$eq": 10}}, [2]),
+    ({"n": {"$ne": 5}}, [2, 3, 4]),
+    ({"n": {"$gt": 5}}, [2]),
+    ({"n": {"$gte": 5, "$lt": 10}}, [1]),
+    ({"n": {"$lte": 5}}, [1]),
+    ({"n": {"$in": [5, None]}}, [1, 3, 4]),
+    ({"n": {"$nin": [5]}}, [2, 3, 4]),
+    ({"n": {"$exists": True}}, [1, 2, 3]),
+    ({"n": {"$exists": False}}, [4]),
+    ({"tags": "a"}, [1]),
+    ({"tags": {"$in": ["b", "c"]}}, [1, 2]),
+    ({"tags": {"$size": 0}}, [3]),
+    ({"tags": {"$elemMatch": {"$eq": "c"}}}, [2]),
+    ({"texto": {"$regex": "^dolor", "$options": "i"}}, [1]),
+    ({"texto": {"$not": {"$regex": "fiebre"}}}, [1, 3, 4]),
+    ({"fecha": {"$type": "string"}}, [2]),
+    ({"fecha": {"$type": "date"}}, [1]),
+    ({"fecha": {"$gte": datetime(2030, 1, 1)}}, [1]),
+    ({"sub.x": 2}, [2]),
+    ({"$or": [{"dni": "1"}, {"n": 10}]}, [1, 2]),
+    ({"$and": [{"n": {"$gt": 1}}, {"n": {"$lt": 8}}]}, [1]),
+    ({"$nor": [{"dni": "1"}, {"dni": "2"}]}, [3, 4]),
+    ({"$expr": {"$gt": ["$n", 6]}}, [2]),
+]
+
+
+@pytest.mark.parametrize("filtro, esperados", FILTROS, ids=[str(f) for f, _ in FILTROS])
+def test_filtros(mongo, filtro, esperados):
+    mongo.docs.insert_many([dict(d) for d in DOCUMENTOS])
+    assert sorted(d["_id"] for d in mongo.docs.find(filtro)) == esperados
+
+
+def test_proyeccion_orden_salto_y_limite(mongo):
+    mongo.docs.insert_many([dict(d) for d in DOCUMENTOS])
+    encontrados = list(mongo.docs.find({}, {"_id": 0, "dni": 1, "sub.x": 1}, sort=[("dni", -1)], skip=1, limit=2))
+    assert encontrados == [{"dni": "3"}, {"dni": "2", "sub": {"x": 2}}]
+    # null y faltante ordenan antes que los números
+    assert [d["_id"] for d in mongo.docs.find({}, sort=[("n", 1), ("_id", 1)])] == [3, 4, 1, 2]
+    assert mongo.docs.count_documents({"n": {"$gte": 5}}) == 2
+
+# Updates ---------------------------------------------------------------------
+
+def test_operadores_de_update(mongo):
+    mongo.docs.insert_one({"_id": 1, "borrar": 1, "lo": 5, "hi": 1, "s": ["x"], "l": [0]})
+    resultado = mongo.docs.update_one({"_id": 1}, {
+        "$set": {"a.b": 1}, "$inc": {"c": 2}, "$min": {"lo": 3}, "$max": {"hi": 3},
+        "$push": {"l": {"$each": [1, 2]}}, "$addToSet": {"s": "x"}, "$unset": {"borrar": ""},
+    })
+    assert (resultado.matched_count, resultado.modified_count) == (1, 1)
+    mongo.docs.update_one({"_id": 1}, {"$pull": {"l": 1}})
+    assert mongo.docs.find_one({"_id": 1}) == {"_id": 1, "lo": 3, "hi": 3, "s": ["x"], "l": [0, 2],
+                                               "a": {"b": 1}, "c": 2}
+    assert mongo.docs.update_one({"_id": 1}, {"$set": {"c": 2}}).modified_count == 0
+
+
+def test_push_con_slice_y_ne_sobre_arreglos(mongo):
+    mongo.docs.insert_one({"_id": 1, "l": [0, 1]})
+    mongo.docs.update_one({"_id": 1, "l": {"$ne": 2}}, {"$push": {"l": {"$each": [2, 3], "$slice": -3}}})
+    assert mongo.docs.find_one({"_id": 1})["l"] == [1, 2, 3]
+    assert mongo.docs.update_one({"_id": 1, "l": {"$ne": 2}}, {"$push": {"l": 4}}).matched_count == 0
+
+
+def test_upsert_copia_las_igualdades_del_filtro(mongo):
+    filtro = {"dni": "9", "periodo": "semana", "n": {"$gt": 0}}
+    resultado = mongo.docs.update_one(filtro, {"$inc": {"r": 1}, "$setOnInsert": {"nuevo": True}}, upsert=True)
+    assert resultado.matched_count == 0 and resultado.upserted_id is not None
+    mongo.docs.update_one({"dni": "9"}, {"$setOnInsert": {"nuevo": False}, "$inc": {"r": 1}}, upsert=True)
+    assert mongo.docs.find_one({}, {"_id": 0}) == {"dni": "9", "periodo": "semana", "r": 2, "nuevo": True}
+
+
+def test_indices_unicos_y_parciales(mongo):
+    mongo.docs.create_index([("dni", 1), ("fecha", 1)], unique=True,
+                            partialFilterExpression={"estado": "programado"})
+    mongo.docs.insert_one({"dni": "1", "fecha": 1, "estado": "programado"})
+    mongo.docs.insert_one({"dni": "1", "fecha": 1, "estado": "cancelado"})
+    with pytest.raises(DuplicateKeyError):
+        mongo.docs.insert_one({"dni": "1", "fecha": 1, "estado": "programado"})
+    with pytest.raises(DuplicateKeyError):
+        mongo.docs.update_one({"estado": "cancelado"}, {"$set": {"estado": "programado"}})
+    assert mongo.docs.update_one({"estado": "cancelado"}, {"$set": {"fecha": 2}}).modified_count == 1
+    assert any(i.get("unique") for i in mongo.docs.list_indexes())
+
+
+def test_bulk_write_desordenado_informa_cada_error(mongo):
+    mongo.docs.create_index([("dni", 1)], unique=True)
+    mongo.docs.insert_one({"dni": "1", "n": 0})
+    with pytest.raises(BulkWriteError) as error:
+        mongo.docs.bulk_write([
+            InsertOne({"dni": "1"}),
+            InsertOne({"dni": "2"}),
+            UpdateOne({"dni": "1"}, {"$inc": {"n": 1}}),
+            UpdateOne({"dni": "3"}, {"$set": {"n": 3}}, upsert=True),
+        ], ordered=False)
+    detalles = error.value.details
+    assert [(e["index"], e["code"]) for e in detalles["writeErrors"]] == [(0, 11000)]
+    assert (detalles["nInserted"], detalles["nModified"]) == (1, 1)
+    assert sorted(d["dni"] for d in mongo.docs.find()) == ["1", "2", "3"]
+
+
+def test_insert_many_desordenado_sigue_despues_de_un_duplicado(mongo):
+    mongo.docs.create_index([("dni", 1)], unique=True)
+    with pytest.raises(BulkWriteError) as error:
+        mongo.docs.insert_many([{"dni": "1"}, {"dni": "1"}, {"dni": "2"}], ordered=False)
+    assert error.value.details["nInserted"] == 2
+    assert [e["index"] for e in error.value.details["writeErrors"]] == [1]
+
+# Agregaciones ----------------------------------------------------------------
+
+HABITOS = [
+    {"dni": "1", "fecha": datetime(2030, 1, 6), "sueno": "8 horas", "estres": 4, "ejercicio": "Correr"},
+    {"dni": "1", "fecha": datetime(2030, 1, 7), "sueno": "6 horas", "estres": 6, "ejercicio": "No realizado"},
+    {"dni": "1", "fecha": datetime(2030, 1, 8), "sueno": "mucho", "estres": 8, "ejercicio": ""},
+    {"dni": "2", "fecha": datetime(2030, 1, 8), "sueno_horas": 7.0, "sueno": "7", "estres": 2},
+]
+
+
+def test_group_con_acumuladores_y_expresiones(mongo):
+    mongo.habitos.insert_many([dict(h) for h in HABITOS])
+    horas = {"$ifNull": ["$sueno_horas", {"$convert": {
+        "input": {"$arrayElemAt": [{"$split": ["$sueno", " "]}, 0]},
+        "to": "double", "onError": None, "onNull": None}}]}
+    resultado = list(mongo.habitos.aggregate([
+        {"$match": {"dni": {"$in": ["1", "2"]}}},
+        {"$sort": {"fecha": 1}},
+        {"$group": {
+            "_id": "$dni",
+            "registros": {"$sum": 1},
+            "sueno": {"$avg": horas},
+            "estres_min": {"$min": "$estres"},
+            "estres_max": {"$max": "$estres"},
+            "primero": {"$first": "$estres"},
+            "ultimo": {"$last": "$estres"},
+            "estres": {"$push": "$estres"},
+            "ejercicios": {"$sum": {"$cond": [{"$in": ["$ejercicio", ["", "No realizado", None]]}, 0, 1]}},
+        }},
+        {"$sort": {"_id": 1}},
+    ]))
+    assert resultado == [
+        {"_id": "1", "registros": 3, "sueno": 7.0, "estres_min": 4, "estres_max": 8, "primero": 4,
+         "ultimo": 8, "estres": [4, 6, 8], "ejercicios": 1},
+        {"_id": "2", "registros": 1, "sueno": 7.0, "estres_min": 2, "estres_max": 2, "primero": 2,
+         "ultimo": 2, "estres": [2], "ejercicios": 0},
+    ]
+
+
+def test_date_trunc_semana_desde_el_lunes(mongo):
+    mongo.habitos.insert_many([dict(h) for h in HABITOS])
+    resultado = list(mongo.habitos.aggregate([
+        {"$match": {"dni": "1"}},
+        {"$group": {"_id": {"$dateTrunc": {"date": "$fecha", "unit": "week", "startOfWeek": "monday"}},
+                    "n": {"$sum": 1}}},
+        {"$sort": {"_id": 1}},
+    ]))
+    # El 6/1/2030 es domingo
+    assert resultado == [{"_id": datetime(2029, 12, 31), "n": 1}, {"_id": datetime(2030, 1, 7), "n": 2}]
+
+
+def test_set_window_fields_media_movil_y_shift(mongo):
+    mongo.serie.insert_many([{"i": i, "v": v} for i, v in enumerate([2, 4, 6, 8])])
+    resultado = list(mongo.serie.aggregate([
+        {"$setWindowFields": {"sortBy": {"i": 1}, "output": {
+            "movil": {"$avg": "$v", "window": {"documents": [-1, 0]}},
+            "anterior": {"$shift": {"output": "$v", "by": -1}},
+        }}},
+        {"$project": {"_id": 0, "v": 1, "movil": 1, "variacion": {"$subtract": ["$v", "$anterior"]}}},
+    ]))
+    assert resultado == [{"v": 2, "movil": 2.0, "variacion": None}, {"v": 4, "movil": 3.0, "variacion": 2},
+                         {"v": 6, "movil": 5.0, "variacion": 2}, {"v": 8, "movil": 7.0, "variacion": 2}]
+
+
+def test_etapas_de_forma(mongo):
+    mongo.docs.insert_many([dict(d) for d in DOCUMENTOS])
+    resultado = list(mongo.docs.aggregate([
+        {"$match": {"tags": {"$exists": True}}},
+        {"$unwind": "$tags"},
+        {"$addFields": {"etiqueta": {"$concat": [{"$toLower": "$tags"}, "-", {"$toString": "$_id"}]}}},
+        {"$set": {"doble": {"$multiply": ["$_id", 2]}}},
+        {"$project": {"_id": 0, "etiqueta": 1, "doble": 1, "mitad": {"$divide": ["$doble", 4]}}},
+        {"$sort": {"etiqueta": -1}},
+        {"$skip": 1},
+        {"$limit": 2},
+    ]))
+    assert resultado == [{"etiqueta": "b-1", "doble": 2, "mitad": 0.5}, {"etiqueta": "a-1", "doble": 2, "mitad": 0.5}]
+    assert list(mongo.docs.aggregate([{"$match": {"n": {"$gt": 0}}}, {"$count": "total"}])) == [{"total": 2}]
+    assert list(mongo.docs.aggregate([
+        {"$match": {"_id": 1}},
+        {"$project": {"_id": 0, "tiene": {"$regexMatch": {"input": "$texto", "regex": "cabeza", "options": "i"}},
+                      "tags": {"$size": "$tags"}, "entero": {"$toInt": "$n"},
+                      "literal": {"$literal": "$n"}, "suma": {"$add": ["$n", 1]}}},
+    ])) == [{"tiene": True, "tags": 2, "entero": 5, "literal": "$n", "suma": 6}]
+
+
+def test_percentil_aproximado(mongo):
+    mongo.serie.insert_many([{"v": v} for v in [3, 1, 2]])
+    resultado = next(mongo.serie.aggregate([
+        {"$group": {"_id": None, "p": {"$percentile": {"input": "$v", "p": [0.5], "method": "approximate"}}}},
+    ]))
+    assert resultado["p"] == [2]
+
+
+def test_merge_reemplaza_o_inserta_por_clave(mongo):
+    mongo.resumen.create_index([("dni", 1), ("periodo", 1)], unique=True)
+    mongo.resumen.insert_one({"dni": "1", "periodo": "semana", "n": 99, "viejo": True})
+    mongo.habitos.insert_many([dict(h) for h in HABITOS])
+    mongo.habitos.aggregate([
+        {"$group": {"_id": "$dni", "n": {"$sum": 1}}},
+        {"$project": {"_id": 0, "dni": "$_id", "periodo": {"$literal": "semana"}, "n": 1}},
+        {"$merge": {"into": "resumen", "on": ["dni", "periodo"], "whenMatched": "replace",
+                    "whenNotMatched": "insert"}},
+    ])
+    assert sorted((d["dni"], d["n"], "viejo" in d) for d in mongo.resumen.find()) == [
+        ("1", 3, False), ("2", 1, False)]
+
+# Redis -----------------------------------------------------------------------
+
+def test_strings_con_ttl(redis_):
+    assert redis_.set("a", "1", ex=100, nx=True)
+    assert redis_.set("a", "2", ex=100, nx=True) is None
+    assert redis_.get("a") == b"1"
+    assert 0 < redis_.ttl("a") <= 100
+    assert redis_.ttl("falta") == -2
+    redis_.set("sin_ttl", "x")
+    assert redis_.ttl("sin_ttl") == -1
+    assert redis_.setex("b", 100, "v")
+    assert redis_.mget(["a", "b", "falta"]) == [b"1", b"v", None]
+    assert redis_.incr("c") == 1 and redis_.incr("c") == 2
+    assert redis_.exists("a", "b", "falta") == 2
+    assert redis_.delete("a", "falta") == 1
+    assert redis_.expire("b", 50) and 0 < redis_.ttl("b") <= 50
+
+
+def test_hashes(redis_):
+    assert redis_.hset("h", "a", "1") == 1
+    assert redis_.hset("h", "a", "2") == 0
+    assert redis_.hsetnx("h", "a", "3") == 0 and redis_.hsetnx("h", "b", "3") == 1
+    assert redis_.hget("h", "a") == b"2"
+    assert redis_.hmget("h", ["a", "b", "c"]) == [b"2", b"3", None]
+    assert redis_.hdel("h", "a", "c") == 1
+
+
+def test_sorted_sets(redis_):
+    assert redis_.zadd("z", {"a": 3, "b": 1, "c": 2}) == 3
+    assert redis_.zadd("z", {"a": 10}, nx=True) == 0 and redis_.zscore("z", "a") == 3.0
+    assert redis_.zadd("z", {"a": 4, "d": 0}, xx=True) == 0
+    assert redis_.zscore("z", "a") == 4.0 and redis_.zscore("z", "d") is None
+    assert redis_.zrangebyscore("z", "-inf", 3) == [b"b", b"c"]
+    assert redis_.zrangebyscore("z", "-inf", "+inf", 1, 1) == [b"c"]
+    assert redis_.zcount("z", "-inf", 2) == 2 and redis_.zcard("z") == 3
+    assert redis_.zrem("z", "a", "falta") == 1
+
+
+def test_pipeline_transaccional_devuelve_cada_resultado(redis_):
+    pipe = redis_.pipeline(transaction=True)
+    pipe.set("r", "x", ex=10, nx=True)
+    pipe.set("r", "y", ex=10, nx=True)
+    pipe.zadd("z", {"a": 1})
+    pipe.zscore("z", "a")
+    pipe.hmget("h", ["a"])
+    assert pipe.execute() == [True, None, 1, 1.0, [None]]
+
+# Red ---------------------------------------------------------------------------
+
+def test_red(grafo):
+    grafo.asegurar_restricciones()
+    assert grafo.seguir("prueba-m", "prueba-p1", "Mara", "Paz", "Ana", "Lopez")
+    assert not grafo.seguir("prueba-m", "prueba-p1")
+    usuarios = [{"dni": "prueba-p2", "nombre": "Beto", "apellido": "Luna"},
+                {"dni": "prueba-m", "nombre": None, "apellido": None}]
+    relaciones = [{"medico": "prueba-m", "paciente": "prueba-p2", "turnos": 2,
+                   "ultimo_turno": datetime(2030, 1, 2)},
+                  {"medico": "prueba-m", "paciente": "prueba-p1", "turnos": 1,
+                   "ultimo_turno": datetime(2030, 1, 1)}]
+    creadas, propiedades = grafo.escribir_lote(usuarios, relaciones)
+    assert creadas == 1 and propiedades > 0
+    assert [u["dni"] for u in grafo.pagina("prueba-m")] == ["prueba-p1", "prueba-p2"]
+    assert [u["dni"] for u in grafo.pagina("prueba-m", despues_de="prueba-p1")] == ["prueba-p2"]
+    assert grafo.contar("prueba-m") == 2
+    assert grafo.contar("prueba-m", prefijo="lu") == 1
+    assert grafo.contar("prueba-m", visto_desde=datetime(2030, 1, 2)) == 1
+
+
+def test_vecindario_por_saltos_y_con_limite(grafo):
+    for medico, paciente in [("prueba-m1", "prueba-p1"), ("prueba-m1", "prueba-p2"),
+                             ("prueba-m2", "prueba-p2"), ("prueba-m2", "prueba-p3")]:
+        grafo.seguir(medico, paciente)
+    # Primero los más cercanos, sin repetir y sin el propio usuario
+    assert grafo.vecindario("prueba-p1", 1, 10) == ["prueba-m1"]
+    assert grafo.vecindario("prueba-p1", 3, 10) == ["prueba-m1", "prueba-p2", "prueba-m2"]
+    assert grafo.vecindario("prueba-p1", 3, 2) == ["prueba-m1", "prueba-p2"]
+    assert grafo.vecindario("prueba-p3", 2, 10) == ["prueba-m2", "prueba-p2"]
+    assert grafo.vecindario("prueba-nadie", 2, 10) == []
@@ -0,0 +1,68 @@
+from datetime import datetime
+
+import db
+import indices
+import migraciones
+
+
+def _habitos_legado():
+    db.habitos.insert_many([
+        # Registro viejo con la fecha como texto y uno nuevo del mismo día
+        {"dni": "1", "fecha": "2030-01-01", "timestamp": "2030-01-01 08:00:00", "sueno": "7 horas"},
+        {"dni": "1", "fecha": datetime(2030, 1, 1), "timestamp": datetime(2030, 1, 1, 9), "sueno": "8 horas"},
+        {"dni": "1", "fecha": "2030-01-02", "timestamp": "2030-01-02 08:00:00", "sueno": "6 horas"},
+    ])
+
+
+def test_migrar_convierte_fechas_antes_de_crear_el_indice_unico():
+    _habitos_legado()
+    assert migraciones.migrar()
+    fechas = sorted(h["fecha"] for h in db.habitos.find({"dni": "1"}))
+    assert fechas == [datetime(2030, 1, 1), datetime(2030, 1, 2)]
+    assert any(i.get("unique") and i["name"] == "dni_1_fecha_-1" for i in db.habitos.list_indexes())
+
+
+def test_migrar_fechas_con_el_indice_unico_ya_creado():
+    indices.asegurar_indices()
+    _habitos_legado()
+    migraciones.migrar_fechas()
+    assert db.habitos.count_documents({"fecha": {"$type": "string"}}) == 0
+    assert db.habitos.count_documents({"dni": "1"}) == 2
+
+
+def test_turno_repetido_al_convertir_queda_superpuesto():
+    indices.asegurar_indices()
+    db.turnos.insert_many([
+        {"dni": "1", "medico_dni": "2", "fecha": datetime(2030, 1, 1, 10), "estado": "programado"},
+        {"dni": "1", "medico_dni": "2", "fecha": "2030-01-01 10:00", "estado": "programado"},
+    ])
+    migraciones.migrar_fechas()
+    assert sorted(t["estado"] for t in db.turnos.find({})) == ["programado", "superpuesto"]
+
+
+def test_migrar_historias_solo_quita_el_arreglo_si_se_escribieron_los_buckets(monkeypatch):
+    import historia_clinica
+    entrada = {"fecha": "2020-01-01", "diagnostico": "x", "tratamiento": ""}
+    db.pacientes.insert_many([
+        {"dni": "1", "historiaClinica": [entrada]},
+        {"dni": "2", "historiaClinica": [dict(entrada, fecha="ayer")]},
+        {"dni": "3", "historiaClinica": [entrada]},
+        {"dni": "4", "historiaClinica": [entrada]},
+    ])
+    # El bucket del 4 ya se había escrito en una corrida interrumpida
+    db.insert_many(historia_clinica._coleccion(), historia_clinica._buckets(
+        "4", [dict(entrada, fecha=datetime(2020, 1, 1))], "migrado:4"))
+    insertar = db.insert_many
+
+    def insert_many(coleccion, documentos):
+        if documentos and documentos[0]["dni"] == "3":
+            return 0, [{"index": 0, "code": 121, "errmsg": "Document failed validation"}]
+        return insertar(coleccion, documentos)
+
+    monkeypatch.setattr(db, "insert_many", insert_many)
+    resultado = historia_clinica.migrar_historias(lote=2)
+    assert resultado["migrados"] == 2
+    assert [(f["dni"], f["error"][:15]) for f in resultado["fallidos"]] == [
+        ("2", "Fecha inválida:"), ("3", "Document failed")]
+    assert sorted(p["dni"] for p in db.pacientes.find({"historiaClinica": {"$exists": True}})) == ["2", "3"]
+    assert historia_clinica.diagnosticos("1") == ["x"] and historia_clinica.diagnosticos("4") == ["x"]
@@ -0,0 +1,92 @@
+import logging
+import threading
+import time
+from collections import Counter
+
+import colas
+import notificaciones
+import vidasana_app
+
+
+class _Detener(threading.Event):
+    """Registra las esperas sin dormir; se activa después de `vueltas` esperas."""
+
+    def __init__(self, vueltas):
+        super().__init__()
+        self.vueltas = vueltas
+        self.esperas = []
+
+    def wait(self, timeout=None):
+        self.esperas.append(timeout)
+        if len(self.esperas) >= self.vueltas:
+            self.set()
+        return self.is_set()
+
+
+def test_sin_redis_el_trabajador_espera_cada_vez_mas_y_no_imprime(capsys, caplog):
+    def despachar():
+        raise ConnectionError("Redis caído")
+
+    detener = _Detener(8)
+    log = logging.getLogger("prueba")
+    colas.bucle_trabajador(despachar, 10, 1.0, detener, log)
+    assert detener.esperas == [2, 4, 8, 16, 32, 60, 60, 60]
+    assert capsys.readouterr().out == ""
+    assert "Redis caído" in caplog.text
+
+
+def test_al_recuperarse_vuelve_al_intervalo():
+    resultados = iter([ConnectionError("caído"), ConnectionError("caído"), 10, 3])
+
+    def despachar():
+        r = next(resultados)
+        if isinstance(r, Exception):
+            raise r
+        return r
+
+    detener = _Detener(3)
+    colas.bucle_trabajador(despachar, 10, 0.5, detener, logging.getLogger("prueba"))
+    # Dos fallas, un lote lleno (sin esperar) y uno parcial
+    assert detener.esperas == [1.0, 2.0, 0.5]
+
+
+def test_trabajadores_prendidos_por_defecto_y_aviso_al_apagarlos(monkeypatch, capsys):
+    llamadas = []
+    monkeypatch.delenv("VIDASANA_TRABAJADORES", raising=False)
+    monkeypatch.setattr(notificaciones, "correr", lambda **kwargs: llamadas.append(kwargs))
+    monkeypatch.setattr(vidasana_app.recordatorios, "correr", lambda: None)
+    assert vidasana_app.iniciar_trabajadores() is True
+    assert llamadas == [{"hilos": 1}]
+    monkeypatch.setenv("VIDASANA_TRABAJADORES", "0")
+    assert vidasana_app.iniciar_trabajadores() is False
+    assert llamadas == [{"hilos": 1}]
+    salida = capsys.readouterr().out
+    assert "quedan en la cola" in salida and "no se van a enviar" in salida
+
+
+def test_varios_trabajadores_entregan_cada_notificacion_una_vez(monkeypatch):
+    entregadas = Counter()
+    lock = threading.Lock()
+
+    class Transporte:
+        def enviar(self, n):
+            with lock:
+                entregadas[n["cuerpo"]] += 1
+
+    monkeypatch.setattr(notificaciones, "transporte", Transporte())
+    monkeypatch.setattr(notificaciones, "NOTIFICACIONES_POR_SEGUNDO", 0)
+    monkeypatch.setattr(notificaciones, "LOTE", 7)
+    assert notificaciones.encolar_muchos([("a@x", "Asunto", str(i)) for i in range(300)]) == 300
+
+    detener = threading.Event()
+    trabajadores = notificaciones.correr(hilos=6, intervalo=0.01, detener=detener)
+    limite = time.monotonic() + 10
+    while sum(entregadas.values()) < 300 and time.monotonic() < limite:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    detener.set()
+    for t in trabajadores:
+        t.join()
+    assert set(entregadas) == {str(i) for i in range(300)}
+    assert max(entregadas.values()) == 1
+    assert notificaciones.cola.estadisticas()["programados"] == 0
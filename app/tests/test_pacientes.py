@@ -0,0 +1,106 @@
+import pytest
+
+import db
+import gestion_pacientes
+import gestion_turnos
+import historia_clinica
+import riesgo_lote
+
+
+@pytest.fixture
+def puntos(monkeypatch):
+    monkeypatch.setattr(gestion_turnos.coincidencias, "puntos_diagnostico",
+                        lambda diag: {"ca. de mama": 3, "$riesgo": 2} if diag else {})
+
+
+def _paciente(dni="1", **campos):
+    db.pacientes.insert_one(dict({"dni": dni, "nombre": "Ana", "mail": "ana@x", "rol": "paciente"}, **campos))
+
+
+def _datos(**campos):
+    return dict({"nombre": "Ana", "apellido": "Paz", "dni": "2", "fechaNacimiento": "1990-01-01",
+                 "mail": "ana@x", "telefono": "1", "rol": "paciente", "sexo": "F",
+                 "password": "secreto123"}, **campos)
+
+
+def test_contribuciones_con_punto_o_pesos_en_el_termino(puntos):
+    _paciente()
+    historia_clinica.agregar_entrada("1", historia_clinica.nueva_entrada("previo", ""))
+    assert gestion_pacientes.actualizar_historia_clinica("1", "nuevo", "reposo")
+    riesgo = db.pacientes.find_one({"dni": "1"})["riesgo"]
+    assert riesgo["contribuciones"] == {"ca． de mama": 6, "＄riesgo": 4}
+    assert riesgo["total"] == 10 and riesgo["entradas"] == 2
+
+
+def test_evaluacion_en_lote_y_entrada_nueva_no_cuentan_dos_veces(puntos, monkeypatch):
+    _paciente()
+    # El lote lee la historia con la entrada ya agregada y escribe antes que
+    # actualizar_historia_clinica termine
+    agregar = historia_clinica.agregar_entrada
+
+    def agregar_y_evaluar(dni, entrada):
+        agregar(dni, entrada)
+        puntajes = riesgo_lote._puntuar_lote(list(riesgo_lote._filas_pacientes(10)))
+        db.pacientes.update_one({"dni": dni}, {"$set": {"riesgo": puntajes[0][1]}})
+
+    monkeypatch.setattr(historia_clinica, "agregar_entrada", agregar_y_evaluar)
+    assert gestion_pacientes.actualizar_historia_clinica("1", "nuevo", "reposo")
+    riesgo = db.pacientes.find_one({"dni": "1"})["riesgo"]
+    assert riesgo["total"] == 5 and riesgo["entradas"] == 1
+
+
+def _evaluar_en_lote():
+    for dni, riesgo in riesgo_lote._puntuar_lote(list(riesgo_lote._filas_pacientes(10))):
+        db.pacientes.update_one({"dni": dni, "riesgo.entradas": {"$lte": riesgo["entradas"]}},
+                                {"$set": {"riesgo": riesgo}})
+
+
+def test_si_falla_el_riesgo_la_entrada_queda_y_la_cuenta_el_lote(puntos, monkeypatch, caplog):
+    _paciente()
+
+    def falla(dni, entrada):
+        raise RuntimeError("sin conexión")
+
+    monkeypatch.setattr(gestion_pacientes, "sumar_entrada_riesgo", falla)
+    assert gestion_pacientes.actualizar_historia_clinica("1", "primero", "")
+    assert "No se actualizó el riesgo de 1" in caplog.text
+    monkeypatch.undo()
+    assert db.pacientes.find_one({"dni": "1"})["riesgo"]["entradas"] == 0
+    _evaluar_en_lote()
+    assert gestion_pacientes.actualizar_historia_clinica("1", "segundo", "")
+    assert db.pacientes.find_one({"dni": "1"})["riesgo"]["entradas"] == 2
+
+
+def test_sumar_entrada_es_idempotente_y_no_lee_la_historia(puntos, monkeypatch):
+    _paciente()
+    assert gestion_pacientes.actualizar_historia_clinica("1", "primero", "")
+
+    def sin_lecturas(*args, **kwargs):
+        raise AssertionError("leyó la historia completa")
+
+    monkeypatch.setattr(historia_clinica, "diagnosticos", sin_lecturas)
+    monkeypatch.setattr(historia_clinica, "diagnosticos_por_paciente", sin_lecturas)
+    entrada = historia_clinica.nueva_entrada("segundo", "")
+    historia_clinica.agregar_entrada("1", entrada)
+    assert gestion_turnos.sumar_entrada_riesgo("1", entrada)
+    assert not gestion_turnos.sumar_entrada_riesgo("1", entrada)
+    riesgo = db.pacientes.find_one({"dni": "1"})["riesgo"]
+    assert riesgo["total"] == 10 and riesgo["entradas"] == 2
+
+
+def test_el_lote_que_leyo_la_entrada_no_cuenta_de_menos(puntos, monkeypatch):
+    # El lote lee antes de la entrada y escribe después de sumarla: no la pisa
+    _paciente()
+    assert gestion_pacientes.actualizar_historia_clinica("1", "primero", "")
+    leidas = riesgo_lote._puntuar_lote(list(riesgo_lote._filas_pacientes(10)))
+    assert gestion_pacientes.actualizar_historia_clinica("1", "segundo", "")
+    for dni, riesgo in leidas:
+        db.pacientes.update_one({"dni": dni, "riesgo.entradas": {"$lte": riesgo["entradas"]}},
+                                {"$set": {"riesgo": riesgo}})
+    assert db.pacientes.find_one({"dni": "1"})["riesgo"]["entradas"] == 2
+
+
+def test_guardar_paciente_con_fecha_de_historia_invalida_no_inserta():
+    datos = _datos(historiaClinica=[{"fecha": "ayer", "diagnostico": "x", "tratamiento": ""}])
+    assert gestion_pacientes.guardar_paciente(datos) is None
+    assert db.pacientes.count_documents({"dni": "2"}) == 0
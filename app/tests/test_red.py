@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+import db
+import interaccion_red
+
+
+def _turno(medico, paciente, creado, fecha=datetime(2030, 1, 1, 10)):
+    return {"medico_dni": medico, "dni": paciente, "fecha": fecha, "estado": "programado", "creado": creado}
+
+
+def _turnos_de(medico, paciente):
+    return db.get_grafo().siguiendo[medico][paciente]["turnos"]
+
+
+def test_sincronizacion_incremental_mantiene_el_total_de_turnos():
+    db.pacientes.insert_many([{"dni": d, "nombre": d, "apellido": d} for d in ("m", "p", "q")])
+    viejo = datetime(2029, 1, 1)
+    db.turnos.insert_many([_turno("m", "p", viejo), _turno("m", "p", viejo, datetime(2030, 1, 2))])
+    interaccion_red.sincronizar_desde_turnos()
+    assert _turnos_de("m", "p") == 2
+
+    corte = datetime.now() - timedelta(minutes=1)
+    db.turnos.insert_many([
+        _turno("m", "p", datetime.now(), datetime(2030, 1, 3)),
+        # Turno anterior a la migración de fechas: `creado` como texto
+        _turno("m", "q", "2029-06-01 10:00:00"),
+    ])
+    resultado = interaccion_red.sincronizar_desde_turnos(desde=corte)
+    assert resultado["relaciones"] == 2
+    assert _turnos_de("m", "p") == 3 and _turnos_de("m", "q") == 1
+    # Repetirla no suma nada
+    interaccion_red.sincronizar_desde_turnos(desde=corte)
+    assert _turnos_de("m", "p") == 3
+
+
+def _version():
+    return int(db.get_redis().get(interaccion_red.VERSION_RED) or 0)
+
+
+def test_cambiar_solo_propiedades_invalida_la_cache_de_la_red():
+    db.pacientes.insert_many([{"dni": d, "nombre": d, "apellido": d} for d in ("m", "p")])
+    db.turnos.insert_one(_turno("m", "p", datetime(2029, 1, 1)))
+    interaccion_red.sincronizar_desde_turnos()
+    version = _version()
+    # Otro turno del mismo par: ninguna relación nueva, cambian turnos y último turno
+    db.turnos.insert_one(_turno("m", "p", datetime(2029, 1, 2), datetime(2030, 2, 1)))
+    assert interaccion_red.sincronizar_desde_turnos()["creadas"] == 0
+    assert _version() == version + 1
+    # Sin cambios no se invalida
+    interaccion_red.sincronizar_desde_turnos()
+    assert _version() == version + 1
@@ -0,0 +1,17 @@
+import pytest
+
+import gestion_turnos
+
+
+def _turno(fecha):
+    return {"dni": "1", "fecha": fecha, "especialidad": "Clínica", "medico_dni": "2"}
+
+
+@pytest.mark.parametrize("fecha", ["2099-01-01 10:00", "2099-01-01 10:00:00"])
+def test_validar_turno_acepta_fecha_y_hora(fecha):
+    assert gestion_turnos.validar_turno(_turno(fecha))
+
+
+@pytest.mark.parametrize("fecha", ["2099-01-01", None, "", "mañana", 20990101, "2000-01-01 10:00"])
+def test_validar_turno_rechaza_sin_hora_invalida_o_pasada(fecha):
+    assert gestion_turnos.validar_turno(_turno(fecha)) is False
@@ -1,15 +1,22 @@
+import os
+import threading
 import acciones
 import db
+import notificaciones
+import recordatorios
 
 usuario_actual = None
 
 def mostrar_estado_conexiones():
     """Muestra el estado de conexión de las bases de datos."""
     print("Estado de conexiones:")
+    if db.usar_memoria():
+        print("Backend en memoria (VIDASANA_BACKEND=memoria): sin MongoDB, Redis ni Neo4j\n")
+        return
     
     # Verificar MongoDB
     try:
-        db.pacientes.find_one({})
+        db.pacientes.find_one({}, {"_id": 1})
         print("MongoDB: Conectado")
     except Exception as e:
         print(f"MongoDB: Error ({str(e)})")
@@ -135,8 +142,25 @@ def validar_sesion() -> bool:
         
     return True
 
+def iniciar_trabajadores() -> bool:
+    """Despacha notificaciones y recordatorios dentro del proceso.
+
+    Con VIDASANA_TRABAJADORES=0 quedan a cargo de procesos aparte
+    (python notificaciones.py / python recordatorios.py) y se avisa al iniciar.
+    """
+    if os.getenv("VIDASANA_TRABAJADORES", "1") == "0":
+        print("Aviso: VIDASANA_TRABAJADORES=0, las notificaciones y recordatorios quedan en la cola "
+              "hasta que corran notificaciones.py y recordatorios.py")
+        if db.usar_memoria():
+            print("Aviso: con el backend en memoria ningún otro proceso ve la cola, no se van a enviar")
+        return False
+    notificaciones.correr(hilos=1)
+    threading.Thread(target=recordatorios.correr, name="recordatorios", daemon=True).start()
+    return True
+
 if __name__ == "__main__":
     try:
+        iniciar_trabajadores()
         menu_principal()
     except KeyboardInterrupt:
         print("\n\n Programa terminado por el usuario")